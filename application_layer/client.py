@@ -14,7 +14,7 @@ class Client:
     It initializes a Peer object, stores ballot options, and runs the UI.
     """
 
-    def __init__(self, client_network_port, client_addr, server_addr, server_port):
+    def __init__(self, client_network_port, client_addr, server_addr, server_port, data_dir=None):
         """
         Initialize a new Client instance.
 
@@ -23,6 +23,7 @@ class Client:
             client_addr (str): Local IP address of this peer.
             server_addr (str): Tracker server IP address.
             server_port (int): Tracker server port.
+            data_dir (str): Optional directory where the peer keeps its chain across restarts.
         """
         self.peer_port = client_network_port
         self.peer_addr = client_addr
@@ -34,7 +35,8 @@ class Client:
             tracker_port=self.server_port,
             local_addr=client_addr,
             local_port=self.peer_port,
-            client_instance=self
+            client_instance=self,
+            data_dir=data_dir
         )
         self.ballot_options = None
         self.ui = ClientUi()
@@ -50,18 +52,19 @@ class Client:
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 5:
-        print("Usage: python client.py <client_network_port> <client_addr> <server_port> <server_addr>")
+    if len(sys.argv) not in (5, 6):
+        print("Usage: python client.py <client_network_port> <client_addr> <server_port> <server_addr> [data_dir]")
         sys.exit(1)
 
     client_network_port = int(sys.argv[1])
     client_addr = sys.argv[2]
     server_port = int(sys.argv[3])
     server_addr = sys.argv[4]
+    data_dir = sys.argv[5] if len(sys.argv) == 6 else None
 
     if 'client' not in st.session_state:
         # Initialize Client and store in Streamlit session state
-        client = Client(client_network_port, client_addr, server_addr, server_port)
+        client = Client(client_network_port, client_addr, server_addr, server_port, data_dir)
         st.session_state['client'] = client
 
         # Perform initial connection once (streamlit reruns code on UI interaction)
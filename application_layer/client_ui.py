@@ -39,7 +39,7 @@ class ClientUi:
             with col1:
                 st.markdown("""
                     Voters can submit ballots securely through a peer-to-peer (P2P) blockchain network.
-                    Each vote is recorded as a block, mined, added to the local blockchain, and broadcast
+                    Votes are batched into blocks, mined, added to the local blockchain, and broadcast
                     to all peers.
                 """)
             with col2:
@@ -163,11 +163,11 @@ class ClientUi:
         transaction_html = "<p>None</p>"
 
         if transactions != []:
-            tx_data = transactions[0]  # Only one transaction per block
-            transaction_html = f"""
+            # A block may batch several votes; list each one
+            transaction_html = "<hr style='margin: 0.5rem 0;'>".join(f"""
 <p><b>Voter ID:</b> {tx_data.get('voter_id', '')}</p>
 <p><b>Candidate ID:</b> {tx_data.get('candidate_id', '')}</p>
-<p><b>Transaction timestamp:</b> {tx_data.get('timestamp', '')}</p>"""
+<p><b>Transaction timestamp:</b> {tx_data.get('timestamp', '')}</p>""" for tx_data in transactions)
 
         return f"""
 <div style='flex: 0 0 auto; width: 250px; border: 0; padding: 1rem; border-radius: 12.5px;
@@ -176,7 +176,7 @@ class ClientUi:
     <p><b>Block timestamp:</b> {block['timestamp']}</p>
     <p><b>Nonce:</b> {block['nonce']}</p>
     <details>
-        <summary style="cursor: pointer; margin-bottom: 1rem;"><b>Transaction Details</b></summary>
+        <summary style="cursor: pointer; margin-bottom: 1rem;"><b>Transaction Details ({len(transactions)})</b></summary>
         <div style='padding-left: 10px;'>{transaction_html}</div>
     </details>
     <p><b>Prev Hash:</b> <span style='color: {prev_hash_color};'>{block['previous_hash']}</span></p>
@@ -207,6 +207,8 @@ class ClientUi:
                 elif not selected_candidate:
                     st.error("Select a candidate.")
                 else:
-                    st.toast('Ballot submitted. Initiating mining + broadcasting...', icon=":material/check:")
                     transaction = Transaction(voter_id, selected_candidate)
-                    st.session_state['client'].peer.submit_vote(transaction) 
+                    if st.session_state['client'].peer.submit_vote(transaction):
+                        st.toast('Ballot submitted. Initiating mining + broadcasting...', icon=":material/check:")
+                    else:
+                        st.error("This voter has already voted or has a pending ballot, or the peer is busy.")
@@ -1,7 +1,19 @@
 import hashlib
 import json
+import struct
 import time
 from .transaction import Transaction
+from .merkle import leaf_hash, merkle_root, merkle_proof
+
+# Block header: version, index, previous hash, Merkle root, timestamp digest | nonce.
+# Everything before the nonce is fixed per block, so proof-of-work hashes it once.
+HEADER_VERSION = 1
+_HEADER_PREFIX = struct.Struct('>BQ32s32s32s')
+_NONCE = struct.Struct('>Q')
+HEADER_SIZE = _HEADER_PREFIX.size + _NONCE.size
+
+# Fields whose change invalidates the header prefix (the nonce only invalidates the hash)
+_HEADER_FIELDS = frozenset(('index', 'timestamp', 'previous_hash'))
 
 class Block:
     """
@@ -9,7 +21,9 @@ class Block:
     Each block contains a list of Transactions objects, a timestamp, a reference to the previous block's hash,
     a nonce for mining, and the block's own hash.
 
-    The block's hash is computed using SHA-256 hashing algorithm based on its contents.
+    The block's hash is the SHA-256 of a fixed-size header (HEADER_SIZE bytes) that commits to
+    the transactions through their Merkle root, so hashing cost does not grow with the number
+    of votes in the block.
 
     Variables:
         index (int): The index of the block in the blockchain.
@@ -18,7 +32,9 @@ class Block:
         HH:MM:SS.   
         previous_hash (str): The hash of the previous block in the blockchain.
         nonce (int): A number used in the mining process to find a valid hash.
-        hash (str): The hash of the block, computed using SHA-256.
+        merkle_root (str): Hex Merkle root of the transactions (derived, read-only).
+        hash (str): The hash of the block, computed using SHA-256. Computed lazily on first
+        access unless it is assigned first (e.g. from mining or a received block).
 
     Usage:
         block = Block(index=1, transactions=[Transaction('voter1', 'A')], timestamp=time.strftime("%Y-%m-%d %H:%M:%S"), previous_hash='0')
@@ -26,31 +42,210 @@ class Block:
         print(block.nonce)  # Prints the nonce used for mining
         print(block.hash)  # Prints the mined hash with leading zeros
     """
+    __slots__ = ('index', 'transactions', 'timestamp', 'previous_hash', 'nonce',
+                 '_hash', '_transaction_dicts', '_merkle_leaves', '_merkle_root', '_header_prefix', '_computed_hash')
+
     def __init__(self, index, transactions: Transaction , timestamp, previous_hash, nonce=0):
         self.index = index
         self.transactions = transactions  # list of Transaction objects
         self.timestamp = timestamp
         self.previous_hash = previous_hash
         self.nonce = nonce
-        self.hash = self.compute_hash() # a str representing the block's hash
+        self._hash = None # a str representing the block's hash, computed on first access unless assigned
+
+    def __setattr__(self, name, value):
+        # Drop memoized encodings when a hashed field is reassigned. Mutating the
+        # transactions list in place is not detected; assign a new list instead.
+        if name == 'transactions':
+            object.__setattr__(self, '_transaction_dicts', None)
+            object.__setattr__(self, '_merkle_leaves', None)
+            object.__setattr__(self, '_merkle_root', None)
+        if name == 'transactions' or name in _HEADER_FIELDS:
+            object.__setattr__(self, '_header_prefix', None)
+        if name == 'nonce' or name == 'transactions' or name in _HEADER_FIELDS:
+            object.__setattr__(self, '_computed_hash', None)
+        object.__setattr__(self, name, value)
+
+    @property
+    def hash(self):
+        """The block's hash: the value assigned by mining or received from a peer, else compute_hash()."""
+        if self._hash is None:
+            self._hash = self.compute_hash()
+        return self._hash
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = value
 
     def compute_hash(self):
         """
-        Compute SHA-256 hash of the block contents.
+        Compute SHA-256 hash of the block header.
+        The result is memoized until one of the block's fields is reassigned.
+
+        Raises:
+            ValueError: If the index or nonce cannot be encoded in the header (e.g. a malformed received block).
+        """
+        if self._computed_hash is None:
+            try:
+                block_header = self.header_prefix() + _NONCE.pack(self.nonce)
+            except struct.error as e:
+                raise ValueError(f"block {self.index} has an invalid nonce: {e}")
+            self._computed_hash = hashlib.sha256(block_header).hexdigest() # the length of the hash str is 64 characters
+
+        return self._computed_hash
+
+    def header_prefix(self):
+        """
+        Return the header bytes that precede the nonce.
+
+        Proof-of-work hashes these once and then only feeds in the 8 nonce bytes per
+        attempt. Memoized until a field other than the nonce is reassigned.
+
+        Returns:
+            bytes: The encoded header without the nonce.
+
+        Raises:
+            ValueError: If the index cannot be encoded in the header.
         """
-        # Convert transactions to list of dicts for hashing
-        transactions_dicts = [tx.to_dict() for tx in self.transactions]
+        if self._header_prefix is None:
+            self._header_prefix = encode_header_prefix(self.index, self.previous_hash, self.timestamp,
+                                                       bytes.fromhex(self.merkle_root))
+        return self._header_prefix
 
-        block_string = json.dumps({
+    @property
+    def merkle_root(self):
+        """Hex Merkle root of the block's transactions, memoized until transactions is reassigned."""
+        if self._merkle_root is None:
+            self._merkle_root = merkle_root(self.merkle_leaves()).hex()
+        return self._merkle_root
+
+    def merkle_leaves(self):
+        """
+        Return the Merkle leaf hash of every transaction, memoized until transactions is reassigned.
+        """
+        if self._merkle_leaves is None:
+            self._merkle_leaves = [
+                leaf_hash(json.dumps(tx_dict, sort_keys=True).encode()) for tx_dict in self.transaction_dicts()
+            ]
+        return self._merkle_leaves
+
+    def merkle_proof(self, position):
+        """
+        Build a proof that the transaction at `position` is included in this block.
+        Anyone holding only the block's merkle_root can check it with merkle.verify_merkle_proof.
+
+        Args:
+            position (int): Index of the transaction in the block.
+
+        Returns:
+            list: (sibling digest, sibling_is_left) pairs.
+        """
+        return merkle_proof(self.merkle_leaves(), position)
+
+    def transaction_dicts(self):
+        """
+        Return the block's transactions as dicts, shared by hashing and serialization.
+        """
+        if self._transaction_dicts is None:
+            self._transaction_dicts = [tx.to_dict() for tx in self.transactions]
+        return self._transaction_dicts
+
+    def to_dict(self):
+        """
+        Convert the block to its dictionary representation for sending to peers.
+        The transaction dicts are the memoized ones, so treat them as read-only.
+
+        Returns:
+            dict: The block as a dictionary.
+        """
+        return {
             'index': self.index,
-            'transactions': transactions_dicts,
+            'transactions': self.transaction_dicts(),
             'timestamp': self.timestamp,
             'previous_hash': self.previous_hash,
-            'nonce': self.nonce
-        }, sort_keys=True).encode()
+            'nonce': self.nonce,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash
+        }
 
-        return hashlib.sha256(block_string).hexdigest() # the length of the hash str is 64 characters
+    def header_dict(self):
+        """
+        Return the block without its transactions: enough to check its proof-of-work
+        (see header_hash) and, later, that a transaction list belongs to it.
+
+        Returns:
+            dict: index, timestamp, previous_hash, nonce, merkle_root and hash.
+        """
+        return {
+            'index': self.index,
+            'timestamp': self.timestamp,
+            'previous_hash': self.previous_hash,
+            'nonce': self.nonce,
+            'merkle_root': self.merkle_root,
+            'hash': self.hash
+        }
 
-    
     def get_transactions(self):
         return self.transactions
+
+
+def _field_digest(value):
+    """
+    Commit a header field to 32 bytes: lower-case hex hashes are stored raw, anything
+    else is hashed. Upper-case hex is hashed too, so that "AB.." and "ab.." do not
+    encode to the same header.
+    """
+    if type(value) is str and len(value) == 64:
+        try:
+            digest = bytes.fromhex(value)
+        except ValueError:
+            digest = None
+        if digest is not None and digest.hex() == value:
+            return digest
+    return hashlib.sha256(json.dumps(value).encode()).digest()
+
+
+def encode_header_prefix(index, previous_hash, timestamp, merkle_root_bytes):
+    """
+    Encode the fixed part of a block header (everything except the nonce).
+
+    Args:
+        index (int): Block index.
+        previous_hash (str): Hash of the previous block.
+        timestamp (str): Block timestamp.
+        merkle_root_bytes (bytes): 32-byte Merkle root of the block's transactions.
+
+    Returns:
+        bytes: The header prefix.
+
+    Raises:
+        ValueError: If a field cannot be encoded (e.g. a negative or non-integer index).
+    """
+    try:
+        return _HEADER_PREFIX.pack(HEADER_VERSION, index, _field_digest(previous_hash),
+                                   merkle_root_bytes, _field_digest(timestamp))
+    except struct.error as e:
+        raise ValueError(f"invalid block header field: {e}")
+
+
+def header_hash(header):
+    """
+    Compute a block's hash from its header alone, as returned by Block.header_dict.
+
+    Args:
+        header (dict): Block header with index, previous_hash, timestamp, merkle_root and nonce.
+
+    Returns:
+        str: The hex hash, equal to compute_hash() of the full block.
+
+    Raises:
+        ValueError: If a header field is missing or cannot be encoded.
+    """
+    try:
+        merkle_root_bytes = bytes.fromhex(header['merkle_root'])
+        if len(merkle_root_bytes) != 32 or merkle_root_bytes.hex() != header['merkle_root']:
+            raise ValueError("merkle root must be 32 bytes of lower-case hex")
+        prefix = encode_header_prefix(header['index'], header['previous_hash'], header['timestamp'], merkle_root_bytes)
+        return hashlib.sha256(prefix + _NONCE.pack(header['nonce'])).hexdigest()
+    except (KeyError, TypeError, struct.error) as e:
+        raise ValueError(f"invalid block header: {e}")
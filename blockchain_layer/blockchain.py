@@ -1,8 +1,14 @@
 from hashlib import sha256
 import json
 import time
-from .block import Block
+import threading
+from .block import Block, header_hash
 from .transaction import Transaction
+from .compact_chain import CompactChain
+from .chain_store import ChainStore, StoredChain
+from .snapshot import SNAPSHOT_INTERVAL
+from .validated_cache import ValidatedBlockCache
+from .miner import search_nonce, MinerPool
 
 class Blockchain:
     """
@@ -16,18 +22,41 @@ class Blockchain:
     
     Attributes:
         difficulty (int): The difficulty level for proof-of-work algorithm
+        mining_workers (int): Number of processes used by proof-of-work (1 mines in-process)
+        miner_pool (MinerPool): The proof-of-work processes, started on the first block and
+            reused for the next ones; None when mining in-process
         unconfirmed_transactions (list): List of unconfirmed Transaction objects
-        chain (list): The blockchain (list of Block objects)
+        chain (CompactChain): The blockchain; reads like a list of Block objects and
+            assigning a list of blocks stores them compactly. With a store_path it is a
+            StoredChain kept on disk instead
+        lock (threading.RLock): Held while the chain is checked and appended to
+        validated_blocks (ValidatedBlockCache): (hash, previous_hash) pairs of chain blocks
+            already validated, so re-syncs only verify blocks we have not seen
     """
 
     #difficulty = 2  # Difficulty level for proof-of-work
 
-    def __init__(self,difficulty=4):
-        """Initialize a new blockchain with empty transaction list and chain, default difficulty set to 2."""
+    def __init__(self,difficulty=4, mining_workers=1, validated_cache_size=100000, store_path=None,
+                 snapshot_interval=SNAPSHOT_INTERVAL):
+        """
+        Initialize a new blockchain with empty transaction list and chain, default difficulty set to 2.
+        If store_path is given, the chain is kept in a ChainStore in that directory and
+        whatever chain was stored there before is picked up again; the vote tally and
+        voter index are snapshotted every snapshot_interval blocks so reopening only
+        replays the blocks after the newest snapshot.
+        """
         self.difficulty = difficulty  # Difficulty level for proof-of-work
+        self.mining_workers = mining_workers  # Processes used for proof-of-work
+        self.miner_pool = MinerPool(mining_workers) if mining_workers > 1 else None
         self.unconfirmed_transactions = []  # List of Transaction objects
-        self.chain = []  # List of Block objects
-        self.create_genesis_block()
+        self.validated_blocks = ValidatedBlockCache(validated_cache_size)  # LRU of already-verified blocks
+        self.lock = threading.RLock()  # Serializes appends from the miner and the network thread
+        if store_path is None:
+            self.chain = CompactChain()  # Column-oriented store of Block objects
+        else:
+            self._chain = StoredChain(ChainStore(store_path), snapshot_interval)  # Blocks on disk, read through mmap
+        if len(self.chain) == 0:
+            self.create_genesis_block()
 
     def create_genesis_block(self):
         """
@@ -38,6 +67,171 @@ class Blockchain:
         genesis_block = Block(0, [], timestamp="2000-01-01 00:00:00", previous_hash="0")
         genesis_block.hash = genesis_block.compute_hash()
         self.chain.append(genesis_block)
+        self.validated_blocks.add(genesis_block.hash, genesis_block.previous_hash)
+
+    @property
+    def chain(self):
+        """The chain of blocks, stored as a CompactChain (or a StoredChain on disk)"""
+        return self._chain
+
+    @chain.setter
+    def chain(self, blocks):
+        if isinstance(getattr(self, '_chain', None), StoredChain):
+            blocks = list(blocks)
+            self._chain.truncate(0)
+            self._chain.extend(blocks)
+        else:
+            self._chain = blocks if isinstance(blocks, CompactChain) else CompactChain(blocks)
+        # Assigned blocks have not been validated by us
+        self.validated_blocks.clear()
+
+    def flush(self):
+        """Make every block appended so far durable, if the chain is on disk."""
+        if isinstance(self._chain, StoredChain):
+            self._chain.store.flush()
+
+    def close_miner_pool(self):
+        """Shut down the proof-of-work processes, if any were started."""
+        if self.miner_pool is not None:
+            self.miner_pool.close()
+
+    def close(self):
+        """Shut down the miner pool, snapshot the tally, then flush and close the on-disk store, if the chain has one."""
+        self.close_miner_pool()
+        if isinstance(self._chain, StoredChain):
+            if self._chain.snapshot_interval:
+                self._chain.save_snapshot()
+            self._chain.store.close()
+
+    def replace_chain(self, new_chain):
+        """
+        Replace the chain with new_chain, keeping the blocks both chains share.
+
+        Only the blocks after the fork point are dropped and appended, so the
+        running vote tally is adjusted by the changed suffix instead of being rebuilt.
+
+        Args:
+            new_chain (list): Validated Block objects (or a CompactChain) starting at genesis.
+
+        Returns:
+            int: Number of leading blocks kept from the old chain.
+        """
+        with self.lock:
+            fork = self._common_prefix_length(new_chain)
+            self._install_suffix(fork, new_chain[fork:])
+            return fork
+
+    def _install_suffix(self, start, blocks):
+        """Drop our blocks from position start onwards and append blocks in their place."""
+        for position in range(start, len(self.chain)):
+            self.validated_blocks.discard(self.chain.hash_at(position))
+        self.chain.truncate(start)
+        for block in blocks:
+            self.chain.append(block)
+            self._remember_validated(block)
+
+    def get_locator(self):
+        """
+        Summarizes our chain for a peer that should send only what we are missing.
+        
+        Returns:
+            list: [index, hash] pairs from the tip back to genesis: the last 10 blocks,
+            then exponentially further apart, so the list grows with log(chain length)
+        """
+        with self.lock:
+            locator = []
+            position = len(self.chain) - 1
+            step = 1
+            while position > 0:
+                locator.append([position, self.chain.hash_at(position)])
+                if len(locator) >= 10:
+                    step *= 2
+                position -= step
+            locator.append([0, self.chain.hash_at(0)])
+            return locator
+
+    def find_fork_point(self, locator):
+        """
+        Finds the last block a peer shares with us from its locator.
+        
+        Args:
+            locator (list): [index, hash] pairs from the peer's get_locator()
+            
+        Returns:
+            int: Number of leading blocks the peer already has (0 if nothing matches),
+            i.e. the position from which to send it blocks
+        """
+        with self.lock:
+            for entry in locator:
+                if not isinstance(entry, (list, tuple)) or len(entry) != 2:
+                    continue
+                index, block_hash = entry
+                if isinstance(index, int) and 0 <= index < len(self.chain) and self.chain.hash_at(index) == block_hash:
+                    return index + 1
+            return 0
+
+    def splice_chain(self, start, blocks):
+        """
+        Replaces our blocks from position start onwards with blocks received from a
+        peer, if the result is longer and valid. Used with find_fork_point so that
+        only the missing suffix has to be transferred.
+        
+        Args:
+            start (int): Chain position of blocks[0]; our blocks before it are kept
+            blocks (list): Block objects from the peer
+            
+        Returns:
+            bool: True if our chain was extended or replaced, False otherwise
+        """
+        with self.lock:
+            if start == 0:
+                if len(blocks) <= len(self.chain) or not self.is_valid_chain(blocks):
+                    return False
+                self.replace_chain(blocks)
+                return True
+            if not 0 < start <= len(self.chain) or start + len(blocks) <= len(self.chain):
+                return False
+            if not self._is_valid_suffix(blocks, start, self.chain.hash_at(start - 1)):
+                return False
+            self._install_suffix(start, blocks)
+            return True
+
+    def _common_prefix_length(self, new_chain):
+        """
+        Binary search for the number of leading blocks shared with new_chain.
+        A block hash commits to the previous hash, so once two chains agree on
+        the hash at a position they agree on every block before it.
+        """
+        if isinstance(new_chain, (CompactChain, StoredChain)):
+            new_hash_at = new_chain.hash_at
+        else:
+            new_hash_at = lambda position: new_chain[position].hash
+        low, high = 0, min(len(self.chain), len(new_chain))
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.chain.hash_at(middle - 1) == new_hash_at(middle - 1):
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def _remember_validated(self, block):
+        """Cache a block just installed on the chain, if everything before it is cached too."""
+        if block.previous_hash in self.validated_blocks:
+            self.validated_blocks.add(block.hash, block.previous_hash)
+
+    def _validated_prefix_length(self, new_chain):
+        """
+        Number of leading blocks of new_chain that are identical to our chain and
+        already validated. Callers must keep our copies of these blocks (as
+        replace_chain does) since their contents are not re-checked.
+        """
+        with self.lock:
+            known = self._common_prefix_length(new_chain)
+            while known and not self.validated_blocks.contains(self.chain.hash_at(known - 1),
+                                                               self.chain.previous_hash_at(known - 1)):
+                known -= 1
+            return known
 
     @property
     def last_block(self):
@@ -55,40 +249,52 @@ class Blockchain:
         Returns:
             bool: True if block was added, False otherwise
         """
-        previous_hash = self.last_block.hash
+        with self.lock:
+            previous_hash = self.chain.hash_at(-1)
 
-        # Check if the previous_hash field of the block matches
-        # the hash of the latest block in the chain
-        if previous_hash != block.previous_hash:
-            return False
+            # Check if the previous_hash field of the block matches
+            # the hash of the latest block in the chain
+            if previous_hash != block.previous_hash:
+                return False
 
-        # Check if the proof is valid
-        if not self.is_valid_proof(block, proof):
-            return False
+            # Check if the proof is valid
+            if not self.is_valid_proof(block, proof):
+                return False
 
-        # If all checks pass, add the block to the chain
-        block.hash = proof
-        self.chain.append(block)
-        return True
+            # Each voter may only vote once across the whole chain
+            if self._has_duplicate_vote(block):
+                print(f"the block{block.index} contains a voter who has already voted")
+                return False
 
-    def proof_of_work(self, block):
+            # If all checks pass, add the block to the chain
+            block.hash = proof
+            self.chain.append(block)
+            self._remember_validated(block)
+            return True
+
+    def proof_of_work(self, block, cancel_event=None):
         """
         Function that tries different values of the nonce to get a hash
         that satisfies our difficulty criteria.
         
         Args:
             block (Block): The block for which to find a valid hash
+            cancel_event (threading.Event): Optional flag that aborts the search when set
             
         Returns:
-            str: The hash value that meets the difficulty criteria
+            str: The hash value that meets the difficulty criteria, or None if cancelled
         """
-        block.nonce = 0
+        # Encode the header once and only vary the nonce bytes per attempt
+        prefix = block.header_prefix()
+        if self.miner_pool is not None:
+            result = self.miner_pool.search(prefix, self.difficulty, cancel_event=cancel_event)
+        else:
+            result = search_nonce(prefix, self.difficulty, cancel_event=cancel_event)
 
-        computed_hash = block.compute_hash()
-        while not computed_hash.startswith('0' * self.difficulty):
-            block.nonce += 1
-            computed_hash = block.compute_hash()
+        if result is None:
+            return None
 
+        block.nonce, computed_hash = result
         return computed_hash
 
     def add_new_transaction(self, transaction):
@@ -97,8 +303,35 @@ class Blockchain:
         
         Args:
             transaction (Transaction): The transaction to add
+
+        Returns:
+            bool: True if added, False if the voter already has a vote on the chain
         """
+        if self.has_voted(transaction.voter_id):
+            return False
         self.unconfirmed_transactions.append(transaction)
+        return True
+
+    def has_voted(self, voter_id):
+        """
+        Checks in O(1) whether a voter already has a vote on the chain.
+        
+        Args:
+            voter_id (str): The voter to look up
+            
+        Returns:
+            bool: True if the voter's vote is already in a block
+        """
+        return self.chain.voter_block(voter_id) is not None
+
+    def _has_duplicate_vote(self, block):
+        """True if the block repeats a voter, either within itself or from the chain."""
+        seen = set()
+        for transaction in block.transactions:
+            if transaction.voter_id in seen or self.has_voted(transaction.voter_id):
+                return True
+            seen.add(transaction.voter_id)
+        return False
 
 
     def is_valid_proof(self, block, block_hash):
@@ -116,14 +349,20 @@ class Blockchain:
         if block.index == 0:
             return True  # Skip genesis block PoW
 
-        if (block_hash.startswith('0' * self.difficulty) and
-                block_hash == block.compute_hash()):
+        try:
+            computed_hash = block.compute_hash()
+        except ValueError as e:
+            print(f"the block{block.index} header cannot be encoded: {e}")
+            return False
+
+        if (isinstance(block_hash, str) and block_hash.startswith('0' * self.difficulty) and
+                block_hash == computed_hash):
             #print(f"the block{block.index} satisfies the difficulty criteria")
             return True
         else:
             print(f"the block{block.index} does not satisfy the difficulty criteria")
             print(f"the block{block.index} hash is {block_hash}")
-            print(f"the block{block.index} computed hash is {block.compute_hash()}")
+            print(f"the block{block.index} computed hash is {computed_hash}")
             print(f"the difficulty is {self.difficulty}")
             return False
 
@@ -134,6 +373,9 @@ class Blockchain:
         1. Each block's hash matches its computed hash (PoW validation)
         2. Each block's previous_hash field properly links to the previous block
         3. The chain starts with a valid genesis block
+        4. No voter votes twice
+        The prefix shared with our own already-validated chain is skipped, so only
+        the divergent suffix is re-hashed.
         
         Args:
             chain (list): List of Block objects
@@ -144,21 +386,42 @@ class Blockchain:
         # Start with genesis block validation
         if len(chain) == 0:
             return False
-            
-        # Check genesis block separately
-        genesis = chain[0]
-        if genesis.index != 0 or genesis.previous_hash != "0":
-            return False
-            
-        # Validate genesis block hash
-        if not self.is_valid_proof(genesis, genesis.hash):
-            return False
+
+        # Blocks shared with our chain that we already validated are not re-hashed
+        known = self._validated_prefix_length(chain)
+        if known:
+            previous_hash = chain[known - 1].hash
+        else:
+            # Check genesis block separately
+            genesis = chain[0]
+            if genesis.index != 0 or genesis.previous_hash != "0":
+                return False
+
+            # Validate genesis block hash
+            if not self.is_valid_proof(genesis, genesis.hash):
+                return False
+            previous_hash = genesis.hash
+            known = 1
             
         # Validate the rest of the chain
-        previous_hash = genesis.hash
+        return self._is_valid_suffix(chain[known:], known, previous_hash)
+
+    def _is_valid_suffix(self, blocks, start, previous_hash):
+        """
+        Validate blocks meant to sit at positions start, start + 1, ... on top of
+        our first `start` blocks, the last of which has hash previous_hash.
+        
+        Args:
+            blocks (list): Block objects following the shared prefix
+            start (int): Chain position of blocks[0]
+            previous_hash (str): Hash of the block at position start - 1
+            
+        Returns:
+            bool: True if valid, False otherwise
+        """
+        voters = set()  # Voters seen in blocks, to reject double votes in one pass
         
-        for i in range(1, len(chain)):
-            block = chain[i]
+        for i, block in enumerate(blocks, start):
             block_hash = block.hash
             
             # Check block index continuity
@@ -175,19 +438,57 @@ class Blockchain:
             if not self.is_valid_proof(block, block_hash):
                 print(f"Invalid hash/PoW at block {block.index}")
                 return False
+
+            # Check that no voter votes twice; votes in the shared prefix are in our voter index
+            for transaction in block.transactions:
+                voter_position = self.chain.voter_block(transaction.voter_id)
+                if transaction.voter_id in voters or (voter_position is not None and voter_position < start):
+                    print(f"Duplicate vote by {transaction.voter_id} at block {block.index}")
+                    return False
+                voters.add(transaction.voter_id)
                 
             previous_hash = block_hash
             
         return True
 
-    def mine_block(self):
+    def is_valid_header(self, header, position, previous_hash):
+        """
+        Checks a block header received ahead of its transactions (headers-first sync):
+        its position, its link to the previous block and its proof-of-work.
+        
+        Args:
+            header (dict): Header from Block.header_dict()
+            position (int): Chain position the header should occupy
+            previous_hash (str): Hash of the block at position - 1
+            
+        Returns:
+            bool: True if valid, False otherwise
+        """
+        if not isinstance(header, dict) or header.get('index') != position or header.get('previous_hash') != previous_hash:
+            return False
+        try:
+            computed_hash = header_hash(header)
+        except ValueError as e:
+            print(f"the header of block {position} cannot be encoded: {e}")
+            return False
+        return computed_hash == header.get('hash') and computed_hash.startswith('0' * self.difficulty)
+
+    def mine_block(self, cancel_event=None):
         """
         Interface to add pending transactions to the blockchain
         by adding them to a block and finding a valid proof of work.
         
+        Args:
+            cancel_event (threading.Event): Optional flag that aborts proof-of-work when set,
+                e.g. because a competing block moved the chain tip
+        
         Returns:
-            bool: True if mining was successful, False if no transactions to mine
+            bool: True if mining was successful, False if there were no transactions to mine,
+            mining was cancelled or the tip changed before the block could be added.
+            Pending transactions are kept in the last two cases so they can be mined again.
+            Votes from voters who already voted (on the chain or earlier in the batch) are dropped.
         """
+        self.unconfirmed_transactions = self._drop_duplicate_votes(self.unconfirmed_transactions)
         if not self.unconfirmed_transactions:
             return False
 
@@ -200,12 +501,25 @@ class Blockchain:
             previous_hash=last_block.hash
         )
 
-        proof = self.proof_of_work(new_block)
-        self.add_block(new_block, proof)
+        proof = self.proof_of_work(new_block, cancel_event)
+        if proof is None or not self.add_block(new_block, proof):
+            return False
 
         self.unconfirmed_transactions = []
         return True
     
+    def _drop_duplicate_votes(self, transactions):
+        """Keep only the first vote of each voter who has not voted on the chain yet."""
+        seen = set()
+        kept = []
+        for transaction in transactions:
+            if transaction.voter_id in seen or self.has_voted(transaction.voter_id):
+                print(f"Dropping duplicate vote by {transaction.voter_id}")
+                continue
+            seen.add(transaction.voter_id)
+            kept.append(transaction)
+        return kept
+
     def mine_malicious_block(self):
         """
         Interface to add pending transactions to the blockchain
@@ -226,10 +540,11 @@ class Blockchain:
             previous_hash=last_block.hash
         )
 
-        proof = self.proof_of_work(new_block)
-        self.add_block(new_block, proof)
-        self.chain[-1].hash = "malicious_previous_hash"
-        self.chain[-1].nounce = 0
+        self.proof_of_work(new_block)
+        # Append the mined block with a tampered hash, bypassing add_block's checks
+        new_block.hash = "malicious_previous_hash"
+        with self.lock:
+            self.chain.append(new_block)
         self.unconfirmed_transactions = []
         return True
 
@@ -240,18 +555,7 @@ class Blockchain:
         Returns:
             list: List of dictionaries containing block data
         """
-        chain_data = []
-        for block in self.chain:
-            block_dict = {
-                'index': block.index,
-                'transactions': [tx.to_dict() for tx in block.transactions],
-                'timestamp': block.timestamp,
-                'previous_hash': block.previous_hash,
-                'nonce': block.nonce,
-                'hash': block.hash
-            }
-            chain_data.append(block_dict)
-        return chain_data
+        return [block.to_dict() for block in self.chain]
 
     def update_chain(self, chain_dicts_from_peers):
         """
@@ -283,22 +587,8 @@ class Blockchain:
                 
                 # Check if this chain is longer and valid for consensus
                 if chain_length > current_len:
-                    # Verify the chain's integrity
-                    is_valid = True
-                    for i in range(1, chain_length):
-                        current_block = temp_blockchain.chain[i]
-                        prev_block = temp_blockchain.chain[i-1]
-                        
-                        # Check if the previous hash references are correct
-                        if current_block.previous_hash != prev_block.hash:
-                            is_valid = False
-                            break
-                        
-                        # Check if the hash is valid for the block's content
-                        computed_hash = current_block.compute_hash()
-                        if not computed_hash.startswith('0' * self.difficulty) or computed_hash != current_block.hash:
-                            is_valid = False
-                            break
+                    # Verify the chain's integrity, skipping blocks we already validated
+                    is_valid = self.is_valid_chain(temp_blockchain.chain)
                     
                     if is_valid:
                         current_len = chain_length
@@ -310,7 +600,7 @@ class Blockchain:
         
         # Replace our chain if we found a longer valid chain
         if longest_chain:
-            self.chain = longest_chain
+            self.replace_chain(longest_chain)
             return True
             
         return False
@@ -377,26 +667,14 @@ class Blockchain:
     def get_vote_count(self):
         """
         Counts votes for each candidate across the entire blockchain.
+        The counts are kept up to date as blocks are added or the chain is
+        replaced, so this costs O(candidates) rather than a scan of every block.
         
         Returns:
             dict: Dictionary with candidate_id as key and vote count as value
         """
-        vote_count = {}
-        
-        # Skip genesis block (index 0) as it has no transactions
-        for block in self.chain[1:]:
-            for transaction in block.transactions:
-                # Ensure we're only counting transactions that are votes
-                if hasattr(transaction, 'candidate_id'):
-                    candidate_id = transaction.candidate_id
-                    
-                    # Increment vote count for this candidate
-                    if candidate_id in vote_count:
-                        vote_count[candidate_id] += 1
-                    else:
-                        vote_count[candidate_id] = 1
-        
-        return vote_count
+        # The genesis block (index 0) is not counted
+        return self.chain.vote_count()
 
     def get_last_block_dict(self):
         """
@@ -406,16 +684,27 @@ class Blockchain:
         Returns:
             dict: Dictionary representation of the last block.
         """
-        last_block = self.last_block
-        block_dict = {
-            'index': last_block.index,
-            'transactions': [tx.to_dict() for tx in last_block.transactions],
-            'timestamp': last_block.timestamp,
-            'previous_hash': last_block.previous_hash,
-            'nonce': last_block.nonce,
-            'hash': last_block.hash
-        }
-        return block_dict
+        return self.last_block.to_dict()
+
+def block_from_header(header, transaction_dicts):
+    """
+    Rebuild a block from a header received earlier and a transaction list received
+    later, checking that the transactions are the ones the header commits to.
+    
+    Args:
+        header (dict): Validated header from Block.header_dict().
+        transaction_dicts (list): The block's transactions as dictionaries.
+        
+    Returns:
+        Block: The block, or None if the transactions do not match the header.
+    """
+    block = block_from_dict(dict(header, transactions=transaction_dicts))
+    try:
+        if block.compute_hash() != header['hash']:
+            return None
+    except ValueError:
+        return None
+    return block
 
 def block_from_dict(block_dict):
     """
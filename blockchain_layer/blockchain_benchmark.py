@@ -0,0 +1,290 @@
+import sys
+import os
+import time
+import multiprocessing
+import tracemalloc
+import hashlib
+import json
+import tempfile
+import shutil
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.block import Block
+from blockchain_layer.transaction import Transaction
+from blockchain_layer.miner import search_nonce, parallel_search_nonce, MinerPool
+from blockchain_layer.compact_chain import CompactChain
+from blockchain_layer.blockchain import Blockchain, block_from_dict
+from blockchain_layer.mempool import Mempool
+
+
+def make_block(index=1, votes=1):
+    """Build a block like the ones Peer.mining_worker mines."""
+    return Block(
+        index=index,
+        transactions=[Transaction(f"voter{index}-{i}", "candidateA", timestamp="2024-05-01 12:00:00")
+                      for i in range(votes)],
+        timestamp="2024-05-01 12:00:00",
+        previous_hash="0" * 64
+    )
+
+
+def mine_with_json_encoding(block, difficulty):
+    """The original proof-of-work loop: JSON-encode the whole block + SHA-256 per nonce."""
+    nonce = 0
+    while True:
+        block_string = json.dumps({
+            'index': block.index,
+            'transactions': [tx.to_dict() for tx in block.transactions],
+            'timestamp': block.timestamp,
+            'previous_hash': block.previous_hash,
+            'nonce': nonce
+        }, sort_keys=True).encode()
+        if hashlib.sha256(block_string).hexdigest().startswith('0' * difficulty):
+            return nonce
+        nonce += 1
+
+
+def mine_with_midstate(block, difficulty):
+    """The midstate engine used by Blockchain.proof_of_work."""
+    nonce, _ = search_nonce(block.header_prefix(), difficulty)
+    return nonce
+
+
+def benchmark_pow(difficulties=(2, 3, 4, 5), min_hashes=200000):
+    """
+    Print hashes/sec for the old and the midstate proof-of-work at each difficulty.
+    Blocks are mined until at least min_hashes nonces have been tried so low
+    difficulties are not dominated by timer noise.
+    """
+    print("=== Benchmark: proof-of-work hashes/sec ===")
+    print(f"{'difficulty':>10} {'JSON encode':>14} {'midstate':>14} {'speedup':>8}")
+    for difficulty in difficulties:
+        rates = []
+        for mine in (mine_with_json_encoding, mine_with_midstate):
+            hashes = 0
+            index = 1
+            start = time.perf_counter()
+            while hashes < min_hashes:
+                hashes += mine(make_block(index), difficulty) + 1
+                index += 1
+            rates.append(hashes / (time.perf_counter() - start))
+        print(f"{difficulty:>10} {rates[0]:>14,.0f} {rates[1]:>14,.0f} {rates[1] / rates[0]:>7.1f}x")
+
+
+def benchmark_parallel_pow(difficulties=(2, 3, 4, 5), blocks=5, workers=None):
+    """
+    Print average time to mine a block in-process vs. across worker processes, with a
+    new pool forked per block vs. one MinerPool reused for every block.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    print(f"=== Benchmark: parallel proof-of-work ({workers} workers) ===")
+    print(f"{'difficulty':>10} {'1 process (s)':>14} {'pool per block (s)':>19} {'reused pool (s)':>16}")
+    pool = MinerPool(workers)
+    try:
+        for difficulty in difficulties:
+            timings = []
+            for search in (lambda prefix, d: search_nonce(prefix, d),
+                           lambda prefix, d: parallel_search_nonce(prefix, d, workers),
+                           lambda prefix, d: pool.search(prefix, d)):
+                start = time.perf_counter()
+                for index in range(1, blocks + 1):
+                    search(make_block(index).header_prefix(), difficulty)
+                timings.append((time.perf_counter() - start) / blocks)
+            print(f"{difficulty:>10} {timings[0]:>14.3f} {timings[1]:>19.3f} {timings[2]:>16.3f}")
+    finally:
+        pool.close()
+
+
+def benchmark_pow_vs_block_size(vote_counts=(1, 10, 100, 1000), hashes=20000):
+    """Print hashes/sec as blocks carry more votes: the JSON payload grows, the header does not."""
+    print("=== Benchmark: proof-of-work hashes/sec vs. votes per block ===")
+    print(f"{'votes':>10} {'JSON encode':>14} {'Merkle header':>14}")
+    for votes in vote_counts:
+        block = make_block(votes=votes)
+        start = time.perf_counter()
+        for nonce in range(hashes // votes + 1):
+            hashlib.sha256(json.dumps({
+                'index': block.index,
+                'transactions': [tx.to_dict() for tx in block.transactions],
+                'timestamp': block.timestamp,
+                'previous_hash': block.previous_hash,
+                'nonce': nonce
+            }, sort_keys=True).encode()).hexdigest()
+        json_rate = (hashes // votes + 1) / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        search_nonce(block.header_prefix(), 64, stop=hashes)  # unreachable difficulty: try every nonce
+        header_rate = hashes / (time.perf_counter() - start)
+        print(f"{votes:>10} {json_rate:>14,.0f} {header_rate:>14,.0f}")
+
+
+def generate_received_blocks(count, candidates=("Adam", "Bob", "Catherine")):
+    """
+    Yield one-vote blocks shaped like the ones block_from_dict rebuilds during a
+    chain sync: every hash and ID is its own string object, as after json.loads.
+    """
+    for index in range(count):
+        digest = hashlib.sha256(index.to_bytes(8, "big")).digest()
+        previous = hashlib.sha256((index - 1).to_bytes(8, "big", signed=True)).digest()
+        timestamp = f"2024-05-01 12:{index // 60 % 60:02d}:{index % 60:02d}"
+        block = Block(
+            index=index,
+            transactions=[Transaction(f"voter{index}", candidates[index % len(candidates)], timestamp=str(timestamp))],
+            timestamp=timestamp,
+            previous_hash=previous.hex(),
+            nonce=index * 7
+        )
+        block.hash = digest.hex()
+        yield block
+
+
+def measure_allocated(build):
+    """Return (bytes still allocated, result) after calling build()."""
+    tracemalloc.start()
+    result = build()
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return allocated, result
+
+
+def benchmark_chain_memory(sizes=(100000, 1000000)):
+    """Print the memory held by a list of Block objects vs. a CompactChain."""
+    print("=== Benchmark: in-memory chain size ===")
+    print(f"{'blocks':>10} {'list of Block (MB)':>19} {'CompactChain (MB)':>18} {'ratio':>6}")
+    for count in sizes:
+        list_bytes, blocks = measure_allocated(lambda: list(generate_received_blocks(count)))
+        del blocks
+        compact_bytes, compact = measure_allocated(lambda: CompactChain(generate_received_blocks(count)))
+        assert len(compact) == count
+        del compact
+        print(f"{count:>10,} {list_bytes / 2**20:>19.1f} {compact_bytes / 2**20:>18.1f} {list_bytes / compact_bytes:>5.1f}x")
+
+
+def benchmark_batch_throughput(votes=1000, batch_sizes=(1, 10, 50, 100, 250), difficulty=3):
+    """Print votes/sec when a burst of votes is mined through the mempool at different batch sizes."""
+    print(f"=== Benchmark: votes/sec for a burst of {votes} votes (difficulty {difficulty}) ===")
+    print(f"{'batch size':>10} {'blocks':>8} {'seconds':>9} {'votes/sec':>10}")
+    for batch_size in batch_sizes:
+        node = Blockchain(difficulty=difficulty)
+        mempool = Mempool(max_size=votes)
+        for i in range(votes):
+            mempool.add(Transaction(f"voter{i}", "candidateA"))
+
+        start = time.perf_counter()
+        while len(mempool):
+            batch = mempool.take_batch(batch_size, max_wait=0)
+            for transaction in batch:
+                node.add_new_transaction(transaction)
+            node.mine_block()
+            mempool.confirm(batch)
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:>10} {len(node.chain) - 1:>8} {elapsed:>9.2f} {votes / elapsed:>10,.0f}")
+
+
+def build_voting_chain(votes, votes_per_block=100):
+    """
+    Build a valid difficulty-0 chain holding `votes` distinct voters, as the list of
+    freshly decoded blocks a peer validates during a chain sync (no cached hashes).
+    """
+    node = Blockchain(difficulty=0)
+    chain = [node.last_block]
+    for start in range(0, votes, votes_per_block):
+        block = Block(
+            index=len(chain),
+            transactions=[Transaction(f"voter{i}", "candidateA", timestamp="2024-05-01 12:00:00")
+                          for i in range(start, min(start + votes_per_block, votes))],
+            timestamp="2024-05-01 12:00:00",
+            previous_hash=chain[-1].hash
+        )
+        block.hash = block.compute_hash()
+        chain.append(block)
+    return [block_from_dict(block.to_dict()) for block in chain]
+
+
+def benchmark_chain_validation(vote_counts=(125000, 250000, 500000, 1000000), votes_per_block=100):
+    """Print is_valid_chain time (including the double-vote check) as the chain grows."""
+    print(f"=== Benchmark: chain validation with double-vote check ({votes_per_block} votes/block) ===")
+    print(f"{'votes':>10} {'blocks':>8} {'seconds':>9} {'us/vote':>8}")
+    node = Blockchain(difficulty=0)
+    for votes in vote_counts:
+        chain = build_voting_chain(votes, votes_per_block)
+        start = time.perf_counter()
+        assert node.is_valid_chain(chain)
+        elapsed = time.perf_counter() - start
+        print(f"{votes:>10,} {len(chain):>8,} {elapsed:>9.2f} {elapsed / votes * 1e6:>8.2f}")
+
+
+def benchmark_resync_validation(blocks=50000, divergent=10):
+    """Print the time to validate a re-synced chain that only differs from ours in its last blocks."""
+    print(f"=== Benchmark: validating a {blocks:,}-block re-sync with {divergent} divergent blocks ===")
+    chain = build_voting_chain(blocks, votes_per_block=1)
+    node = Blockchain(difficulty=0)
+    assert node.is_valid_chain(chain)
+    node.replace_chain(chain)
+
+    fork = chain[:-divergent]
+    for index in range(len(fork), len(chain)):
+        block = Block(index, [Transaction(f"fork-voter{index}", "candidateB", timestamp="2024-05-01 12:00:00")],
+                      "2024-05-01 12:00:00", fork[-1].hash)
+        block.hash = block.compute_hash()
+        fork.append(block)
+    received = [block_from_dict(block.to_dict()) for block in fork]
+
+    start = time.perf_counter()
+    assert Blockchain(difficulty=0).is_valid_chain(received)
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    assert node.is_valid_chain(received)
+    cached = time.perf_counter() - start
+    print(f"{'no cache (s)':>14} {'with cache (s)':>15}")
+    print(f"{cold:>14.3f} {cached:>15.4f}")
+
+
+def benchmark_restart(sizes=(10000, 50000, 200000)):
+    """
+    Print the time to restart from a ChainStore vs. rebuilding and re-validating the chain
+    from peers. The store is reopened by replaying every block (no snapshots) and from the
+    newest tally snapshot, which keeps startup flat as the chain grows.
+    """
+    print("=== Benchmark: restart time ===")
+    print(f"{'blocks':>10} {'re-validate (s)':>16} {'full replay (s)':>16} {'snapshot (s)':>13}")
+    for count in sizes:
+        chain = build_voting_chain(count, votes_per_block=1)
+        directory = tempfile.mkdtemp()
+        try:
+            node = Blockchain(difficulty=0, store_path=directory)
+            node.replace_chain(chain)
+            node.close()
+
+            start = time.perf_counter()
+            received = [block_from_dict(block.to_dict()) for block in chain]
+            fresh = Blockchain(difficulty=0)
+            assert fresh.is_valid_chain(received)
+            fresh.replace_chain(received)
+            revalidate = time.perf_counter() - start
+
+            start = time.perf_counter()
+            node = Blockchain(difficulty=0, store_path=directory, snapshot_interval=0)
+            replay = time.perf_counter() - start
+            assert len(node.chain) == len(chain)
+            node.close()
+
+            start = time.perf_counter()
+            node = Blockchain(difficulty=0, store_path=directory)
+            reopen = time.perf_counter() - start
+            assert node.get_vote_count() == fresh.get_vote_count()
+            node.close()
+        finally:
+            shutil.rmtree(directory)
+        print(f"{len(chain):>10,} {revalidate:>16.2f} {replay:>16.3f} {reopen:>13.4f}")
+
+
+if __name__ == "__main__":
+    benchmark_pow()
+    benchmark_pow_vs_block_size()
+    benchmark_parallel_pow()
+    benchmark_chain_memory()
+    benchmark_batch_throughput()
+    benchmark_chain_validation()
+    benchmark_resync_validation()
+    benchmark_restart()
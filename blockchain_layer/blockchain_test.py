@@ -1,9 +1,21 @@
 import time
+import hashlib
+import json
+import threading
+import os
+import shutil
+import tempfile
 from blockchain import Blockchain
 from transaction import Transaction
-from block import Block
+from block import Block, header_hash
+import block as block_module
 from test_helpers import print_chain
-from blockchain import block_from_dict
+from blockchain import block_from_dict, block_from_header
+from miner import search_nonce
+from compact_chain import CompactChain
+from mempool import Mempool
+from merkle import leaf_hash, verify_merkle_proof
+from chain_store import ChainStore, SEGMENT_FILE, INDEX_FILE
 
 def test_single_block_propagation_and_fork_resolution():
     print("=== Test: Single Block Propagation and Fork Resolution with Network Simulation ===")
@@ -175,10 +187,602 @@ def test_successful_single_block_propagation():
 
     print("No fork resolution needed as single block addition succeeded.")
 
+def test_midstate_pow_matches_compute_hash():
+    print("=== Test: Midstate Proof-of-Work Matches compute_hash ===")
+
+    block = Block(index=7, transactions=[Transaction("voter1", "candidateA"), Transaction("voter2", "candidateB")],
+                  timestamp="2024-05-01 12:00:00", previous_hash="00ab" * 16)
+    prefix = block.header_prefix()
+
+    # Every nonce must hash to exactly what compute_hash produces
+    for nonce in [0, 1, 9, 10, 12345, 10**12]:
+        block.nonce = nonce
+        assert hashlib.sha256(prefix + nonce.to_bytes(8, "big")).hexdigest() == block.compute_hash(), \
+            f"Midstate encoding should match compute_hash for nonce {nonce}"
+
+    # The search should find the same nonce as a one-by-one compute_hash loop
+    for difficulty in [1, 2, 3]:
+        nonce, found_hash = search_nonce(prefix, difficulty)
+        block.nonce = 0
+        while not block.compute_hash().startswith('0' * difficulty):
+            block.nonce += 1
+        print(f"Difficulty {difficulty}: nonce {nonce}, hash {found_hash[:15]}...")
+        assert nonce == block.nonce, "Midstate search should find the first valid nonce"
+        assert found_hash == block.compute_hash(), "Midstate hash should equal compute_hash"
+
+    # Mined blocks must still pass the unchanged proof check
+    node = Blockchain()
+    node.add_new_transaction(Transaction("voter1", "candidateA"))
+    assert node.mine_block(), "Mining should succeed"
+    assert node.is_valid_chain(node.chain), "Chain mined with the midstate engine should be valid"
+
+def test_parallel_mining():
+    print("=== Test: Multi-Process Mining with Nonce-Range Partitioning ===")
+
+    node = Blockchain(difficulty=3, mining_workers=2)
+    node.add_new_transaction(Transaction("voter1", "candidateA"))
+    assert node.mine_block(), "Parallel mining should succeed"
+    mined_block = node.last_block
+    print(f"Mined block {mined_block.index} with nonce {mined_block.nonce}, hash {mined_block.hash[:15]}...")
+    assert node.is_valid_proof(mined_block, mined_block.hash), "Parallel-mined block should pass is_valid_proof"
+
+    # A single-process node must accept the block unchanged
+    node2 = Blockchain(difficulty=3)
+    assert node2.add_block(block_from_dict(node.get_last_block_dict()), mined_block.hash), \
+        "Parallel-mined block should be accepted by a single-process node"
+
+    # The worker processes are started once and reused for the next block
+    pool = node.miner_pool.pool
+    node.add_new_transaction(Transaction("voter2", "candidateA"))
+    assert node.mine_block() and node.miner_pool.pool is pool, "The next block should reuse the worker pool"
+    node.close()
+    assert node.miner_pool.pool is None, "Closing the chain should shut the worker pool down"
+
+def test_cancelled_mining_keeps_transactions():
+    print("=== Test: Cancelled Mining Keeps Pending Transactions ===")
+
+    node = Blockchain()
+    vote = Transaction("voter1", "candidateA")
+    node.add_new_transaction(vote)
+
+    # A competing block has already moved the tip, so the job is cancelled
+    cancel_event = threading.Event()
+    cancel_event.set()
+    mine_result = node.mine_block(cancel_event=cancel_event)
+    print(f"Mining result after cancellation: {mine_result}")
+    assert not mine_result, "Cancelled mining should not add a block"
+    assert len(node.chain) == 1, "No block should be appended when mining is cancelled"
+    assert node.unconfirmed_transactions == [vote], "The vote should stay queued after cancellation"
+
+    # Restarting the job mines the same vote onto the current tip
+    cancel_event.clear()
+    assert node.mine_block(cancel_event=cancel_event), "Mining should succeed once restarted"
+    assert node.last_block.transactions[0].voter_id == "voter1", "The re-queued vote should be mined"
+    assert not node.unconfirmed_transactions, "Pending transactions should be cleared after mining"
+    assert node.is_valid_chain(node.chain), "Chain should be valid after restarted mining"
+
+def test_lazy_block_hashing():
+    print("=== Test: Lazy, Memoized Block Hashing ===")
+
+    node = Blockchain(difficulty=2)
+    for i in range(5):
+        node.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        node.mine_block()
+
+    # Count block header hashes made while a received chain is rebuilt and validated
+    fresh_node = Blockchain(difficulty=2)
+    real_hashlib = block_module.hashlib
+    calls = []
+    class CountingHashlib:
+        @staticmethod
+        def sha256(data=b""):
+            if len(data) == block_module.HEADER_SIZE:
+                calls.append(data)
+            return real_hashlib.sha256(data)
+    block_module.hashlib = CountingHashlib
+    try:
+        received_chain = [block_from_dict(block_dict) for block_dict in node.get_chain_data()]
+        print(f"Header hashes while decoding {len(received_chain)} blocks: {len(calls)}")
+        assert not calls, "Decoding received blocks should not hash them"
+        # A node that has not seen these blocks yet must hash every one of them
+        assert fresh_node.is_valid_chain(received_chain), "Received chain should be valid"
+        print(f"Header hashes after validation: {len(calls)}")
+        assert len(calls) == len(received_chain) - 1, "Validation should hash each non-genesis block once"
+    finally:
+        block_module.hashlib = real_hashlib
+
+    # Changing the nonce must invalidate the memoized hash
+    mined_block = node.last_block
+    original_hash = mined_block.compute_hash()
+    mined_block.nonce += 1
+    assert mined_block.compute_hash() != original_hash, "compute_hash should change with the nonce"
+    fresh_block = Block(mined_block.index, mined_block.transactions, mined_block.timestamp,
+                        mined_block.previous_hash, nonce=mined_block.nonce)
+    assert mined_block.compute_hash() == fresh_block.compute_hash(), "Memoized hash should match a fresh block"
+
+def test_compact_chain_round_trip():
+    print("=== Test: Compact Column-Oriented Chain Store ===")
+
+    node = Blockchain(difficulty=2)
+    for i in range(4):
+        node.add_new_transaction(Transaction(f"voter{i}", ["candidateA", "candidateB"][i % 2]))
+        node.mine_block()
+    blocks = [block_from_dict(block_dict) for block_dict in node.get_chain_data()]
+
+    compact = CompactChain(blocks)
+    assert len(compact) == len(blocks), "Compact chain should keep every block"
+    for original, stored in zip(blocks, compact):
+        assert original.to_dict() == stored.to_dict(), f"Block {original.index} should round-trip unchanged"
+    assert compact[-1].hash == blocks[-1].hash, "Negative indexing should return the last block"
+    assert [b.index for b in compact[1:3]] == [1, 2], "Slicing should return the selected blocks"
+    assert compact.hash_at(2) == blocks[2].hash, "hash_at should read the stored hash"
+    assert compact[-1] is compact[4], "Reads of the tip should reuse the rebuilt block and its memoized hash"
+
+    # Values that do not fit the packed columns must still round-trip
+    odd_block = Block(5, [Transaction("voter9", "candidateC")], "2024-05-01 12:00:00", "fake_previous_hash", nonce=-1)
+    odd_block.hash = "malicious_previous_hash"
+    compact.append(odd_block)
+    assert compact[5].previous_hash == "fake_previous_hash", "Non-hex previous hash should round-trip"
+    assert compact[5].hash == "malicious_previous_hash", "Non-hex hash should round-trip"
+    assert compact[5].nonce == -1, "Out-of-range nonce should round-trip"
+
+    compact.truncate(3)
+    assert len(compact) == 3, "Truncate should drop the tail"
+    assert [tx.voter_id for b in compact for tx in b.transactions] == ["voter0", "voter1"], \
+        "Truncate should drop the tail's transactions"
+    compact.extend([blocks[3], odd_block])
+    assert compact[4].hash == odd_block.hash, "A block cached before truncate should not be returned"
+
+    # The Blockchain keeps its chain compact and still validates it
+    assert isinstance(node.chain, CompactChain), "Blockchain.chain should be a CompactChain"
+    node.chain = blocks
+    assert isinstance(node.chain, CompactChain), "Assigning a list should store it compactly"
+    assert node.is_valid_chain(node.chain), "Compact chain should validate"
+    assert node.get_vote_count() == {"candidateA": 2, "candidateB": 2}, "Vote count should read the compact chain"
+
+def test_mempool_batching():
+    print("=== Test: Mempool Dedup, Bound and Multi-Transaction Batching ===")
+
+    mempool = Mempool(max_size=5)
+    assert mempool.add(Transaction("voter1", "candidateA")), "First vote should be accepted"
+    assert not mempool.add(Transaction("voter1", "candidateB")), "Second pending vote by the same voter should be rejected"
+    for i in range(2, 6):
+        assert mempool.add(Transaction(f"voter{i}", "candidateB")), f"Vote {i} should be accepted"
+    assert not mempool.add(Transaction("voter6", "candidateA")), "Vote should be rejected once the mempool is full"
+
+    # A full batch is returned immediately, in arrival order
+    batch = mempool.take_batch(max_transactions=3, max_wait=10)
+    assert [tx.voter_id for tx in batch] == ["voter1", "voter2", "voter3"], "Batch should follow arrival order"
+    assert not mempool.add(Transaction("voter1", "candidateA")), "In-flight voters should still be deduplicated"
+
+    # An abandoned batch goes back to the front
+    mempool.requeue(batch)
+    assert [tx.voter_id for tx in mempool.take_batch(max_transactions=10, max_wait=0)] == \
+        ["voter1", "voter2", "voter3", "voter4", "voter5"], "Requeued votes should be mined first"
+
+    # A partial batch is flushed once the oldest vote has waited max_wait
+    mempool = Mempool()
+    mempool.add(Transaction("voter7", "candidateA"))
+    start = time.monotonic()
+    batch = mempool.take_batch(max_transactions=10, max_wait=0.2)
+    waited = time.monotonic() - start
+    print(f"Partial batch of {len(batch)} flushed after {waited:.2f}s")
+    assert len(batch) == 1 and 0.15 <= waited < 1, "Partial batch should flush after max_wait"
+    assert mempool.take_batch(max_transactions=10, max_wait=0, timeout=0.05) == [], "Empty pool should time out"
+
+    # Multi-transaction blocks are counted, validated and synced like single-vote ones
+    node = Blockchain(difficulty=2)
+    for tx in [Transaction("voter1", "candidateA"), Transaction("voter2", "candidateB"), Transaction("voter3", "candidateA")]:
+        node.add_new_transaction(tx)
+    assert node.mine_block(), "Mining a batch should succeed"
+    assert len(node.last_block.transactions) == 3, "Block should seal the whole batch"
+    assert node.get_vote_count() == {"candidateA": 2, "candidateB": 1}, "Vote count should include every vote in the block"
+    node2 = Blockchain(difficulty=2)
+    assert node2.update_chain([node.get_chain_data()]), "Chain with a multi-transaction block should sync"
+    assert node2.get_vote_count() == node.get_vote_count(), "Synced node should count the same votes"
+
+def test_merkle_root_headers():
+    print("=== Test: Merkle-Root Block Headers and Inclusion Proofs ===")
+
+    # The header, and so the proof-of-work input, has the same size for any batch size
+    prefixes = []
+    for count in [0, 1, 2, 3, 7, 100]:
+        block = Block(1, [Transaction(f"voter{i}", "candidateA", "2024-05-01 12:00:00") for i in range(count)],
+                      "2024-05-01 12:00:00", "0" * 64)
+        prefixes.append(block.header_prefix())
+        # Every vote can be proven against the root alone
+        root = bytes.fromhex(block.merkle_root)
+        for position, tx in enumerate(block.transactions):
+            leaf = leaf_hash(json.dumps(tx.to_dict(), sort_keys=True).encode())
+            assert verify_merkle_proof(leaf, block.merkle_proof(position), root), \
+                f"Proof for vote {position} of {count} should verify"
+        if count > 1:
+            forged = leaf_hash(json.dumps(Transaction("voter0", "candidateB", "2024-05-01 12:00:00").to_dict(),
+                                          sort_keys=True).encode())
+            assert not verify_merkle_proof(forged, block.merkle_proof(0), root), "A forged vote should not verify"
+    assert len({len(prefix) for prefix in prefixes}) == 1, "Header size should not depend on transaction count"
+
+    # Hex hashes have a single header encoding: upper-case hex does not alias lower-case
+    block = Block(1, [Transaction("voter1", "candidateA", "2024-05-01 12:00:00")], "2024-05-01 12:00:00", "ab" * 32)
+    upper = Block(1, block.transactions, block.timestamp, "AB" * 32)
+    assert upper.header_prefix() != block.header_prefix(), "Upper-case previous_hash should change the header"
+    header = block.header_dict()
+    try:
+        header_hash(dict(header, merkle_root=header['merkle_root'].upper()))
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Upper-case Merkle root should be rejected")
+
+    # Changing a vote changes the root and so the block hash
+    node = Blockchain(difficulty=2)
+    node.add_new_transaction(Transaction("voter1", "candidateA"))
+    node.add_new_transaction(Transaction("voter2", "candidateB"))
+    node.mine_block()
+    node2 = Blockchain(difficulty=2)
+    assert node2.update_chain([node.get_chain_data()]), "Untampered chain should sync"
+    tampered_chain = node.get_chain_data()
+    tampered_chain[1]['transactions'][1]['candidate_id'] = "candidateA"
+    node2 = Blockchain(difficulty=2)
+    assert not node2.update_chain([tampered_chain]), "Chain with a tampered vote should be rejected"
+    assert node2.is_valid_chain(node2.chain), "Clean chain should stay valid"
+
+def test_incremental_vote_tally():
+    print("=== Test: Incremental Vote Tally Across Appends and Chain Replacement ===")
+
+    def recount(chain):
+        counts = {}
+        for block in chain[1:]:
+            for tx in block.transactions:
+                counts[tx.candidate_id] = counts.get(tx.candidate_id, 0) + 1
+        return counts
+
+    node = Blockchain(difficulty=1)
+    assert node.get_vote_count() == {}, "A fresh chain should have no votes"
+    for i in range(4):
+        node.add_new_transaction(Transaction(f"voter{i}", "candidateA" if i % 2 else "candidateB"))
+        node.mine_block()
+    assert node.get_vote_count() == {"candidateA": 2, "candidateB": 2}, "Tally should follow mined blocks"
+
+    # A competing fork that shares the first two blocks and then outgrows ours
+    fork = Blockchain(difficulty=1)
+    fork.chain = node.chain[:3]
+    for i in range(10, 13):
+        fork.add_new_transaction(Transaction(f"voter{i}", "candidateC"))
+        fork.mine_block()
+    kept = node.replace_chain(fork.chain)
+    assert kept == 3, "Shared prefix should be kept"
+    assert node.get_vote_count() == recount(node.chain) == {"candidateA": 1, "candidateB": 1, "candidateC": 3}, \
+        "Tally should drop the orphaned votes and add the fork's"
+
+    # The consensus path goes through the same replacement
+    longer = Blockchain(difficulty=1)
+    longer.chain = fork.chain[:]
+    longer.add_new_transaction(Transaction("voter20", "candidateA"))
+    longer.mine_block()
+    assert node.update_chain([longer.get_chain_data()]), "Longer chain should replace ours"
+    assert node.get_vote_count() == recount(node.chain), "Tally should match a full recount after update_chain"
+
+    # Truncating down to the genesis block clears every count
+    node.chain.truncate(1)
+    assert node.get_vote_count() == {}, "Tally should be empty with only the genesis block"
+
+def test_double_vote_rejection():
+    print("=== Test: Voter Index Rejects Double Votes ===")
+
+    node = Blockchain(difficulty=1)
+    assert node.add_new_transaction(Transaction("voter1", "candidateA")), "First vote should be accepted"
+    node.mine_block()
+    assert node.has_voted("voter1"), "Voter index should record mined votes"
+    assert not node.add_new_transaction(Transaction("voter1", "candidateB")), "Second vote should be rejected at submission"
+
+    # Duplicates inside a batch are dropped before mining
+    node.unconfirmed_transactions = [Transaction("voter2", "candidateA"), Transaction("voter2", "candidateB"),
+                                     Transaction("voter1", "candidateB")]
+    assert node.mine_block(), "Batch with one fresh vote should still be mined"
+    assert [tx.voter_id for tx in node.last_block.transactions] == ["voter2"], "Only the first fresh vote should be kept"
+
+    # A block re-using a voter is refused at acceptance
+    replay = Block(len(node.chain), [Transaction("voter1", "candidateB")], "2024-05-01 12:00:00", node.last_block.hash)
+    proof = node.proof_of_work(replay)
+    assert not node.add_block(replay, proof), "Block with a double vote should be rejected"
+
+    # ... and a chain containing one is invalid, both for is_valid_chain and update_chain
+    cheater = Blockchain(difficulty=1)
+    cheater.chain = node.chain[:]
+    replay.hash = proof
+    cheater.chain.append(replay)
+    assert not node.is_valid_chain(cheater.chain), "Chain with a double vote should be invalid"
+    assert not node.update_chain([cheater.get_chain_data()]), "Chain with a double vote should not be adopted"
+
+    # The index follows chain replacement
+    fork = Blockchain(difficulty=1)
+    for voter in ["voter3", "voter4", "voter5"]:
+        fork.add_new_transaction(Transaction(voter, "candidateC"))
+        fork.mine_block()
+    node.replace_chain(fork.chain)
+    assert not node.has_voted("voter1") and node.has_voted("voter5"), "Voter index should follow the new chain"
+
+def test_validated_block_cache():
+    print("=== Test: Validated-Block Cache Skips the Known Prefix ===")
+
+    node = Blockchain(difficulty=1)
+    for i in range(10):
+        node.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        node.mine_block()
+
+    # A peer shares our first 8 blocks, then forks off with 4 of its own
+    peer = Blockchain(difficulty=1)
+    peer.chain = node.chain[:8]
+    for i in range(20, 24):
+        peer.add_new_transaction(Transaction(f"voter{i}", "candidateB"))
+        peer.mine_block()
+    received_chain = [block_from_dict(block_dict) for block_dict in peer.get_chain_data()]
+
+    real_hashlib = block_module.hashlib
+    calls = []
+    class CountingHashlib:
+        @staticmethod
+        def sha256(data=b""):
+            if len(data) == block_module.HEADER_SIZE:
+                calls.append(data)
+            return real_hashlib.sha256(data)
+    block_module.hashlib = CountingHashlib
+    try:
+        assert node.is_valid_chain(received_chain), "Forked chain should be valid"
+    finally:
+        block_module.hashlib = real_hashlib
+    print(f"Header hashes to validate a {len(received_chain)}-block chain sharing 8 blocks: {len(calls)}")
+    assert len(calls) == 4, "Only the divergent suffix should be hashed"
+
+    # A tampered vote inside the shared prefix is not re-checked, but our own copy is kept
+    tampered = [block_from_dict(block_dict) for block_dict in peer.get_chain_data()]
+    tampered[3].transactions[0].candidate_id = "candidateB"
+    assert node.is_valid_chain(tampered), "Known prefix is trusted by hash"
+    node.replace_chain(tampered)
+    assert node.get_vote_count() == {"candidateA": 7, "candidateB": 4}, "Local copies of the prefix should be kept"
+    assert node.chain[3].transactions[0].candidate_id == "candidateA", "Tampered block should not be installed"
+
+    # Blocks from the new suffix are cached, the orphaned ones are forgotten
+    assert node.chain.hash_at(-1) in node.validated_blocks, "Installed blocks should be cached"
+    assert received_chain[8].hash in node.validated_blocks, "Installed suffix should be cached"
+
+    # The cache is bounded; evicted entries only cost re-validation
+    small = Blockchain(difficulty=1, validated_cache_size=3)
+    for i in range(6):
+        small.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        small.mine_block()
+    assert len(small.validated_blocks) == 3, "Cache should evict least recently used blocks"
+    assert small.is_valid_chain([block_from_dict(block_dict) for block_dict in small.get_chain_data()]), \
+        "Chain should still validate with a small cache"
+    bad = [block_from_dict(block_dict) for block_dict in small.get_chain_data()]
+    bad[-1].transactions[0].candidate_id = "candidateB"
+    bad[-1].hash = "f" * 64
+    assert not small.is_valid_chain(bad), "A block outside the known prefix should still be checked"
+
+def test_locator_sync():
+    print("=== Test: Block Locators and Suffix Splicing ===")
+
+    # The locator stays logarithmic in chain length and always ends at genesis
+    long_node = Blockchain(difficulty=0)
+    for i in range(1000):
+        long_node.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        long_node.mine_block()
+    locator = long_node.get_locator()
+    print(f"Locator entries for {len(long_node.chain)} blocks: {len(locator)}")
+    assert len(locator) < 25, "Locator should grow logarithmically"
+    assert locator[0] == [1000, long_node.last_block.hash] and locator[-1][0] == 0, "Locator should span tip to genesis"
+
+    # Two nodes share 6 blocks; the responder then mines 3 more and the requester 1 of its own
+    responder = Blockchain(difficulty=1)
+    for i in range(5):
+        responder.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        responder.mine_block()
+    requester = Blockchain(difficulty=1)
+    requester.chain = responder.chain[:]
+    requester.add_new_transaction(Transaction("voter9", "candidateC"))
+    requester.mine_block()
+    for i in range(5, 8):
+        responder.add_new_transaction(Transaction(f"voter{i}", "candidateB"))
+        responder.mine_block()
+
+    start = responder.find_fork_point(requester.get_locator())
+    assert start == 6, "Responder should find the last shared block"
+    suffix = [block_from_dict(block.to_dict()) for block in responder.chain[start:]]
+    assert len(suffix) == 3, "Only the missing blocks should be sent"
+    assert requester.splice_chain(start, suffix), "Longer valid suffix should be spliced on"
+    assert requester.last_block.hash == responder.last_block.hash, "Chains should converge"
+    assert requester.get_vote_count() == responder.get_vote_count(), "Orphaned vote should be dropped from the tally"
+    assert requester.is_valid_chain(requester.chain), "Spliced chain should be valid"
+
+    # Invalid or short suffixes are refused and leave the chain untouched
+    assert not requester.splice_chain(start, suffix[:1]), "Suffix that is not longer should be rejected"
+    tampered = [block_from_dict(block.to_dict()) for block in responder.chain[start:]]
+    tampered[1].transactions[0].candidate_id = "candidateA"
+    fresh = Blockchain(difficulty=1)
+    fresh.chain = responder.chain[:start]
+    assert not fresh.splice_chain(start, tampered), "Tampered suffix should be rejected"
+    assert len(fresh.chain) == start, "Rejected splice should not change the chain"
+    assert responder.find_fork_point([[3, "f" * 64], ["bad"], [0, responder.chain[0].hash]]) == 1, \
+        "Unknown or malformed locator entries should be skipped"
+
+def test_headers_first_validation():
+    print("=== Test: Header-Only Proof-of-Work and Body Checks ===")
+
+    node = Blockchain(difficulty=2)
+    for i in range(3):
+        node.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        node.add_new_transaction(Transaction(f"voter{i + 10}", "candidateB"))
+        node.mine_block()
+    headers = [block.header_dict() for block in node.chain]
+    assert all(header_hash(header) == block.hash for header, block in zip(headers, node.chain)), \
+        "Header hash should equal the full block hash"
+    assert "transactions" not in headers[1], "Headers should not carry transactions"
+
+    # Headers are checked for position, link and proof-of-work without their bodies
+    syncing = Blockchain(difficulty=2)
+    previous_hash = syncing.chain.hash_at(0)
+    for position, header in enumerate(headers[1:], 1):
+        assert syncing.is_valid_header(header, position, previous_hash), f"Header {position} should be valid"
+        previous_hash = header['hash']
+    assert not syncing.is_valid_header(headers[2], 1, syncing.chain.hash_at(0)), "Header out of place should fail"
+    forged = dict(headers[1], nonce=headers[1]['nonce'] + 1)
+    assert not syncing.is_valid_header(forged, 1, syncing.chain.hash_at(0)), "Header with a wrong nonce should fail"
+    assert not syncing.is_valid_header(dict(headers[1], merkle_root="xyz"), 1, syncing.chain.hash_at(0)), \
+        "Malformed header should fail"
+
+    # A body is accepted only if it matches the header's Merkle root
+    body = node.chain[1].transaction_dicts()
+    block = block_from_header(headers[1], body)
+    assert block is not None and block.hash == headers[1]['hash'], "Matching body should rebuild the block"
+    swapped = [dict(tx, candidate_id="candidateC") for tx in body]
+    assert block_from_header(headers[1], swapped) is None, "Tampered body should be rejected"
+    assert block_from_header(headers[1], body[:1]) is None, "Truncated body should be rejected"
+
+    bodies = [block_from_header(header, block.transaction_dicts()) for header, block in zip(headers[1:], node.chain[1:])]
+    assert syncing.splice_chain(1, bodies), "Blocks rebuilt from headers and bodies should splice"
+    assert syncing.get_vote_count() == node.get_vote_count(), "Synced tally should match"
+
+def test_chain_store_crash_recovery():
+    print("=== Test: On-Disk Chain Store Restart and Crash Recovery ===")
+
+    directory = tempfile.mkdtemp()
+    segment_path = os.path.join(directory, SEGMENT_FILE)
+    index_path = os.path.join(directory, INDEX_FILE)
+    try:
+        node = Blockchain(difficulty=1, store_path=directory)
+        for i in range(6):
+            node.add_new_transaction(Transaction(f"voter{i}", "candidateA" if i % 2 else "candidateB"))
+            node.mine_block()
+        hashes = [block.hash for block in node.chain]
+        node.close()
+
+        # A clean restart picks up the stored chain, tally and voter index
+        node = Blockchain(difficulty=1, store_path=directory)
+        assert [block.hash for block in node.chain] == hashes, "Restart should load the stored chain"
+        assert node.get_vote_count() == {"candidateA": 3, "candidateB": 3}, "Restart should restore the tally"
+        assert node.has_voted("voter5"), "Restart should restore the voter index"
+        assert node.is_valid_chain(node.chain), "Stored chain should be valid"
+        node.close()
+
+        # Crash in the middle of writing the last record: it is cut off
+        os.truncate(segment_path, os.path.getsize(segment_path) - 10)
+        node = Blockchain(difficulty=1, store_path=directory)
+        assert [block.hash for block in node.chain] == hashes[:-1], "Torn last block should be dropped"
+        assert not node.has_voted("voter5"), "Dropped block's vote should not be indexed"
+        node.add_new_transaction(Transaction("voter5", "candidateA"))
+        assert node.mine_block(), "Mining should continue after recovery"
+        hashes = [block.hash for block in node.chain]
+        node.close()
+
+        # Crash after the record but before its index entry was complete: it is re-indexed
+        os.truncate(index_path, os.path.getsize(index_path) - 7)
+        node = Blockchain(difficulty=1, store_path=directory)
+        assert [block.hash for block in node.chain] == hashes, "Intact record should be re-indexed"
+        node.close()
+        os.remove(index_path)
+        store = ChainStore(directory)
+        assert len(store) == len(hashes), "A lost index should be rebuilt from the segment"
+        assert store.hash_at(len(hashes) - 1) == hashes[-1], "Rebuilt index should hold the hashes"
+        store.close()
+
+        # A damaged record fails its CRC and is dropped with everything after it
+        with open(segment_path, "r+b") as segment:
+            segment.seek(-5, os.SEEK_END)
+            segment.write(b"X")
+        node = Blockchain(difficulty=1, store_path=directory)
+        assert [block.hash for block in node.chain] == hashes[:-1], "Corrupt last block should be dropped"
+        assert node.is_valid_chain(node.chain), "Recovered chain should be valid"
+
+        # Chain replacement rewrites only the changed tail on disk
+        fork = Blockchain(difficulty=1)
+        fork.chain = node.chain[:3]
+        for i in range(10, 15):
+            fork.add_new_transaction(Transaction(f"voter{i}", "candidateC"))
+            fork.mine_block()
+        node.replace_chain(fork.chain)
+        node.close()
+        node = Blockchain(difficulty=1, store_path=directory)
+        assert node.chain.hash_at(-1) == fork.chain.hash_at(-1), "Replaced chain should be stored"
+        assert node.get_vote_count() == fork.get_vote_count(), "Stored tally should follow the replacement"
+        node.close()
+    finally:
+        shutil.rmtree(directory)
+
+def test_tally_snapshots():
+    print("=== Test: Tally Snapshots for Fast Restart ===")
+
+    directory = tempfile.mkdtemp()
+    try:
+        node = Blockchain(difficulty=1, store_path=directory, snapshot_interval=4)
+        for i in range(10):
+            node.add_new_transaction(Transaction(f"voter{i}", "candidateA" if i % 3 else "candidateB"))
+            node.mine_block()
+        tally = node.get_vote_count()
+        node.flush()  # Simulate a crash: no snapshot at the tip
+
+        # Snapshots at heights 8 and 4 (only the newest KEEP_SNAPSHOTS are kept)
+        assert sorted(f for f in os.listdir(directory) if f.endswith(".snap")) == \
+            ["snapshot-000000000004.snap", "snapshot-000000000008.snap"], "Snapshots should be taken every 4 blocks"
+
+        # Restart loads the newest snapshot and replays only the blocks after it
+        restarted = Blockchain(difficulty=1, store_path=directory, snapshot_interval=4)
+        assert restarted.chain.replayed_blocks == 3, "Only blocks 8-10 should be replayed"
+        assert restarted.get_vote_count() == tally, "Snapshot tally should match the chain"
+        assert restarted.has_voted("voter0") and restarted.has_voted("voter9"), "Voter index should be restored"
+        assert not restarted.add_new_transaction(Transaction("voter2", "candidateB")), \
+            "Voters from the snapshot should still be rejected"
+        restarted.close()
+        assert Blockchain(difficulty=1, store_path=directory, snapshot_interval=4).chain.replayed_blocks == 0, \
+            "A clean close should snapshot the tip"
+
+        # A corrupted snapshot is detected and the next older one is used
+        newest = os.path.join(directory, "snapshot-000000000011.snap")
+        with open(newest, "r+b") as snapshot:
+            snapshot.seek(-3, os.SEEK_END)
+            snapshot.write(b"X")
+        restarted = Blockchain(difficulty=1, store_path=directory, snapshot_interval=4)
+        assert restarted.chain.replayed_blocks == 3, "Damaged snapshot should be skipped for the older one"
+        assert restarted.get_vote_count() == tally, "Tally should be rebuilt past the damaged snapshot"
+
+        # A snapshot that no longer matches the chain (after a fork) is not used
+        with open(os.path.join(directory, "snapshot-000000000008.snap"), "rb") as snapshot:
+            old_snapshot = snapshot.read()
+        fork = Blockchain(difficulty=1)
+        fork.chain = restarted.chain[:6]
+        for i in range(20, 27):
+            fork.add_new_transaction(Transaction(f"voter{i}", "candidateC"))
+            fork.mine_block()
+        restarted.replace_chain(fork.chain)
+        restarted.flush()
+        assert restarted.get_vote_count() == fork.get_vote_count(), "Tally should follow the fork"
+        with open(os.path.join(directory, "snapshot-000000000013.snap"), "wb") as stale:
+            stale.write(old_snapshot)  # Intact, but its tip is on the abandoned branch
+        reopened = Blockchain(difficulty=1, store_path=directory, snapshot_interval=4)
+        assert reopened.get_vote_count() == fork.get_vote_count(), "Mismatched snapshot should be skipped"
+        assert reopened.chain.replayed_blocks == 1, "Newest matching snapshot is at height 12"
+        reopened.close()
+    finally:
+        shutil.rmtree(directory)
+
 if __name__ == "__main__":
     print("===== Running Blockchain Tests with Network Simulation =====")
     test_single_block_propagation_and_fork_resolution()
     test_malicious_block_addition()
     test_malicious_chain_addition()
     test_successful_single_block_propagation()
+    test_midstate_pow_matches_compute_hash()
+    test_parallel_mining()
+    test_cancelled_mining_keeps_transactions()
+    test_lazy_block_hashing()
+    test_compact_chain_round_trip()
+    test_mempool_batching()
+    test_merkle_root_headers()
+    test_incremental_vote_tally()
+    test_double_vote_rejection()
+    test_validated_block_cache()
+    test_locator_sync()
+    test_headers_first_validation()
+    test_chain_store_crash_recovery()
+    test_tally_snapshots()
     print("\nAll tests completed successfully.")
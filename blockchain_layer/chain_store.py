@@ -0,0 +1,378 @@
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from .block import Block
+from .transaction import Transaction
+from .snapshot import SNAPSHOT_INTERVAL, write_snapshot, load_latest_snapshot, discard_snapshots_above
+
+SEGMENT_FILE = "blocks.seg"
+INDEX_FILE = "blocks.idx"
+
+# Segment record: payload length, CRC-32 of the payload | JSON-encoded block
+_RECORD_HEADER = struct.Struct('>II')
+# Index entry: record offset, raw 32-byte hash, 1 if the hash is 64-char hex (else read it from the record)
+_INDEX_ENTRY = struct.Struct('>Q32sB')
+
+SYNC_EVERY = 64  # Appends between fsyncs
+SYNC_INTERVAL = 1.0  # Seconds after which pending appends are fsynced anyway
+
+
+class _MappedFile:
+    """A file read through mmap, re-mapped when it has grown past the mapped length."""
+
+    def __init__(self, fd):
+        self._fd = fd
+        self._map = None
+
+    def read(self, offset, size):
+        if self._map is None or offset + size > len(self._map):
+            self.close()
+            length = os.fstat(self._fd).st_size
+            if offset + size > length:
+                raise EOFError("read past end of file")
+            self._map = mmap.mmap(self._fd, length, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + size]
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class ChainStore:
+    """
+    Durable, append-only storage for the blocks of a chain.
+
+    Blocks are appended to a segment file as length- and CRC-framed JSON records.
+    A separate index file holds one fixed-size entry per block (record offset and
+    hash), so any block or hash is found in O(1). Both files are read through mmap,
+    so opening a store does not read the blocks. Appends are fsynced in batches
+    (every SYNC_EVERY blocks or SYNC_INTERVAL seconds, and on flush/close).
+
+    On open, a torn or corrupt tail left by a crash is cut off: index entries that
+    point past the last intact record are dropped, and intact records missing from
+    the index are re-indexed.
+
+    Usage:
+        store = ChainStore("data/peer1")
+        store.append(block)
+        block_dict = store.read(0)
+        store.close()
+    """
+
+    def __init__(self, directory, sync_every=SYNC_EVERY, sync_interval=SYNC_INTERVAL):
+        """
+        Args:
+            directory (str): Directory holding the segment and index files; created if missing.
+            sync_every (int): Appends between fsyncs.
+            sync_interval (float): Seconds after which pending appends are fsynced.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._segment_fd = os.open(os.path.join(directory, SEGMENT_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._index_fd = os.open(os.path.join(directory, INDEX_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+        self._segment = _MappedFile(self._segment_fd)
+        self._index = _MappedFile(self._index_fd)
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._recover()
+
+    def __len__(self):
+        return self._count
+
+    def _recover(self):
+        """Cut the files back to the last intact record and index any record the index is missing."""
+        segment_size = os.fstat(self._segment_fd).st_size
+        count = os.fstat(self._index_fd).st_size // _INDEX_ENTRY.size
+
+        # Drop index entries whose record is missing or damaged
+        end = 0
+        while count:
+            offset = self._entry(count - 1)[0]
+            record_end = self._check_record(offset, segment_size)
+            if record_end is not None:
+                end = record_end
+                break
+            count -= 1
+
+        # Re-index intact records written after the last index entry
+        self._count = count
+        self._segment_size = end
+        new_entries = []
+        while True:
+            record_end = self._check_record(end, segment_size)
+            if record_end is None:
+                break
+            payload = self._segment.read(end + _RECORD_HEADER.size, record_end - end - _RECORD_HEADER.size)
+            new_entries.append(_index_entry(end, json.loads(payload)['hash']))
+            end = record_end
+
+        if end < segment_size:
+            print(f"[ChainStore] Dropping {segment_size - end} bytes of incomplete records from {self.directory}")
+        self._segment.close()
+        self._index.close()
+        os.ftruncate(self._segment_fd, end)
+        os.ftruncate(self._index_fd, count * _INDEX_ENTRY.size)
+        self._segment_size = end
+        for entry in new_entries:
+            os.pwrite(self._index_fd, entry, self._count * _INDEX_ENTRY.size)
+            self._count += 1
+        self.flush()
+
+    def _check_record(self, offset, segment_size):
+        """Return the end offset of the record at offset if it is complete and its CRC matches, else None."""
+        if offset + _RECORD_HEADER.size > segment_size:
+            return None
+        length, crc = _RECORD_HEADER.unpack(self._segment.read(offset, _RECORD_HEADER.size))
+        end = offset + _RECORD_HEADER.size + length
+        if end > segment_size:
+            return None
+        if zlib.crc32(self._segment.read(offset + _RECORD_HEADER.size, length)) != crc:
+            return None
+        return end
+
+    def _entry(self, position):
+        return _INDEX_ENTRY.unpack(self._index.read(position * _INDEX_ENTRY.size, _INDEX_ENTRY.size))
+
+    def append(self, block):
+        """
+        Append a block; it is durable after the next fsync.
+
+        Args:
+            block (Block): The block to store.
+        """
+        payload = json.dumps(block.to_dict(), separators=(',', ':')).encode()
+        record = _RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            # Record first, then its index entry: a crash in between is repaired by _recover
+            os.pwrite(self._segment_fd, record, self._segment_size)
+            os.pwrite(self._index_fd, _index_entry(self._segment_size, block.hash), self._count * _INDEX_ENTRY.size)
+            self._segment_size += len(record)
+            self._count += 1
+            self._unsynced += 1
+            if self._unsynced >= self.sync_every or time.monotonic() - self._last_sync >= self.sync_interval:
+                self.flush()
+
+    def read(self, position):
+        """
+        Read one block record.
+
+        Args:
+            position (int): Chain position of the block.
+
+        Returns:
+            dict: The block as produced by Block.to_dict().
+        """
+        with self._lock:
+            if not 0 <= position < self._count:
+                raise IndexError("chain index out of range")
+            offset = self._entry(position)[0]
+            length, _ = _RECORD_HEADER.unpack(self._segment.read(offset, _RECORD_HEADER.size))
+            return json.loads(self._segment.read(offset + _RECORD_HEADER.size, length))
+
+    def hash_at(self, position):
+        """Return a block's hash from the index without reading the block."""
+        with self._lock:
+            if not 0 <= position < self._count:
+                raise IndexError("chain index out of range")
+            _, digest, is_hex = self._entry(position)
+        return digest.hex() if is_hex else self.read(position)['hash']
+
+    def truncate(self, length):
+        """
+        Drop every block from position `length` onwards.
+
+        Args:
+            length (int): Number of blocks to keep.
+        """
+        with self._lock:
+            if length >= self._count:
+                return
+            offset = self._entry(length)[0]
+            self._segment.close()
+            self._index.close()
+            os.ftruncate(self._index_fd, length * _INDEX_ENTRY.size)
+            os.ftruncate(self._segment_fd, offset)
+            self._segment_size = offset
+            self._count = length
+            self.flush()
+
+    def flush(self):
+        """fsync pending appends to disk."""
+        with self._lock:
+            os.fsync(self._segment_fd)
+            os.fsync(self._index_fd)
+            self._unsynced = 0
+            self._last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._segment.close()
+            self._index.close()
+            os.close(self._segment_fd)
+            os.close(self._index_fd)
+
+
+def _index_entry(offset, block_hash):
+    digest = None
+    if type(block_hash) is str and len(block_hash) == 64:
+        try:
+            digest = bytes.fromhex(block_hash)
+        except ValueError:
+            pass
+        if digest is not None and digest.hex() != block_hash:
+            digest = None
+    if digest is None:
+        return _INDEX_ENTRY.pack(offset, bytes(32), 0)
+    return _INDEX_ENTRY.pack(offset, digest, 1)
+
+
+def block_from_record(record):
+    """Rebuild a Block from a record returned by ChainStore.read."""
+    transactions = [Transaction(tx['voter_id'], tx['candidate_id'], tx['timestamp'])
+                    for tx in record['transactions']]
+    block = Block(record['index'], transactions, record['timestamp'], record['previous_hash'], record['nonce'])
+    block.hash = record['hash']
+    return block
+
+
+class StoredChain:
+    """
+    A chain whose blocks live in a ChainStore instead of memory.
+
+    It offers the same interface as CompactChain (len, indexing, slicing, iteration,
+    append, truncate, hash_at, previous_hash_at, vote_count, voter_block), so a
+    Blockchain can use either. Only the vote tally and the voter index are kept in
+    memory. Every snapshot_interval blocks they are written to a snapshot file; when
+    the chain is opened they are loaded from the newest snapshot that matches the
+    stored chain, and only the blocks after it are replayed.
+
+    Usage:
+        chain = StoredChain(ChainStore("data/peer1"))
+        chain.append(block)
+        print(chain[-1].hash)
+    """
+
+    def __init__(self, store, snapshot_interval=SNAPSHOT_INTERVAL):
+        """
+        Args:
+            store (ChainStore): The block store.
+            snapshot_interval (int): Blocks between tally snapshots; 0 disables snapshots.
+        """
+        self.store = store
+        self.snapshot_interval = snapshot_interval
+        self._vote_counts = {}  # candidate_id -> votes outside the genesis block
+        self._voter_blocks = {}  # voter_id -> position of the first block holding their vote
+
+        replay_from = 0
+        state = load_latest_snapshot(store.directory, self._matches_store) if snapshot_interval else None
+        if state is not None:
+            self._vote_counts = state['vote_counts']
+            self._voter_blocks = state['voter_blocks']
+            replay_from = state['height']
+        self.replayed_blocks = len(store) - replay_from
+        for position in range(replay_from, len(store)):
+            self._index_block(position, store.read(position))
+        self._schedule_snapshot()
+
+    def __len__(self):
+        return len(self.store)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield block_from_record(self.store.read(position))
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [block_from_record(self.store.read(i)) for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        return block_from_record(self.store.read(position))
+
+    def append(self, block):
+        """
+        Store a block at the end of the chain.
+
+        Args:
+            block (Block): The block to store.
+        """
+        position = len(self.store)
+        self.store.append(block)
+        self._index_block(position, block.to_dict())
+        if self.snapshot_interval and len(self.store) >= self._next_snapshot:
+            self.save_snapshot()
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def truncate(self, length):
+        """
+        Drop every block from position `length` onwards.
+
+        Args:
+            length (int): Number of blocks to keep.
+        """
+        for position in range(max(length, 0), len(self.store)):
+            self._unindex_block(position, self.store.read(position), length)
+        self.store.truncate(length)
+        discard_snapshots_above(self.store.directory, len(self.store))
+        self._schedule_snapshot()
+
+    def save_snapshot(self):
+        """Flush the store and write a snapshot of the tally and voter index at the current tip."""
+        self._schedule_snapshot()
+        if not len(self.store):
+            return
+        # The blocks must be durable before a snapshot that covers them
+        self.store.flush()
+        write_snapshot(self.store.directory, len(self.store), self.store.hash_at(len(self.store) - 1),
+                       self._vote_counts, self._voter_blocks)
+
+    def _schedule_snapshot(self):
+        interval = self.snapshot_interval or 1
+        self._next_snapshot = (len(self.store) // interval + 1) * interval
+
+    def _matches_store(self, height, tip_hash):
+        return 0 < height <= len(self.store) and self.store.hash_at(height - 1) == tip_hash
+
+    def vote_count(self):
+        """Return the running vote tally (candidate_id -> votes), skipping the genesis block."""
+        return {candidate_id: count for candidate_id, count in self._vote_counts.items() if count}
+
+    def voter_block(self, voter_id):
+        """Return the position of the block with the voter's first vote, or None."""
+        return self._voter_blocks.get(voter_id)
+
+    def hash_at(self, position):
+        """Return the stored hash of a block without building the Block."""
+        if position < 0:
+            position += len(self)
+        return self.store.hash_at(position)
+
+    def previous_hash_at(self, position):
+        """Return the stored previous_hash of a block without building the Block."""
+        if position < 0:
+            position += len(self)
+        return self.store.read(position)['previous_hash']
+
+    def _index_block(self, position, record):
+        for tx in record['transactions']:
+            self._voter_blocks.setdefault(tx['voter_id'], position)
+            if position:
+                self._vote_counts[tx['candidate_id']] = self._vote_counts.get(tx['candidate_id'], 0) + 1
+
+    def _unindex_block(self, position, record, length):
+        for tx in record['transactions']:
+            if self._voter_blocks.get(tx['voter_id'], -1) >= length:
+                del self._voter_blocks[tx['voter_id']]
+            if position:
+                self._vote_counts[tx['candidate_id']] -= 1
@@ -0,0 +1,286 @@
+import sys
+from array import array
+from .block import Block
+from .transaction import Transaction
+
+TIP_CACHE_SIZE = 8  # Rebuilt blocks kept for the positions nearest the tip
+
+
+class _IntColumn:
+    """
+    Column of integers packed into an array.array. Values that do not fit the
+    array type (e.g. a malformed nonce received from a peer) are kept in a side dict.
+    """
+    __slots__ = ('_values', '_overflow', '_typecode')
+
+    def __init__(self, typecode):
+        self._typecode = typecode
+        self._values = array(typecode)
+        self._overflow = {}
+
+    def __len__(self):
+        return len(self._values)
+
+    def append(self, value):
+        if type(value) is int:
+            try:
+                self._values.append(value)
+                return
+            except OverflowError:
+                pass
+        self._overflow[len(self._values)] = value
+        self._values.append(0)
+
+    def __getitem__(self, position):
+        if self._overflow and position in self._overflow:
+            return self._overflow[position]
+        return self._values[position]
+
+    def truncate(self, length):
+        del self._values[length:]
+        for position in [p for p in self._overflow if p >= length]:
+            del self._overflow[position]
+
+    def nbytes(self):
+        return self._values.itemsize * len(self._values)
+
+
+class _HashColumn:
+    """
+    Column of 64-char lowercase hex hashes stored as 32 raw bytes each in one
+    bytearray. Any other value (the genesis "0", a tampered hash) goes to a side dict.
+    """
+    __slots__ = ('_digests', '_overflow')
+
+    DIGEST_SIZE = 32
+
+    def __init__(self):
+        self._digests = bytearray()
+        self._overflow = {}
+
+    def __len__(self):
+        return len(self._digests) // self.DIGEST_SIZE
+
+    def append(self, value):
+        digest = None
+        if type(value) is str and len(value) == 2 * self.DIGEST_SIZE:
+            try:
+                digest = bytes.fromhex(value)
+            except ValueError:
+                pass
+            if digest is not None and digest.hex() != value:
+                digest = None  # upper-case hex would not round-trip
+        if digest is None:
+            self._overflow[len(self)] = value
+            digest = bytes(self.DIGEST_SIZE)
+        self._digests += digest
+
+    def __getitem__(self, position):
+        if self._overflow and position in self._overflow:
+            return self._overflow[position]
+        start = position * self.DIGEST_SIZE
+        return self._digests[start:start + self.DIGEST_SIZE].hex()
+
+    def truncate(self, length):
+        del self._digests[length * self.DIGEST_SIZE:]
+        for position in [p for p in self._overflow if p >= length]:
+            del self._overflow[position]
+
+    def nbytes(self):
+        return len(self._digests)
+
+
+class CompactChain:
+    """
+    A column-oriented store for the blocks of a chain.
+
+    Instead of keeping one Block (and one Transaction per vote) alive per block,
+    every field lives in its own column: indices and nonces in array.array columns,
+    hashes as raw 32-byte digests in a bytearray, candidate IDs interned into small
+    integer codes, and repeated strings (timestamps) shared through sys.intern.
+    A running vote count per candidate and an index of which block holds each
+    voter's vote are updated as blocks are appended or truncated.
+
+    It supports the read API the rest of the code uses on a list of blocks:
+    len(chain), chain[i], chain[-1], slicing and iteration. Indexing builds a Block
+    on demand. The last TIP_CACHE_SIZE blocks built are kept, so repeated reads of
+    the tip return the same Block with its memoized hash and encodings; treat
+    returned blocks as read-only. Slicing and iteration always build new blocks.
+
+    Usage:
+        chain = CompactChain([genesis_block])
+        chain.append(block)
+        print(chain[-1].hash)
+    """
+    __slots__ = ('_indices', '_nonces', '_hashes', '_previous_hashes', '_timestamps',
+                 '_tx_offsets', '_voter_ids', '_candidate_codes', '_tx_timestamps',
+                 '_candidates', '_candidate_codes_by_id', '_vote_counts', '_voter_blocks',
+                 '_tip_blocks', '_truncations')
+
+    def __init__(self, blocks=()):
+        self._indices = _IntColumn('q')
+        self._nonces = _IntColumn('Q')
+        self._hashes = _HashColumn()
+        self._previous_hashes = _HashColumn()
+        self._timestamps = []
+        self._tx_offsets = array('Q', [0])  # block i owns transactions [offsets[i], offsets[i + 1])
+        self._voter_ids = []
+        self._candidate_codes = array('I')
+        self._tx_timestamps = []
+        self._candidates = []  # code -> candidate_id
+        self._candidate_codes_by_id = {}  # candidate_id -> code
+        self._vote_counts = array('Q')  # code -> votes outside the genesis block
+        self._voter_blocks = {}  # voter_id -> position of the first block holding their vote
+        self._tip_blocks = {}  # position -> Block built for one of the last TIP_CACHE_SIZE positions
+        self._truncations = 0  # bumped by truncate so a block built before it is not cached
+        for block in blocks:
+            self.append(block)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._block_at(position)
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._block_at(i) for i in range(*position.indices(len(self)))]
+        length = len(self)
+        if position < 0:
+            position += length
+        if not 0 <= position < length:
+            raise IndexError("chain index out of range")
+        block = self._tip_blocks.get(position)
+        if block is None:
+            truncations = self._truncations
+            block = self._block_at(position)
+            if position >= length - TIP_CACHE_SIZE and truncations == self._truncations:
+                self._tip_blocks[position] = block
+        return block
+
+    def append(self, block):
+        """
+        Store a block at the end of the chain.
+
+        Args:
+            block (Block): The block to store. Its hash is read once here.
+        """
+        self._indices.append(block.index)
+        self._nonces.append(block.nonce)
+        self._hashes.append(block.hash)
+        self._previous_hashes.append(block.previous_hash)
+        position = len(self._timestamps)
+        is_genesis = not position
+        self._timestamps.append(_intern(block.timestamp))
+        for tx in block.transactions:
+            code = self._candidate_code(tx.candidate_id)
+            self._voter_ids.append(tx.voter_id)
+            self._voter_blocks.setdefault(tx.voter_id, position)
+            self._candidate_codes.append(code)
+            self._tx_timestamps.append(_intern(tx.timestamp))
+            if not is_genesis:
+                self._vote_counts[code] += 1
+        self._tx_offsets.append(len(self._voter_ids))
+        self._tip_blocks.pop(position - TIP_CACHE_SIZE, None)
+
+    def extend(self, blocks):
+        for block in blocks:
+            self.append(block)
+
+    def truncate(self, length):
+        """
+        Drop every block from position `length` onwards.
+
+        Args:
+            length (int): Number of blocks to keep.
+        """
+        if length >= len(self):
+            return
+        self._truncations += 1
+        for position in [p for p in self._tip_blocks if p >= length]:
+            del self._tip_blocks[position]
+        tx_end = self._tx_offsets[length]
+        for i in range(max(tx_end, self._tx_offsets[1]), len(self._candidate_codes)):
+            self._vote_counts[self._candidate_codes[i]] -= 1
+        for voter_id in self._voter_ids[tx_end:]:
+            if self._voter_blocks.get(voter_id, -1) >= length:
+                del self._voter_blocks[voter_id]
+        self._indices.truncate(length)
+        self._nonces.truncate(length)
+        self._hashes.truncate(length)
+        self._previous_hashes.truncate(length)
+        del self._timestamps[length:]
+        del self._tx_offsets[length + 1:]
+        del self._voter_ids[tx_end:]
+        del self._candidate_codes[tx_end:]
+        del self._tx_timestamps[tx_end:]
+
+    def vote_count(self):
+        """
+        Return the running vote tally, skipping the genesis block.
+        Costs O(candidates), not O(chain length).
+
+        Returns:
+            dict: candidate_id -> number of votes.
+        """
+        return {self._candidates[code]: count for code, count in enumerate(self._vote_counts) if count}
+
+    def voter_block(self, voter_id):
+        """
+        Look up the block holding a voter's vote in O(1).
+
+        Args:
+            voter_id (str): The voter to look up.
+
+        Returns:
+            int: Position of the block with the voter's first vote, or None if they have not voted.
+        """
+        return self._voter_blocks.get(voter_id)
+
+    def hash_at(self, position):
+        """Return the stored hash of a block without building the Block."""
+        if position < 0:
+            position += len(self)
+        return self._hashes[position]
+
+    def previous_hash_at(self, position):
+        """Return the stored previous_hash of a block without building the Block."""
+        if position < 0:
+            position += len(self)
+        return self._previous_hashes[position]
+
+    def nbytes(self):
+        """Approximate bytes held by the packed columns (excluding shared strings)."""
+        return (self._indices.nbytes() + self._nonces.nbytes() + self._hashes.nbytes()
+                + self._previous_hashes.nbytes() + self._tx_offsets.itemsize * len(self._tx_offsets)
+                + self._candidate_codes.itemsize * len(self._candidate_codes))
+
+    def _candidate_code(self, candidate_id):
+        code = self._candidate_codes_by_id.get(candidate_id)
+        if code is None:
+            code = len(self._candidates)
+            self._candidates.append(candidate_id)
+            self._candidate_codes_by_id[candidate_id] = code
+            self._vote_counts.append(0)
+        return code
+
+    def _block_at(self, position):
+        transactions = [
+            Transaction(self._voter_ids[i], self._candidates[self._candidate_codes[i]], self._tx_timestamps[i])
+            for i in range(self._tx_offsets[position], self._tx_offsets[position + 1])
+        ]
+        block = Block(
+            index=self._indices[position],
+            transactions=transactions,
+            timestamp=self._timestamps[position],
+            previous_hash=self._previous_hashes[position],
+            nonce=self._nonces[position]
+        )
+        block.hash = self._hashes[position]
+        return block
+
+
+def _intern(value):
+    """Share repeated strings such as timestamps between blocks."""
+    return sys.intern(value) if type(value) is str else value
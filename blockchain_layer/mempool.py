@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class Mempool:
+    """
+    A bounded, thread-safe pool of transactions waiting to be mined.
+
+    Transactions are kept in arrival order and deduplicated by voter ID: a voter
+    cannot have two votes pending at once, including votes that have been handed
+    to the miner but not yet confirmed in a block.
+
+    Attributes:
+        max_size (int): Maximum number of pending transactions; further adds are rejected.
+
+    Usage:
+        mempool = Mempool(max_size=1000)
+        mempool.add(Transaction("voter1", "A"))
+        batch = mempool.take_batch(max_transactions=50, max_wait=0.5)
+        # ... mine the batch ...
+        mempool.confirm(batch)  # or mempool.requeue(batch) if mining was abandoned
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._pending = OrderedDict()  # voter_id -> (transaction, arrival time)
+        self._in_flight = {}  # voter_id -> arrival time, for batches taken but not yet confirmed
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def add(self, transaction):
+        """
+        Add a transaction to the pool.
+
+        Args:
+            transaction (Transaction): The transaction to add.
+
+        Returns:
+            bool: True if added, False if the pool is full or the voter already has a pending vote.
+        """
+        with self._condition:
+            voter_id = transaction.voter_id
+            if voter_id in self._pending or voter_id in self._in_flight:
+                return False
+            if len(self._pending) >= self.max_size:
+                return False
+            self._pending[voter_id] = (transaction, time.monotonic())
+            self._condition.notify_all()
+            return True
+
+    def take_batch(self, max_transactions, max_wait, timeout=None):
+        """
+        Remove and return the next batch of transactions for a block.
+
+        Blocks until at least one transaction is pending, then returns as soon as
+        max_transactions are pending or the oldest one has waited max_wait seconds.
+
+        Args:
+            max_transactions (int): Largest batch to return.
+            max_wait (float): Seconds the oldest pending transaction may wait for the batch to fill.
+            timeout (float): Seconds to wait for the first transaction, or None to wait forever.
+
+        Returns:
+            list: Transactions in arrival order (empty if the timeout expired first).
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._pending, timeout):
+                return []
+
+            while len(self._pending) < max_transactions:
+                _, oldest_arrival = next(iter(self._pending.values()))
+                remaining = oldest_arrival + max_wait - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            batch = []
+            while self._pending and len(batch) < max_transactions:
+                voter_id, (transaction, arrival) = self._pending.popitem(last=False)
+                self._in_flight[voter_id] = arrival
+                batch.append(transaction)
+            return batch
+
+    def confirm(self, transactions):
+        """
+        Release transactions that were mined into a block (or confirmed by a peer's block).
+
+        Args:
+            transactions (list): Transactions to forget.
+        """
+        with self._condition:
+            for transaction in transactions:
+                self._in_flight.pop(transaction.voter_id, None)
+                self._pending.pop(transaction.voter_id, None)
+
+    def requeue(self, transactions):
+        """
+        Put a batch that could not be mined back at the front of the pool,
+        keeping the transactions' original arrival times.
+
+        Args:
+            transactions (list): Transactions previously returned by take_batch.
+        """
+        with self._condition:
+            now = time.monotonic()
+            for transaction in reversed(transactions):
+                arrival = self._in_flight.pop(transaction.voter_id, now)
+                self._pending[transaction.voter_id] = (transaction, arrival)
+                self._pending.move_to_end(transaction.voter_id, last=False)
+            self._condition.notify_all()
@@ -0,0 +1,93 @@
+import hashlib
+
+# Domain-separation prefixes so a leaf can never be mistaken for an inner node
+_LEAF_PREFIX = b"\x00"
+_NODE_PREFIX = b"\x01"
+
+EMPTY_ROOT = hashlib.sha256(b"").digest()
+
+
+def leaf_hash(data):
+    """
+    Hash one leaf (an encoded transaction) of a Merkle tree.
+
+    Args:
+        data (bytes): Canonical encoding of the leaf.
+
+    Returns:
+        bytes: 32-byte digest.
+    """
+    return hashlib.sha256(_LEAF_PREFIX + data).digest()
+
+
+def _node_hash(left, right):
+    return hashlib.sha256(_NODE_PREFIX + left + right).digest()
+
+
+def merkle_root(leaves):
+    """
+    Compute the Merkle root of a list of leaf hashes.
+
+    Pairs are hashed level by level; an odd node at the end of a level is carried
+    up unchanged rather than duplicated, so [a, b, c] and [a, b, c, c] differ.
+
+    Args:
+        leaves (list): Leaf digests from leaf_hash().
+
+    Returns:
+        bytes: 32-byte root (EMPTY_ROOT for no leaves).
+    """
+    if not leaves:
+        return EMPTY_ROOT
+    level = list(leaves)
+    while len(level) > 1:
+        next_level = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+    return level[0]
+
+
+def merkle_proof(leaves, position):
+    """
+    Build an inclusion proof for the leaf at `position`.
+
+    Args:
+        leaves (list): Leaf digests from leaf_hash().
+        position (int): Index of the leaf to prove.
+
+    Returns:
+        list: (sibling digest, sibling_is_left) pairs from the leaf up to the root.
+    """
+    if not 0 <= position < len(leaves):
+        raise IndexError("leaf position out of range")
+    proof = []
+    level = list(leaves)
+    while len(level) > 1:
+        sibling = position ^ 1
+        if sibling < len(level):
+            proof.append((level[sibling], sibling < position))
+        next_level = [_node_hash(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            next_level.append(level[-1])
+        level = next_level
+        position //= 2
+    return proof
+
+
+def verify_merkle_proof(leaf, proof, root):
+    """
+    Check that a leaf is included under a Merkle root without the other leaves.
+
+    Args:
+        leaf (bytes): Digest from leaf_hash().
+        proof (list): Pairs returned by merkle_proof().
+        root (bytes): Expected root, e.g. bytes.fromhex(block.merkle_root).
+
+    Returns:
+        bool: True if the proof links the leaf to the root.
+    """
+    node = leaf
+    for sibling, sibling_is_left in proof:
+        node = _node_hash(sibling, node) if sibling_is_left else _node_hash(node, sibling)
+    return node == root
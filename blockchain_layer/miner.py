@@ -0,0 +1,168 @@
+import hashlib
+import multiprocessing
+import struct
+import threading
+
+# Nonces tried between checks of a cancellation flag
+CANCEL_CHECK_INTERVAL = 4096
+
+# Must match the nonce encoding in Block.compute_hash
+_NONCE = struct.Struct('>Q')
+
+
+def search_nonce(prefix, difficulty, start=0, stop=None, cancel_event=None):
+    """
+    Search nonces in [start, stop) for a hash of prefix + nonce (8 bytes, big-endian)
+    that satisfies the difficulty.
+
+    The prefix is hashed once and its midstate copied for every attempt, so each
+    nonce only costs the 8 nonce bytes regardless of how many transactions the block holds.
+
+    Args:
+        prefix (bytes): Block header bytes before the nonce (see Block.header_prefix).
+        difficulty (int): Number of leading zero hex digits required.
+        start (int): First nonce to try.
+        stop (int): Nonce to stop before, or None to search without bound.
+        cancel_event (threading.Event): Optional flag checked every CANCEL_CHECK_INTERVAL nonces.
+
+    Returns:
+        tuple: (nonce, hex hash) of the first valid nonce, or None if the range is
+        exhausted or the search was cancelled.
+    """
+    midstate = hashlib.sha256(prefix)
+    pack_nonce = _NONCE.pack
+    zero_bytes, half = divmod(difficulty, 2)
+    zeros = bytes(zero_bytes)
+
+    nonce = start
+    while stop is None or nonce < stop:
+        if cancel_event is not None and cancel_event.is_set():
+            return None
+        batch_end = nonce + CANCEL_CHECK_INTERVAL
+        if stop is not None:
+            batch_end = min(batch_end, stop)
+        for candidate in range(nonce, batch_end):
+            attempt = midstate.copy()
+            attempt.update(pack_nonce(candidate))
+            digest = attempt.digest()
+            if digest[:zero_bytes] == zeros and (not half or digest[zero_bytes] < 16):
+                return candidate, attempt.hexdigest()
+        nonce = batch_end
+    return None
+
+
+# Nonces handed to a worker at a time; workers check the stop flag between chunks
+NONCE_CHUNK_SIZE = 20000
+
+_stop_event = None
+
+
+def _init_worker(stop_event):
+    """Pool initializer: share the stop flag with the worker process."""
+    global _stop_event
+    _stop_event = stop_event
+
+
+def _search_partition(prefix, difficulty, worker_id, workers, chunk_size):
+    """
+    Search the chunks worker_id, worker_id + workers, worker_id + 2 * workers, ...
+    until a valid nonce is found here or by another worker.
+    """
+    chunk = worker_id
+    while not _stop_event.is_set():
+        start = chunk * chunk_size
+        result = search_nonce(prefix, difficulty, start, start + chunk_size)
+        if result is not None:
+            _stop_event.set()
+            return result
+        chunk += workers
+    return None
+
+
+class MinerPool:
+    """
+    Proof-of-work worker processes, started on the first search and reused for every
+    block after it, so mining a block does not pay for forking a new pool. Searches
+    split the nonce space into fixed-size chunks; the first worker to find a valid
+    nonce stops the rest. One search runs at a time.
+
+    Usage:
+        pool = MinerPool(4)
+        nonce, block_hash = pool.search(block.header_prefix(), difficulty, cancel_event=event)
+        pool.close()
+    """
+
+    def __init__(self, workers):
+        """
+        Args:
+            workers (int): Number of worker processes.
+        """
+        self.workers = workers
+        self.stop_event = multiprocessing.Event()  # Shared with the workers, cleared before each search
+        self.pool = None  # Started by the first search
+        self.lock = threading.Lock()
+
+    def search(self, prefix, difficulty, chunk_size=NONCE_CHUNK_SIZE, cancel_event=None):
+        """
+        Search the nonce space across the worker processes.
+
+        Args:
+            prefix (bytes): Block header bytes before the nonce.
+            difficulty (int): Number of leading zero hex digits required.
+            chunk_size (int): Nonces per chunk.
+            cancel_event (threading.Event): Optional flag that stops all workers when set.
+
+        Returns:
+            tuple: (nonce, hex hash), or None if cancelled or the pool was closed. If
+            several workers finish at once the lowest nonce wins.
+        """
+        with self.lock:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                                 initargs=(self.stop_event,))
+            self.stop_event.clear()
+            pending = [
+                self.pool.apply_async(_search_partition, (prefix, difficulty, worker_id, self.workers, chunk_size))
+                for worker_id in range(self.workers)
+            ]
+            for result in pending:
+                while not result.ready():
+                    if cancel_event is not None and cancel_event.is_set():
+                        self.stop_event.set()
+                    result.wait(0.05)
+            results = [result.get() for result in pending]
+
+        found = [result for result in results if result is not None]
+        return min(found) if found else None
+
+    def close(self):
+        """Stop a running search and shut the worker processes down. A later search starts a new pool."""
+        self.stop_event.set()
+        with self.lock:
+            if self.pool is not None:
+                self.pool.terminate()
+                self.pool.join()
+                self.pool = None
+
+
+def parallel_search_nonce(prefix, difficulty, workers, chunk_size=NONCE_CHUNK_SIZE, cancel_event=None):
+    """
+    Search the nonce space once across a MinerPool of its own, started and shut down
+    for this call. Use a MinerPool directly to mine several blocks.
+
+    Args:
+        prefix (bytes): Block header bytes before the nonce.
+        difficulty (int): Number of leading zero hex digits required.
+        workers (int): Number of worker processes.
+        chunk_size (int): Nonces per chunk.
+        cancel_event (threading.Event): Optional flag that stops all workers when set.
+
+    Returns:
+        tuple: (nonce, hex hash), or None if cancelled. If several workers finish
+        at once the lowest nonce wins.
+    """
+    pool = MinerPool(workers)
+    try:
+        return pool.search(prefix, difficulty, chunk_size, cancel_event)
+    finally:
+        pool.close()
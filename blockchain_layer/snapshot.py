@@ -0,0 +1,123 @@
+import glob
+import hashlib
+import marshal
+import os
+
+SNAPSHOT_INTERVAL = 1000  # Blocks between snapshots
+KEEP_SNAPSHOTS = 2  # Newest snapshots kept; an older one is a fallback if the newest is damaged
+
+_MAGIC = b"VSNP1"
+_CHECKSUM_SIZE = 32
+_SUFFIX = ".snap"
+
+
+def _snapshot_path(directory, height):
+    return os.path.join(directory, f"snapshot-{height:012d}{_SUFFIX}")
+
+
+def write_snapshot(directory, height, tip_hash, vote_counts, voter_blocks):
+    """
+    Record the derived state of the first `height` blocks of a chain, so that a
+    restart only has to replay the blocks after them.
+
+    The file is written to a temporary name, fsynced and renamed, so a crash never
+    leaves a half-written snapshot under a real name. Older snapshots beyond
+    KEEP_SNAPSHOTS are deleted.
+
+    Args:
+        directory (str): The chain store directory.
+        height (int): Number of blocks covered.
+        tip_hash (str): Hash of block height - 1, used to match the snapshot to a chain.
+        vote_counts (dict): candidate_id -> votes in those blocks (genesis excluded).
+        voter_blocks (dict): voter_id -> position of the block holding the voter's vote.
+    """
+    payload = marshal.dumps({
+        'height': height,
+        'tip_hash': tip_hash,
+        'vote_counts': vote_counts,
+        'voter_blocks': voter_blocks,
+    })
+    path = _snapshot_path(directory, height)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(_MAGIC + hashlib.sha256(payload).digest() + payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+    for old_path in _snapshot_paths(directory)[KEEP_SNAPSHOTS:]:
+        os.remove(old_path)
+
+
+def _snapshot_paths(directory):
+    """Snapshot files in the directory, newest (highest) first."""
+    return sorted(glob.glob(os.path.join(directory, f"snapshot-*{_SUFFIX}")), reverse=True)
+
+
+def discard_snapshots_above(directory, height):
+    """
+    Delete snapshots covering more than `height` blocks, e.g. after the chain was truncated.
+
+    Args:
+        directory (str): The chain store directory.
+        height (int): Number of blocks still on the chain.
+    """
+    for path in _snapshot_paths(directory):
+        state_height = int(os.path.basename(path)[len("snapshot-"):-len(_SUFFIX)])
+        if state_height > height:
+            os.remove(path)
+
+
+def read_snapshot(path):
+    """
+    Read one snapshot file.
+
+    Args:
+        path (str): Snapshot file path.
+
+    Returns:
+        dict: height, tip_hash, vote_counts and voter_blocks, or None if the file is
+        damaged (bad magic or checksum, or undecodable).
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    header_size = len(_MAGIC) + _CHECKSUM_SIZE
+    if len(data) < header_size or not data.startswith(_MAGIC):
+        return None
+    payload = data[header_size:]
+    if hashlib.sha256(payload).digest() != data[len(_MAGIC):header_size]:
+        return None
+    try:
+        state = marshal.loads(payload)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(state, dict) or not {'height', 'tip_hash', 'vote_counts', 'voter_blocks'} <= state.keys():
+        return None
+    return state
+
+
+def load_latest_snapshot(directory, matches_chain):
+    """
+    Find the newest snapshot that is intact and belongs to the current chain.
+
+    Args:
+        directory (str): The chain store directory.
+        matches_chain (callable): matches_chain(height, tip_hash) -> True if the chain's
+            block at height - 1 has that hash.
+
+    Returns:
+        dict: The snapshot state (see read_snapshot), or None if no snapshot is usable.
+    """
+    for path in _snapshot_paths(directory):
+        state = read_snapshot(path)
+        if state is None:
+            print(f"[Snapshot] Skipping damaged snapshot {os.path.basename(path)}")
+            continue
+        if not matches_chain(state['height'], state['tip_hash']):
+            print(f"[Snapshot] Skipping {os.path.basename(path)}: it does not match the stored chain")
+            continue
+        return state
+    return None
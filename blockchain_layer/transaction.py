@@ -15,6 +15,8 @@ class Transaction:
         tx = Transaction(voter_id="voter123", candidate_id="candidateA")
         print(tx.to_dict())  # {'voter_id': 'voter123', 'candidate_id': 'candidateA', 'timestamp': '2028-01-01 00:00:00'}
     """
+    __slots__ = ('voter_id', 'candidate_id', 'timestamp')
+
     def __init__(self, voter_id, candidate_id, timestamp=None):
         self.voter_id = voter_id
         self.candidate_id = candidate_id
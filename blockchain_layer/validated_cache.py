@@ -0,0 +1,67 @@
+from collections import OrderedDict
+
+
+class ValidatedBlockCache:
+    """
+    A bounded LRU set of (hash, previous_hash) pairs for blocks that have already
+    passed proof-of-work and linkage checks.
+
+    Blockchain only records blocks installed on its own chain whose parent is also
+    recorded, so a hit for the block at some position vouches for the whole chain
+    up to that block and lets validation skip that prefix.
+
+    Attributes:
+        max_size (int): Maximum number of pairs kept; the least recently used are evicted.
+
+    Usage:
+        cache = ValidatedBlockCache(max_size=1000)
+        cache.add(block.hash, block.previous_hash)
+        if cache.contains(block.hash, block.previous_hash):
+            ...  # skip re-hashing the block
+    """
+
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self._pairs = OrderedDict()  # block hash -> previous hash
+
+    def __len__(self):
+        return len(self._pairs)
+
+    def __contains__(self, block_hash):
+        return block_hash in self._pairs
+
+    def add(self, block_hash, previous_hash):
+        """
+        Record a validated block, evicting the least recently used one if full.
+
+        Args:
+            block_hash (str): The block's hash.
+            previous_hash (str): The hash it links to.
+        """
+        self._pairs[block_hash] = previous_hash
+        self._pairs.move_to_end(block_hash)
+        while len(self._pairs) > self.max_size:
+            self._pairs.popitem(last=False)
+
+    def contains(self, block_hash, previous_hash):
+        """
+        Check whether a block with this hash and parent was validated, marking it as recently used.
+
+        Args:
+            block_hash (str): The block's hash.
+            previous_hash (str): The hash it links to.
+
+        Returns:
+            bool: True if the exact pair is cached.
+        """
+        if self._pairs.get(block_hash, None) != previous_hash or block_hash not in self._pairs:
+            return False
+        self._pairs.move_to_end(block_hash)
+        return True
+
+    def discard(self, block_hash):
+        """Forget a block, e.g. when it is dropped from the chain by a reorg."""
+        self._pairs.pop(block_hash, None)
+
+    def clear(self):
+        self._pairs.clear()
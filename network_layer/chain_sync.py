@@ -0,0 +1,328 @@
+import time
+from collections import deque
+from blockchain_layer.blockchain import block_from_header
+
+HEADERS_PER_MESSAGE = 100  # Headers packed into one HEADERS datagram (~30 KB of JSON)
+BODY_RANGE_SIZE = 16  # Consecutive block bodies asked of one peer at a time
+RANGES_PER_PEER = 2  # Body ranges a single peer may have outstanding
+BODY_TIMEOUT = 2.0  # Seconds before an unanswered body range is asked of another peer
+MAX_BODY_TIMEOUTS = 3  # Body ranges in a row a source may leave unanswered before it is dropped
+HEADER_REQUEST_RETRIES = 3  # Times an unanswered REQUEST_HEADERS is sent again, BODY_TIMEOUT apart
+
+
+class _HeaderDownload:
+    """Headers received from one responder, validated as soon as they are contiguous."""
+
+    def __init__(self, start, total_blocks, previous_hash):
+        self.start = start
+        self.total_blocks = total_blocks
+        self.headers = {}  # index -> header dict
+        self.validated = []  # headers checked so far, in chain order
+        self.previous_hash = previous_hash
+        self.failed = False
+        self.updated_at = time.monotonic()
+
+    @property
+    def complete(self):
+        return self.start + len(self.validated) == self.total_blocks
+
+    @property
+    def tip_hash(self):
+        return self.validated[-1]['hash'] if self.validated else None
+
+
+class HeadersFirstSync:
+    """
+    Headers-first chain synchronization.
+
+    The requester first downloads compact block headers (REQUEST_HEADERS / HEADERS),
+    checking each header's link and proof-of-work as soon as it arrives; a responder
+    whose headers fail is dropped before any block body is fetched from it. Once one
+    responder's headers are complete and lead to a longer chain, the missing block
+    bodies are fetched in BODY_RANGE_SIZE ranges (REQUEST_BODIES / BLOCK_BODY) from every
+    peer that advertised the same tip, and each body is checked against its header
+    as it lands. When all bodies are in, the blocks are spliced onto the chain. A source
+    that leaves MAX_BODY_TIMEOUTS ranges in a row unanswered is dropped; once no source
+    is left the download is abandoned, so that another validated header chain, even one
+    of the same length, can be fetched instead.
+
+    A responder that has nothing newer answers with an empty HEADERS. Only a responder
+    that leaves REQUEST_HEADERS unanswered after HEADER_REQUEST_RETRIES retries, sends an
+    invalid header or is dropped as a body source is reported to on_failed.
+
+    Headers-first sync does not go through ChainTransfer: bodies are packed into
+    BLOCK_BODIES datagrams by the responder, and at most RANGES_PER_PEER ranges
+    outstanding per peer take the place of ChainTransfer's window and pacing.
+
+    All methods are meant to be called from the peer's chain lane thread.
+
+    Usage:
+        sync = HeadersFirstSync(blockchain, send, on_synced, on_failed)
+        sync.request([peer_addr])
+        # in the message loop:
+        sync.handle_headers(message, addr)
+        sync.handle_block_body(message, addr)
+        sync.poll()
+    """
+
+    def __init__(self, blockchain, send, on_synced=None, on_failed=None):
+        """
+        Args:
+            blockchain (Blockchain): The chain to extend.
+            send (callable): send(payload_dict, addr) delivers a message to a peer.
+            on_synced (callable): Called with no arguments after a chain has been spliced on.
+            on_failed (callable): on_failed(addr) when a responder does not answer, sends an
+                invalid header or stops serving bodies.
+        """
+        self.blockchain = blockchain
+        self.send = send
+        self.on_synced = on_synced
+        self.on_failed = on_failed
+        self.header_downloads = {}  # responder addr -> _HeaderDownload
+        self.header_requests = {}  # responder addr -> [time sent, retries left], until it answers
+        self._reset_bodies()
+
+    def _reset_bodies(self):
+        self.target = None  # _HeaderDownload whose chain is being fetched
+        self.sources = []  # peers that advertised the target tip
+        self.bodies = {}  # index -> Block
+        self.pending_ranges = deque()  # (first, last) index ranges not yet requested
+        self.in_flight = {}  # first index -> (peer addr, (first, last), time sent)
+        self.timeouts = {}  # peer addr -> body ranges it left unanswered since its last body
+
+    def request(self, addrs):
+        """
+        Send REQUEST_HEADERS with our block locator to each peer. Unanswered requests are
+        repeated by poll().
+
+        Args:
+            addrs (list): Addresses of the peers to sync from.
+        """
+        payload = {"type": "REQUEST_HEADERS", "locator": self.blockchain.get_locator()}
+        now = time.monotonic()
+        for addr in addrs:
+            self.header_requests[addr] = [now, HEADER_REQUEST_RETRIES]
+            self.send(payload, addr)
+
+    def busy(self):
+        """Return True while headers are requested or being downloaded, or bodies are being fetched."""
+        return bool(self.target is not None or self.header_requests or
+                    any(not download.failed and not download.complete for download in self.header_downloads.values()))
+
+    def handle_headers(self, message, addr):
+        """
+        Collect a HEADERS message and validate any newly contiguous headers. Any HEADERS
+        answers our request, including an empty one from a responder with nothing newer.
+
+        Args:
+            message (dict): HEADERS message with start, total_blocks, offset and headers.
+            addr (tuple): Address of the responder.
+        """
+        start = message.get("start")
+        total_blocks = message.get("total_blocks")
+        offset = message.get("offset", 0)
+        headers = message.get("headers", [])
+        self.header_requests.pop(addr, None)
+        if not isinstance(start, int) or not isinstance(total_blocks, int) or not isinstance(offset, int):
+            return
+        if total_blocks <= len(self.blockchain.chain) or not 0 < start <= len(self.blockchain.chain):
+            return  # Not longer than ours, or no shared block to build on
+
+        download = self.header_downloads.get(addr)
+        if download is None or (download.start, download.total_blocks) != (start, total_blocks):
+            download = _HeaderDownload(start, total_blocks, self.blockchain.chain.hash_at(start - 1))
+            self.header_downloads[addr] = download
+        if download.failed:
+            return
+
+        for i, header in enumerate(headers, start + offset):
+            if start <= i < total_blocks:
+                download.headers[i] = header
+        download.updated_at = time.monotonic()
+
+        # Check headers in order as far as they are contiguous
+        while not download.complete:
+            position = download.start + len(download.validated)
+            header = download.headers.pop(position, None)
+            if header is None:
+                break
+            if not self.blockchain.is_valid_header(header, position, download.previous_hash):
+                print(f"[Peer] Invalid header {position} from {addr[0]}:{addr[1]}, dropping its chain "
+                      f"after {len(download.validated) + 1} header(s).")
+                download.failed = True
+                download.headers.clear()
+                download.validated = []
+                if self.on_failed is not None:
+                    self.on_failed(addr)
+                return
+            download.validated.append(header)
+            download.previous_hash = header['hash']
+
+        if download.complete:
+            print(f"[Peer] Headers {start}-{total_blocks - 1} from {addr[0]}:{addr[1]} are valid.")
+            self._offer_header_chain(download, addr)
+
+    def _offer_header_chain(self, download, addr):
+        """Start fetching bodies for a validated header chain, or add addr as a source for the current one."""
+        if self.target is not None and self.target.tip_hash == download.tip_hash:
+            if addr not in self.sources:
+                self.sources.append(addr)
+                self._request_bodies()
+            return
+        target_length = self.target.total_blocks if self.target is not None else len(self.blockchain.chain)
+        if download.total_blocks <= target_length:
+            return
+
+        self._reset_bodies()
+        self.target = download
+        self.sources = [addr] + [other for other, d in self.header_downloads.items()
+                                 if other != addr and d.complete and d.tip_hash == download.tip_hash]
+        for first in range(download.start, download.total_blocks, BODY_RANGE_SIZE):
+            self.pending_ranges.append((first, min(first + BODY_RANGE_SIZE, download.total_blocks) - 1))
+        self._request_bodies()
+
+    def _request_bodies(self, now=None):
+        """Hand out pending ranges to sources that have spare capacity, spreading them across peers."""
+        now = time.monotonic() if now is None else now
+        busy = {}
+        for peer_addr, _, _ in self.in_flight.values():
+            busy[peer_addr] = busy.get(peer_addr, 0) + 1
+        while self.pending_ranges:
+            idle = [source for source in self.sources if busy.get(source, 0) < RANGES_PER_PEER]
+            if not idle:
+                return
+            source = min(idle, key=lambda s: busy.get(s, 0))
+            first, last = self.pending_ranges.popleft()
+            hashes = [self.target.validated[i - self.target.start]['hash'] for i in range(first, last + 1)]
+            self.send({"type": "REQUEST_BODIES", "first": first, "hashes": hashes}, source)
+            self.in_flight[first] = (source, (first, last), now)
+            busy[source] = busy.get(source, 0) + 1
+
+    def handle_block_body(self, message, addr):
+        """
+        Check a BLOCK_BODY against its validated header and splice the chain once complete.
+
+        Args:
+            message (dict): BLOCK_BODY message with index, hash and transactions.
+            addr (tuple): Address of the sender.
+        """
+        if self.target is None:
+            return
+        index = message.get("index")
+        if not isinstance(index, int) or not self.target.start <= index < self.target.total_blocks or index in self.bodies:
+            return
+        header = self.target.validated[index - self.target.start]
+        if message.get("hash") != header['hash']:
+            return
+        block = block_from_header(header, message.get("transactions", []))
+        if block is None:
+            print(f"[Peer] Body of block {index} from {addr[0]}:{addr[1]} does not match its header, discarded.")
+            return
+        self.bodies[index] = block
+        self.timeouts.pop(addr, None)
+
+        # Release the range once all of its bodies are in
+        for range_first, (_, (first, last), _) in list(self.in_flight.items()):
+            if first <= index <= last and all(i in self.bodies for i in range(first, last + 1)):
+                del self.in_flight[range_first]
+                self._request_bodies()
+                break
+
+        if len(self.bodies) == self.target.total_blocks - self.target.start:
+            self._finish()
+
+    def _finish(self):
+        start = self.target.start
+        blocks = [self.bodies[i] for i in range(start, self.target.total_blocks)]
+        sources = len(self.sources)
+        self._reset_bodies()
+        self.header_downloads.clear()
+        if self.blockchain.splice_chain(start, blocks):
+            print(f"[Peer] Chain synced headers-first (blocks {start}-{start + len(blocks) - 1} "
+                  f"from {sources} peer(s)).")
+            if self.on_synced is not None:
+                self.on_synced()
+        else:
+            print("[Peer] Downloaded chain is invalid or no longer longer → rejected.")
+
+    def _drop_source(self, source):
+        """Stop fetching bodies from a source that does not answer, and forget the headers it sent (see poll)."""
+        print(f"[Peer] {source[0]}:{source[1]} left {MAX_BODY_TIMEOUTS} body requests unanswered, "
+              f"dropping it as a source.")
+        self.sources.remove(source)
+        self.header_downloads.pop(source, None)
+        for range_first, (peer_addr, block_range, _) in list(self.in_flight.items()):
+            if peer_addr == source:
+                del self.in_flight[range_first]
+                self.pending_ranges.appendleft(block_range)
+
+    def _abandon_target(self):
+        """Give up on a chain no source serves any more, and fetch the longest other validated one instead."""
+        print(f"[Peer] No source left for blocks {self.target.start}-{self.target.total_blocks - 1}, "
+              f"abandoning the download.")
+        self._reset_bodies()
+        complete = [(addr, download) for addr, download in self.header_downloads.items() if download.complete]
+        if complete:
+            addr, download = max(complete, key=lambda item: item[1].total_blocks)
+            self._offer_header_chain(download, addr)
+
+    def poll(self, now=None):
+        """
+        Re-request headers and body ranges that have not been answered within
+        BODY_TIMEOUT, preferring a different peer for bodies, and drop sources that
+        stopped answering (see MAX_BODY_TIMEOUTS). Calls on_failed for each responder
+        given up on. Call regularly from the message loop.
+        """
+        now = time.monotonic() if now is None else now
+        failed = []
+        for addr, request in list(self.header_requests.items()):
+            sent_at, retries = request
+            if now - sent_at < BODY_TIMEOUT:
+                continue
+            if retries == 0:
+                del self.header_requests[addr]
+                failed.append(addr)
+                continue
+            request[:] = [now, retries - 1]
+            self.send({"type": "REQUEST_HEADERS", "locator": self.blockchain.get_locator()}, addr)
+        self._poll_downloads(now, failed)
+        if self.on_failed is not None:
+            for addr in failed:
+                self.on_failed(addr)
+
+    def _poll_downloads(self, now, failed):
+        """Re-request lost HEADERS and unanswered body ranges; dropped sources are added to failed."""
+        if self.target is None:
+            for addr, download in list(self.header_downloads.items()):
+                if download.total_blocks <= len(self.blockchain.chain):
+                    del self.header_downloads[addr]  # Our chain caught up some other way
+                    continue
+                if not download.failed and not download.complete and now - download.updated_at >= BODY_TIMEOUT:
+                    # A HEADERS datagram was lost; headers already received are kept
+                    download.updated_at = now
+                    self.send({"type": "REQUEST_HEADERS", "locator": self.blockchain.get_locator()}, addr)
+        if self.target is None or not self.in_flight:
+            return
+        for range_first, (source, block_range, sent_at) in list(self.in_flight.items()):
+            if range_first not in self.in_flight or now - sent_at < BODY_TIMEOUT:
+                continue  # Already requeued along with a dropped source, or not due yet
+            del self.in_flight[range_first]
+            first, last = block_range
+            missing = [i for i in range(first, last + 1) if i not in self.bodies]
+            if not missing:
+                continue
+            self.pending_ranges.appendleft((missing[0], last))
+            if source not in self.sources:
+                continue
+            self.timeouts[source] = self.timeouts.get(source, 0) + 1
+            if self.timeouts[source] >= MAX_BODY_TIMEOUTS:
+                self._drop_source(source)
+                failed.append(source)
+            elif len(self.sources) > 1:
+                # Move the slow peer to the back so another one gets the range
+                self.sources.remove(source)
+                self.sources.append(source)
+        if not self.sources:
+            self._abandon_target()
+            return
+        self._request_bodies(now)
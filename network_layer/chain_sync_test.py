@@ -0,0 +1,174 @@
+import sys
+import os
+import io
+import time
+import threading
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.transaction import Transaction
+from blockchain_layer.blockchain import Blockchain
+from network_layer.chain_sync import HeadersFirstSync, BODY_TIMEOUT, MAX_BODY_TIMEOUTS, HEADER_REQUEST_RETRIES
+from network_layer.peer import Peer
+
+PEER_A = ("127.0.0.1", 5001)
+PEER_B = ("127.0.0.1", 5002)
+
+
+def mined_chain(blocks, candidate, difficulty=1):
+    node = Blockchain(difficulty=difficulty)
+    for i in range(blocks):
+        node.add_new_transaction(Transaction(f"voter{i}", candidate))
+        node.mine_block()
+    return node
+
+
+def headers_message(node):
+    headers = [block.header_dict() for block in node.chain[1:]]
+    return {"type": "HEADERS", "start": 1, "total_blocks": len(node.chain), "offset": 0, "headers": headers}
+
+
+def test_dead_sources_are_abandoned():
+    print("=== Test: Download from Dead Sources Is Abandoned ===")
+    chain_a, chain_b = mined_chain(3, "candidateA"), mined_chain(3, "candidateB")
+    syncing = Blockchain(difficulty=1)
+    sent = []
+    sync = HeadersFirstSync(syncing, lambda payload, addr: sent.append((payload["type"], addr)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync.handle_headers(headers_message(chain_a), PEER_A)
+        sync.handle_headers(headers_message(chain_b), PEER_B)
+        assert sync.target.tip_hash == chain_a.last_block.hash, "The first valid header chain should be fetched"
+        assert sync.sources == [PEER_A], "A chain of the same length should not replace the target"
+
+        # PEER_A never answers: its ranges time out until it is dropped
+        clock = time.monotonic()
+        for _ in range(MAX_BODY_TIMEOUTS):
+            clock += BODY_TIMEOUT
+            sync.poll(clock)
+    assert sync.target is not None and sync.target.tip_hash == chain_b.last_block.hash, \
+        f"After {MAX_BODY_TIMEOUTS} unanswered ranges the other chain should be fetched"
+    assert sync.sources == [PEER_B] and PEER_A not in sync.header_downloads, "The dead source should be dropped"
+    assert sent[-1] == ("REQUEST_BODIES", PEER_B), "Bodies should now be asked of PEER_B"
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for index, block in enumerate(chain_b.chain[1:], 1):
+            sync.handle_block_body({"type": "BLOCK_BODY", "index": index, "hash": block.hash,
+                                    "transactions": block.transaction_dicts()}, PEER_B)
+    assert syncing.last_block.hash == chain_b.last_block.hash, "The chain from the live source should be synced"
+
+    # With no other header chain to fall back on, the download is simply dropped
+    sync = HeadersFirstSync(Blockchain(difficulty=1), lambda payload, addr: None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        sync.handle_headers(headers_message(chain_a), PEER_A)
+        for _ in range(MAX_BODY_TIMEOUTS):
+            clock += BODY_TIMEOUT
+            sync.poll(clock)
+    assert sync.target is None and not sync.in_flight, "A download with no source left should be abandoned"
+
+
+def test_unanswered_header_requests():
+    print("=== Test: Unanswered Header Requests Fail, Empty Answers Do Not ===")
+    failed = []
+    sent = []
+    sync = HeadersFirstSync(Blockchain(difficulty=1), lambda payload, addr: sent.append(addr), on_failed=failed.append)
+    sync.request([PEER_A, PEER_B])
+    assert sync.busy(), "Outstanding header requests should keep the sync busy"
+    sync.handle_headers({"type": "HEADERS", "start": 1, "total_blocks": 1, "offset": 0, "headers": []}, PEER_B)
+    clock = time.monotonic()
+    for _ in range(HEADER_REQUEST_RETRIES):
+        clock += BODY_TIMEOUT
+        sync.poll(clock)
+    assert sent.count(PEER_A) == 1 + HEADER_REQUEST_RETRIES and sent.count(PEER_B) == 1, \
+        "Only the unanswered request should be repeated"
+    assert not failed, "A request with retries left has not failed"
+    sync.poll(clock + BODY_TIMEOUT)
+    assert failed == [PEER_A], "Only the responder that never answered should be reported"
+    assert not sync.busy(), "Nothing should be left in progress"
+
+
+class DummyClient:
+    def update_ballot(self, ballot):
+        pass
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def record_requests(peer, message_type, requests):
+    """Make peer add its port to requests for each message_type it answers."""
+    handler, lane = peer.handlers[message_type]
+    peer.register_handler(message_type, lambda message, addr: (requests.append(peer.local_port),
+                                                               handler(message, addr)), lane)
+
+
+def test_sync_source_selection(base_port=48620):
+    print("=== Test: Both Sync Modes Ask the Best Peer, and Peers in Sync Answer ===")
+    source = mined_chain(5, "candidateA", difficulty=2)
+    for headers_first in (True, False):
+        port = base_port + (0 if headers_first else 10)
+        mode = "headers-first" if headers_first else "REQUEST_CHAIN"
+        with contextlib.redirect_stdout(io.StringIO()):
+            best, other, client = [Peer("127.0.0.1", port, "127.0.0.1", port + i, DummyClient(),
+                                        headers_first=headers_first) for i in (1, 2, 3)]
+            best.blockchain_obj.replace_chain(source.chain[:])
+            best_addr, other_addr = ("127.0.0.1", port + 1), ("127.0.0.1", port + 2)
+            client.peers = {f"{best_addr[0]}:{best_addr[1]}", f"{other_addr[0]}:{other_addr[1]}"}
+            requests = []
+            for peer in (best, other):
+                record_requests(peer, "REQUEST_HEADERS" if headers_first else "REQUEST_CHAIN", requests)
+
+            # The peer that advertised the longest chain is the only one asked
+            client.note_peer_height(best_addr, len(source.chain))
+            client.request_chain()
+            assert wait_for(lambda: len(client.blockchain_obj.chain) == len(source.chain)), f"Client should sync ({mode})"
+            assert requests == [best_addr[1]], f"Only the best peer should be asked ({mode})"
+
+            # A peer in sync answers that it has nothing newer, which is not a failure
+            other.blockchain_obj.replace_chain(source.chain[:])
+            client.note_peer_height(other_addr, 100)  # Overstated
+            requests.clear()
+            client.request_chain()
+            assert wait_for(lambda: requests and not client.chain_sync.busy() and not client.chain_transfer.busy()), \
+                f"The request should be answered ({mode})"
+            for peer in (best, other, client):
+                peer.transport.close()
+        assert requests == [other_addr[1]], f"Only the peer advertising the longest chain should be asked ({mode})"
+        assert client.peer_heights[f"{other_addr[0]}:{other_addr[1]}"] == len(source.chain), \
+            "The answer should correct the advertised chain length"
+        assert not client.sync_failed_peers, f"A peer in sync should not count as failed ({mode})"
+
+
+def test_sync_retry_leaves_loop_free(base_port=48650):
+    print("=== Test: Retrying a Failed Sync Does Not Wait for the Blockchain Lock on the Loop ===")
+    with contextlib.redirect_stdout(io.StringIO()):
+        source, client = [Peer("127.0.0.1", base_port, "127.0.0.1", base_port + i, DummyClient(),
+                               headers_first=False) for i in (1, 2)]
+        source_addr, failed_addr = ("127.0.0.1", base_port + 1), ("127.0.0.1", base_port + 3)
+        client.peers = {f"{source_addr[0]}:{source_addr[1]}", f"{failed_addr[0]}:{failed_addr[1]}"}
+        requests = []
+        record_requests(source, "REQUEST_CHAIN", requests)
+
+        # A splice on the chain lane holds the lock while the loop reports a failed transfer
+        handled = threading.Event()
+        with client.blockchain_obj.lock:
+            client.loop.call_soon_threadsafe(lambda: (client.chain_sync_failed(failed_addr), handled.set()))
+            assert handled.wait(1.0), "The loop should not wait for the blockchain lock"
+            time.sleep(0.1)
+            assert not requests, "The new request needs the lock for its locator"
+        answered = wait_for(lambda: requests)
+        for peer in (source, client):
+            peer.transport.close()
+    assert answered and requests == [source_addr[1]], "The remaining peer should be asked once the lock is free"
+
+
+if __name__ == "__main__":
+    print("===== Running Headers-First Sync Tests =====")
+    test_dead_sources_are_abandoned()
+    test_unanswered_header_requests()
+    test_sync_source_selection()
+    test_sync_retry_leaves_loop_free()
+    print("\nAll tests completed successfully.")
@@ -0,0 +1,39 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def shared_event_loop():
+    """
+    Return the asyncio event loop that serves every peer in this process, starting it
+    in a daemon thread on first use. Peers register their sockets and timers on it, so
+    one thread handles the network traffic of any number of peers.
+
+    Returns:
+        asyncio.AbstractEventLoop: The running loop.
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            threading.Thread(target=run, name="peer-event-loop", daemon=True).start()
+            started.wait()
+            _loop = loop
+        return _loop
+
+
+def in_loop_thread(loop):
+    """Return True if called from the thread running loop."""
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
@@ -0,0 +1,153 @@
+import time
+import random
+import threading
+from collections import OrderedDict
+
+GOSSIP_FANOUT = 8  # Peers a block is sent to by its miner and relayed to by each peer that first sees it
+SEEN_CACHE_SIZE = 4096  # Block hashes remembered so that copies of a block are neither validated nor relayed again
+BLOCK_REQUEST_TIMEOUT = 1.0  # Seconds to wait for a block body after GETDATA before asking another peer that announced it
+MAX_FALLBACK_ANNOUNCERS = 8  # Other announcers of a requested block kept to ask if the request times out
+
+
+class SeenCache:
+    """
+    Bounded LRU set of block hashes a peer has already handled. Gossip delivers several
+    copies of each block; only the first is validated and relayed. Once more than
+    max_size hashes are held the least recently seen is forgotten, which is safe: a
+    forgotten block is already in the chain and a late copy is ignored as a duplicate.
+
+    Usage:
+        seen = SeenCache()
+        if seen.add(block_dict["hash"]):
+            ...  # First copy: validate and relay it
+    """
+
+    def __init__(self, max_size=SEEN_CACHE_SIZE):
+        """
+        Args:
+            max_size (int): Most hashes to remember.
+        """
+        self.max_size = max_size
+        self.hashes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, block_hash):
+        """
+        Record block_hash as seen.
+
+        Args:
+            block_hash (str): Hash of the block.
+
+        Returns:
+            bool: True if it had not been seen before.
+        """
+        with self.lock:
+            if block_hash in self.hashes:
+                self.hashes.move_to_end(block_hash)
+                return False
+            self.hashes[block_hash] = None
+            if len(self.hashes) > self.max_size:
+                self.hashes.popitem(last=False)
+            return True
+
+    def __contains__(self, block_hash):
+        with self.lock:
+            return block_hash in self.hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+
+def gossip_targets(peers, fanout, exclude=(), rng=random):
+    """
+    Choose the peers to send a block to.
+
+    Args:
+        peers (iterable): "ip:port" of the known peers.
+        fanout (int): Most peers to choose, or None for all of them (flooding).
+        exclude (iterable): "ip:port" of peers that already have the block, such as its sender.
+        rng (random.Random): Source of randomness.
+
+    Returns:
+        list: The chosen "ip:port" strings.
+    """
+    candidates = sorted(set(peers).difference(exclude))
+    if fanout is None or fanout >= len(candidates):
+        return candidates
+    return rng.sample(candidates, fanout)
+
+
+class InventoryRequests:
+    """
+    Tracks the blocks a peer has asked for with GETDATA after they were announced by
+    INV. A block is requested from the first peer that announces it; peers that
+    announce it while that request is outstanding are kept as fallbacks in case the
+    body does not arrive within the timeout, each peer once and at most max_fallbacks
+    of them. Not thread-safe: the peer uses it from the event loop thread only.
+
+    Usage:
+        requests = InventoryRequests()
+        if requests.announce(block_hash, index, addr):
+            send GETDATA to addr
+        for block_hash, index, addr in requests.expired():
+            send GETDATA to addr
+    """
+
+    def __init__(self, timeout=BLOCK_REQUEST_TIMEOUT, max_fallbacks=MAX_FALLBACK_ANNOUNCERS):
+        """
+        Args:
+            timeout (float): Seconds to wait for a requested body.
+            max_fallbacks (int): Most other announcers to keep per block.
+        """
+        self.timeout = timeout
+        self.max_fallbacks = max_fallbacks
+        self.pending = {}  # block hash -> [index, requested at, peer asked, peers that also announced it]
+
+    def announce(self, block_hash, index, addr, now=None):
+        """
+        Record that addr announced a block.
+
+        Args:
+            block_hash (str): Hash of the announced block.
+            index (int): Its position in the announcer's chain.
+            addr (tuple): Address of the announcer.
+            now (float): Current time.monotonic(), if the caller has it.
+
+        Returns:
+            bool: True if the block should be requested from addr now.
+        """
+        request = self.pending.get(block_hash)
+        if request is not None:
+            fallbacks = request[3]
+            if addr != request[2] and addr not in fallbacks and len(fallbacks) < self.max_fallbacks:
+                fallbacks.append(addr)
+            return False
+        self.pending[block_hash] = [index, time.monotonic() if now is None else now, addr, []]
+        return True
+
+    def received(self, block_hash):
+        """Forget the request for a block whose body has arrived."""
+        self.pending.pop(block_hash, None)
+
+    def expired(self, now=None):
+        """
+        Move timed-out requests on to the next peer that announced the block, and drop
+        those no other peer announced.
+
+        Args:
+            now (float): Current time.monotonic(), if the caller has it.
+
+        Returns:
+            list: (block hash, index, addr) for each GETDATA to send now.
+        """
+        now = time.monotonic() if now is None else now
+        retries = []
+        for block_hash, request in list(self.pending.items()):
+            if now - request[1] < self.timeout:
+                continue
+            if not request[3]:
+                del self.pending[block_hash]
+                continue
+            request[1:3] = [now, request[3].pop(0)]
+            retries.append((block_hash, request[0], request[2]))
+        return retries
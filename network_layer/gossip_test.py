@@ -0,0 +1,177 @@
+import sys
+import os
+import io
+import time
+import json
+import random
+import contextlib
+from collections import Counter
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.blockchain import Blockchain, block_from_dict
+from blockchain_layer.transaction import Transaction
+from network_layer.wire import peek_type
+from network_layer.gossip import SeenCache, InventoryRequests, gossip_targets
+from network_layer.peer import Peer
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_seen_cache():
+    print("=== Test: Seen Block Cache ===")
+    seen = SeenCache(max_size=3)
+    assert seen.add("a") and seen.add("b") and seen.add("c"), "New hashes should be reported as new"
+    assert not seen.add("a"), "A hash seen before should be reported as seen"
+    assert seen.add("d"), "A fourth hash should be accepted"
+    assert len(seen) == 3, "The cache should stay within max_size"
+    assert "b" not in seen, "The least recently seen hash should be evicted"
+    assert "a" in seen and "c" in seen and "d" in seen, "Recently seen hashes should be kept"
+
+
+def test_gossip_targets():
+    print("=== Test: Gossip Target Selection ===")
+    peers = {f"127.0.0.1:{5000 + i}" for i in range(10)}
+    assert gossip_targets(peers, None) == sorted(peers), "Without a fanout every peer is a target"
+    rng = random.Random(1)
+    targets = gossip_targets(peers, 3, exclude={"127.0.0.1:5000"}, rng=rng)
+    assert len(targets) == len(set(targets)) == 3, "A fanout should choose that many distinct peers"
+    assert "127.0.0.1:5000" not in targets and set(targets) <= peers, "Excluded peers should not be chosen"
+    assert gossip_targets(peers, 20, exclude={"127.0.0.1:5000"}) == sorted(peers - {"127.0.0.1:5000"}), \
+        "A fanout above the peer count should choose every other peer"
+
+
+class CountingTransport:
+    """Wraps a peer's datagram transport and counts the messages it sends by type."""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.sent = Counter()
+
+    def sendto(self, data, addr):
+        self.sent[peek_type(data) or json.loads(data)["type"]] += 1
+        self.transport.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+
+class DummyClient:
+    def update_ballot(self, ballot):
+        pass
+
+
+def test_inventory_requests():
+    print("=== Test: GETDATA Requests for Announced Blocks ===")
+    requests = InventoryRequests(timeout=1.0)
+    first, second, third = ("127.0.0.1", 5001), ("127.0.0.1", 5002), ("127.0.0.1", 5003)
+    assert requests.announce("h", 4, first, now=0.0), "The first announcement should be requested"
+    assert not requests.announce("h", 4, second, now=0.1), "Later announcements should wait as fallbacks"
+    assert not requests.announce("h", 4, third, now=0.2), "Later announcements should wait as fallbacks"
+    assert requests.expired(now=0.5) == [], "Requests should not time out early"
+    assert requests.expired(now=1.0) == [("h", 4, second)], "A timed-out request should move to the next announcer"
+    assert requests.expired(now=2.0) == [("h", 4, third)], "A timed-out request should move to the next announcer"
+    assert requests.expired(now=3.0) == [] and not requests.pending, "Requests with no announcers left are dropped"
+    requests.announce("g", 5, first, now=0.0)
+    requests.received("g")
+    assert requests.expired(now=5.0) == [] and not requests.pending, "A received block should not be requested again"
+
+    # Repeated INVs neither add an announcer twice nor grow the fallbacks past the cap
+    requests = InventoryRequests(timeout=1.0, max_fallbacks=2)
+    assert requests.announce("h", 4, first, now=0.0), "The first announcement should be requested"
+    for addr in (first, second, second, first, third, ("127.0.0.1", 5004)):
+        assert not requests.announce("h", 4, addr, now=0.1), "Later announcements should not be requested at once"
+    assert requests.expired(now=1.0) == [("h", 4, second)], "Each announcer should be asked once"
+    assert requests.expired(now=2.0) == [("h", 4, third)], "Each announcer should be asked once"
+    assert requests.expired(now=3.0) == [] and not requests.pending, "Only max_fallbacks announcers should be kept"
+
+
+def run_gossip(count, fanout, base_port, announce_blocks):
+    """Gossip one block from the first of count localhost peers; return the peers, the block and whether all got it."""
+    source = Blockchain(difficulty=2)
+    source.add_new_transaction(Transaction("voter1", "candidateA"))
+    source.mine_block()
+    block_dict = source.get_last_block_dict()
+    with contextlib.redirect_stdout(io.StringIO()):
+        peers = [Peer("127.0.0.1", base_port, "127.0.0.1", base_port + 1 + i, DummyClient(), gossip_fanout=fanout,
+                      announce_blocks=announce_blocks) for i in range(count)]
+        addresses = {f"127.0.0.1:{peer.local_port}" for peer in peers}
+        for peer in peers:
+            peer.peers = addresses - {f"127.0.0.1:{peer.local_port}"}
+            peer.transport = CountingTransport(peer.transport)
+        miner = peers[0]
+        miner.blockchain_obj.add_block(block_from_dict(block_dict), block_dict["hash"])
+        miner.broadcast_block(block_dict)
+        reached = wait_for(lambda: all(len(peer.blockchain_obj.chain) == 2 for peer in peers), 5.0)
+        time.sleep(0.2)  # Let the last relays arrive
+    return peers, block_dict, reached
+
+
+def test_gossip_between_peers(count=6, fanout=4, base_port=48800):
+    print("=== Test: Gossiped Block Reaches Every Peer Once ===")
+    peers, block_dict, reached = run_gossip(count, fanout, base_port, announce_blocks=False)
+    assert reached, "Every peer should receive the block"
+    assert all(peer.blockchain_obj.chain.hash_at(-1) == block_dict["hash"] for peer in peers), \
+        "Every peer should add the gossiped block"
+    assert peers[0].transport.sent["NEW_BLOCK"] == fanout, "The miner should send the block to fanout peers only"
+    # With fanout = count - 2, each relay reaches every peer but the relayer and its sender
+    assert sum(peer.transport.sent["NEW_BLOCK"] for peer in peers) == fanout * count, \
+        "Each peer should relay the block once, on first sight, and ignore later copies"
+
+
+def test_inventory_between_peers(count=6, fanout=4, base_port=48810):
+    print("=== Test: Announced Block Is Sent Once to Each Peer ===")
+    peers, block_dict, reached = run_gossip(count, fanout, base_port, announce_blocks=True)
+    assert reached, "Every peer should fetch the announced block"
+    assert all(peer.blockchain_obj.chain.hash_at(-1) == block_dict["hash"] for peer in peers), \
+        "Every peer should add the announced block"
+    sent = sum((peer.transport.sent for peer in peers), Counter())
+    assert sent["INV"] == fanout * count, "Each peer should announce the block once"
+    assert sent["GETDATA"] == sent["NEW_BLOCK"] == count - 1, \
+        "Each peer should request and receive the block exactly once, however many peers announce it"
+
+
+def test_forged_copy_does_not_shadow_block(base_port=48820):
+    print("=== Test: Forged Copy of a Block Does Not Shadow It ===")
+    source = Blockchain(difficulty=2)
+    source.add_new_transaction(Transaction("voter1", "candidateA"))
+    source.mine_block()
+    block_dict = source.get_last_block_dict()
+    forged = json.loads(json.dumps(block_dict))
+    forged["transactions"][0]["candidate_id"] = "candidateB"  # Claims the real block's hash
+    sender = ("127.0.0.1", base_port + 2)
+    with contextlib.redirect_stdout(io.StringIO()):
+        peer = Peer("127.0.0.1", base_port, "127.0.0.1", base_port + 1, DummyClient(), gossip_fanout=4)
+        sync_requests = []
+        peer.request_chain = lambda: sync_requests.append(True)
+        peer.loop.call_soon_threadsafe(peer.block_requests.announce, block_dict["hash"], 1, sender)
+        peer.handle_new_block(forged, sender)
+        assert block_dict["hash"] not in peer.seen_blocks, "A block failing its proof should not be marked as seen"
+        assert not peer.peer_heights, "A block failing its proof should not advertise a chain"
+        assert sync_requests == [True], "A block failing its proof should trigger chain sync"
+        peer.handle_new_block(forged, sender)
+        assert sync_requests == [True], "Forged copies should not trigger a chain sync each"
+        time.sleep(0.05)
+        assert block_dict["hash"] in peer.block_requests.pending, "A forged body should not satisfy the GETDATA"
+        peer.handle_new_block(block_dict, sender)
+        assert wait_for(lambda: block_dict["hash"] not in peer.block_requests.pending), \
+            "The real body should satisfy the GETDATA"
+        peer.handle_new_block({"hash": block_dict["hash"]}, sender)  # Would fail to decode
+        peer.transport.close()
+    assert peer.blockchain_obj.chain.hash_at(-1) == block_dict["hash"], "The real block should still be added"
+    assert block_dict["hash"] in peer.seen_blocks, "The real block should be marked as seen"
+
+
+if __name__ == "__main__":
+    print("===== Running Gossip Tests =====")
+    test_seen_cache()
+    test_gossip_targets()
+    test_inventory_requests()
+    test_gossip_between_peers()
+    test_inventory_between_peers()
+    test_forged_copy_does_not_shadow_block()
+    print("\nAll tests completed successfully.")
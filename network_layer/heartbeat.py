@@ -0,0 +1,86 @@
+import threading
+
+HEARTBEAT_INTERVAL = 1  # Seconds between two POKEs to the same peer
+HEARTBEAT_TIMEOUT_COUNT = 3  # Unanswered POKEs after which a peer is removed
+HEARTBEAT_SLOTS = 10  # Slots the peers are spread over; one slot is poked every HEARTBEAT_INTERVAL / HEARTBEAT_SLOTS
+
+
+class HeartbeatWheel:
+    """
+    Timer wheel that spreads heartbeats over an interval. Every peer is placed in one of
+    `slots` slots; each tick() handles the next slot, so each peer is poked once per
+    revolution (HEARTBEAT_INTERVAL) while the tracker sends a steady 1/slots of its
+    POKEs per tick instead of one burst per interval. A peer whose last timeout_count
+    POKEs all went unanswered is reported as timed out instead of being poked again.
+
+    Registration, acknowledgements and ticks only hold the wheel's lock briefly;
+    sending the POKEs is up to the caller, outside of it.
+
+    Usage:
+        wheel = HeartbeatWheel()
+        wheel.add(addr)
+        to_poke, timed_out = wheel.tick()  # every wheel.tick_interval seconds
+        wheel.ack(addr)  # on POKE-ACK
+    """
+
+    def __init__(self, interval=HEARTBEAT_INTERVAL, slots=HEARTBEAT_SLOTS, timeout_count=HEARTBEAT_TIMEOUT_COUNT):
+        """
+        Args:
+            interval (float): Seconds between two POKEs to the same peer.
+            slots (int): Slots per interval.
+            timeout_count (int): Unanswered POKEs after which a peer times out.
+        """
+        self.tick_interval = interval / slots
+        self.timeout_count = timeout_count
+        self.slots = [set() for _ in range(slots)]
+        self.slot_of = {}  # peer address -> index of its slot
+        self.missed = {}  # peer address -> POKEs sent since its last POKE-ACK
+        self.current = 0  # Slot the next tick() handles
+        self.next_slot = 0  # Slot the next added peer is placed in
+        self.lock = threading.Lock()
+
+    def add(self, addr):
+        """Start heartbeating addr; a peer that is already known starts over with no missed POKEs."""
+        with self.lock:
+            if addr not in self.slot_of:
+                self.slot_of[addr] = self.next_slot
+                self.slots[self.next_slot].add(addr)
+                self.next_slot = (self.next_slot + 1) % len(self.slots)
+            self.missed[addr] = 0
+
+    def remove(self, addr):
+        """Stop heartbeating addr, e.g. after LEAVE_PEER."""
+        with self.lock:
+            slot = self.slot_of.pop(addr, None)
+            if slot is not None:
+                self.slots[slot].discard(addr)
+            self.missed.pop(addr, None)
+
+    def ack(self, addr):
+        """Record a POKE-ACK from addr."""
+        with self.lock:
+            if addr in self.missed:
+                self.missed[addr] = 0
+
+    def tick(self):
+        """
+        Advance to the next slot.
+
+        Returns:
+            tuple: (addresses to POKE now, addresses that timed out and were removed)
+        """
+        with self.lock:
+            slot = self.slots[self.current]
+            self.current = (self.current + 1) % len(self.slots)
+            timed_out = [addr for addr in slot if self.missed[addr] >= self.timeout_count]
+            for addr in timed_out:
+                slot.discard(addr)
+                del self.slot_of[addr]
+                del self.missed[addr]
+            to_poke = list(slot)
+            for addr in to_poke:
+                self.missed[addr] += 1
+        return to_poke, timed_out
+
+    def __len__(self):
+        return len(self.slot_of)
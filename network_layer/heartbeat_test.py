@@ -0,0 +1,99 @@
+import sys
+import os
+import io
+import time
+import socket
+import threading
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from network_layer.wire import encode, decode
+from network_layer.heartbeat import HeartbeatWheel
+from network_layer.tracker_server import TrackerServer
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_heartbeat_wheel():
+    print("=== Test: Heartbeat Timer Wheel ===")
+    wheel = HeartbeatWheel(interval=1.0, slots=4, timeout_count=3)
+    peers = [("127.0.0.1", 5000 + i) for i in range(10)]
+    for peer in peers:
+        wheel.add(peer)
+    assert wheel.tick_interval == 0.25, "A tick should cover one slot of the interval"
+    poked = []
+    for _ in range(4):
+        to_poke, timed_out = wheel.tick()
+        assert len(to_poke) <= 3 and not timed_out, "Peers should be spread evenly over the slots"
+        poked.extend(to_poke)
+    assert sorted(poked) == peers, "Each peer should be poked exactly once per interval"
+
+    silent, gone = peers[0], peers[1]
+    wheel.remove(gone)
+    timed_out_at = None
+    for revolution in range(1, 6):
+        for _ in range(4):
+            to_poke, timed_out = wheel.tick()
+            assert gone not in to_poke, "A removed peer should not be poked"
+            for peer in to_poke:
+                if peer != silent:
+                    wheel.ack(peer)
+            if silent in timed_out:
+                timed_out_at = revolution
+            assert set(timed_out) <= {silent}, "Peers that answer should never time out"
+    assert timed_out_at == 3, "A peer should time out once its last three POKEs went unanswered"
+    assert len(wheel) == 8, "A timed-out peer should be dropped from the wheel"
+
+
+def test_tracker_heartbeats(port=48900):
+    print("=== Test: Tracker Pokes Peers and Removes Silent Ones ===")
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = TrackerServer("127.0.0.1", port)
+        threading.Thread(target=tracker.listen_for_peers, daemon=True).start()
+        live, silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM), socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for sock in (live, silent):
+            sock.bind(("127.0.0.1", 0))
+            sock.settimeout(1.0)
+            sock.sendto(encode({"type": "REGISTER_PEER", "wire_versions": [1]}, None), ("127.0.0.1", port))
+        assert wait_for(lambda: len(tracker.peers) == 2), "Both peers should register"
+        for sock in (live, silent):
+            while decode(sock.recvfrom(65535)[0])["type"] != "REGISTER_ACK":
+                pass
+        live.settimeout(0.02)
+        removed = []
+        pokes = 0
+        for _ in range(5 * len(tracker.heartbeats.slots)):
+            timed_out = tracker.heartbeat_tick()
+            removed.extend(timed_out)
+            try:
+                while True:
+                    if decode(live.recvfrom(65535)[0])["type"] == "POKE":
+                        pokes += 1
+                        live.sendto(encode({"type": "POKE-ACK"}), ("127.0.0.1", port))
+                        wait_for(lambda: tracker.heartbeats.missed[live.getsockname()] == 0)
+            except socket.timeout:
+                pass
+            if timed_out:
+                tracker.remove_timed_out_peers(timed_out)
+    assert pokes == 5, "The live peer should be poked once per interval"
+    assert removed == [silent.getsockname()], "Only the silent peer should time out"
+    assert list(tracker.peers) == [live.getsockname()], "The silent peer should be removed from the peer list"
+
+    # A timeout reported for a peer that is already gone changes and logs nothing
+    epoch = tracker.epoch
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        tracker.remove_timed_out_peers([silent.getsockname()])
+    assert tracker.epoch == epoch and "Removed" not in output.getvalue(), "A peer already removed should not be reported"
+
+
+if __name__ == "__main__":
+    print("===== Running Heartbeat Tests =====")
+    test_heartbeat_wheel()
+    test_tracker_heartbeats()
+    print("\nAll tests completed successfully.")
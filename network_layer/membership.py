@@ -0,0 +1,178 @@
+import time
+from bisect import bisect_right
+
+PEER_PAGE_SIZE = 20  # Peers per snapshot page; a page of IPv4 peers stays under DATAGRAM_BUDGET even as JSON
+PEER_PAGES_PER_REQUEST = 8  # Pages the tracker sends back to back for one REQUEST_PEERS
+SNAPSHOT_RETRY_INTERVAL = 0.5  # Seconds without a new page before a snapshot is asked for again
+STALE_POKES = 2  # POKEs in a row with a newer epoch before a peer gives up waiting for the deltas
+
+
+def peer_page(peer_keys, is_wire_peer, after, epoch):
+    """
+    Build one page of the tracker's peer list snapshot.
+
+    Args:
+        peer_keys (list): Sorted "ip:port" of every registered peer.
+        is_wire_peer (callable): is_wire_peer(key) is True for peers that speak the newest wire format.
+        after (str): The page holds the peers that sort after this key ("" for the first page).
+        epoch (int): The tracker's membership epoch.
+
+    Returns:
+        dict: The PEERS message.
+    """
+    start = bisect_right(peer_keys, after) if after else 0
+    page = peer_keys[start:start + PEER_PAGE_SIZE]
+    return {"type": "PEERS", "epoch": epoch, "after": after, "remaining": len(peer_keys) - start - len(page),
+            "wire_peers": [key for key in page if is_wire_peer(key)], "peer_list": page}
+
+
+class PeerDirectory:
+    """
+    A peer's copy of the tracker's peer list, kept current by epoch-numbered deltas.
+
+    The tracker bumps its membership epoch on every join and leave and sends each
+    change as PEER_JOINED or PEER_LEFT. Deltas are applied in epoch order. A missing
+    epoch, or a POKE advertising an epoch the deltas never brought, means a delta was
+    lost; the directory then fetches a full snapshot, PEER_PAGE_SIZE peers per PEERS
+    page in key order, and applies the deltas that arrived meanwhile on top of it.
+
+    peers and wire_peers are replaced rather than changed in place, so other threads
+    can read them at any time. Not otherwise thread-safe: the peer uses it from the
+    event loop thread only.
+
+    Usage:
+        directory = PeerDirectory("127.0.0.1:5001", send_to_tracker)
+        directory.handle_register_ack(message)  # Also the first snapshot page
+        directory.handle_delta(message)  # PEER_JOINED / PEER_LEFT
+        directory.handle_page(message)  # PEERS
+        directory.check_epoch(message["epoch"])  # POKE
+        directory.poll()  # Periodically, to retry a stalled snapshot
+    """
+
+    def __init__(self, self_key, send_request):
+        """
+        Args:
+            self_key (str): "ip:port" of this peer, which is left out of peers.
+            send_request (callable): send_request(payload) sends a message to the tracker.
+        """
+        self.self_key = self_key
+        self.send_request = send_request
+        self.epoch = None  # Epoch the peer list is current to, None before registration
+        self.peers = set()
+        self.wire_peers = set()
+        self.snapshot = None  # Snapshot being fetched: see start_snapshot
+        self.stale_pokes = 0
+
+    def handle_register_ack(self, message):
+        """Take the first snapshot page from a REGISTER_ACK and fetch the rest."""
+        self.snapshot = self.new_snapshot()
+        if not self.handle_page(dict(message, after="")) and self.snapshot is not None:
+            self.request_pages()
+
+    def new_snapshot(self):
+        """Return the state of a snapshot fetch: its epoch, the next page's key, what it collected so far."""
+        return {"epoch": None, "after": "", "peers": set(), "wire_peers": set(), "deltas": {}, "pages": 0,
+                "requested_at": time.monotonic()}
+
+    def start_snapshot(self):
+        """Fetch the full peer list, keeping deltas that arrive meanwhile to apply afterwards."""
+        deltas = self.snapshot["deltas"] if self.snapshot else {}
+        self.snapshot = self.new_snapshot()
+        self.snapshot["deltas"] = deltas
+        self.request_pages()
+
+    def request_pages(self):
+        """Ask the tracker for the next PEER_PAGES_PER_REQUEST pages of the snapshot."""
+        self.snapshot["pages"] = 0
+        self.snapshot["requested_at"] = time.monotonic()
+        self.send_request({"type": "REQUEST_PEERS", "after": self.snapshot["after"]})
+
+    def handle_page(self, message):
+        """
+        Add a PEERS page to the snapshot being fetched. Pages that do not continue where
+        the last one stopped (duplicates, or pages after a lost one) are ignored.
+
+        Returns:
+            bool: True if the snapshot is complete and peers was replaced.
+        """
+        snapshot = self.snapshot
+        if snapshot is None or message.get("after") != snapshot["after"]:
+            return False
+        page, epoch, remaining = message.get("peer_list"), message.get("epoch"), message.get("remaining")
+        if not isinstance(page, list) or not isinstance(epoch, int) or not isinstance(remaining, int):
+            return False
+        if snapshot["epoch"] is None:
+            snapshot["epoch"] = epoch  # Changes after this epoch come as deltas
+        snapshot["peers"].update(page)
+        snapshot["wire_peers"].update(message.get("wire_peers", []))
+        if page:
+            snapshot["after"] = page[-1]
+        snapshot["pages"] += 1
+        snapshot["requested_at"] = time.monotonic()
+        if remaining > 0 and page:
+            if snapshot["pages"] >= PEER_PAGES_PER_REQUEST:
+                self.request_pages()
+            return False
+
+        self.snapshot = None
+        self.epoch = snapshot["epoch"]
+        self.peers = frozenset(snapshot["peers"] - {self.self_key})
+        self.wire_peers = frozenset(snapshot["wire_peers"])
+        deltas = snapshot["deltas"]
+        while self.epoch + 1 in deltas:
+            self.apply(deltas.pop(self.epoch + 1))
+        if any(epoch > self.epoch for epoch in deltas):
+            self.start_snapshot()  # A delta sent during the snapshot was lost
+        return True
+
+    def handle_delta(self, message):
+        """
+        Apply a PEER_JOINED or PEER_LEFT in epoch order.
+
+        Returns:
+            bool: True if peers changed.
+        """
+        epoch = message.get("epoch")
+        if not isinstance(epoch, int) or not isinstance(message.get("peer"), str):
+            return False
+        if self.snapshot is not None:
+            self.snapshot["deltas"][epoch] = message
+            return False
+        if self.epoch is None or epoch <= self.epoch:
+            return False
+        if epoch > self.epoch + 1:
+            self.start_snapshot()
+            self.snapshot["deltas"][epoch] = message
+            return False
+        self.apply(message)
+        return True
+
+    def apply(self, message):
+        """Apply the next delta to peers and wire_peers."""
+        peer = message["peer"]
+        self.epoch = message["epoch"]
+        if message.get("type") == "PEER_JOINED":
+            if peer != self.self_key:
+                self.peers = self.peers | {peer}
+            self.wire_peers = self.wire_peers | {peer} if message.get("wire") else self.wire_peers - {peer}
+        else:
+            self.peers = self.peers - {peer}
+            self.wire_peers = self.wire_peers - {peer}
+
+    def check_epoch(self, epoch):
+        """
+        Compare our epoch with the one a POKE advertises. If we are still behind after
+        STALE_POKES POKEs in a row, the deltas were lost: fetch a snapshot.
+        """
+        if not isinstance(epoch, int) or self.epoch is None or self.snapshot is not None:
+            return
+        self.stale_pokes = self.stale_pokes + 1 if epoch > self.epoch else 0
+        if self.stale_pokes >= STALE_POKES:
+            self.stale_pokes = 0
+            self.start_snapshot()
+
+    def poll(self, now=None):
+        """Ask again for the snapshot pages if none arrived for SNAPSHOT_RETRY_INTERVAL."""
+        now = time.monotonic() if now is None else now
+        if self.snapshot is not None and now - self.snapshot["requested_at"] >= SNAPSHOT_RETRY_INTERVAL:
+            self.request_pages()
@@ -0,0 +1,152 @@
+import sys
+import os
+import io
+import json
+import time
+import socket
+import threading
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from network_layer.wire import encode, DATAGRAM_BUDGET
+from network_layer.membership import PeerDirectory, peer_page, PEER_PAGE_SIZE, PEER_PAGES_PER_REQUEST
+from network_layer.tracker_server import TrackerServer
+from network_layer.peer import Peer
+
+SELF = "127.0.0.1:5000"
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class FakeTracker:
+    """Answers a PeerDirectory's REQUEST_PEERS from an in-memory peer list, like TrackerServer.send_peer_pages."""
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.epoch = 1
+        self.requests = []
+
+    def join(self, key):
+        self.keys = sorted(self.keys + [key])
+        self.epoch += 1
+        return {"type": "PEER_JOINED", "epoch": self.epoch, "peer": key, "wire": int(key.endswith("1"))}
+
+    def leave(self, key):
+        self.keys.remove(key)
+        self.epoch += 1
+        return {"type": "PEER_LEFT", "epoch": self.epoch, "peer": key}
+
+    def pages(self, after):
+        pages = []
+        for _ in range(PEER_PAGES_PER_REQUEST):
+            pages.append(peer_page(self.keys, lambda key: key.endswith("1"), after, self.epoch))
+            if not pages[-1]["remaining"]:
+                break
+            after = pages[-1]["peer_list"][-1]
+        return pages
+
+
+def test_directory_deltas():
+    print("=== Test: Peer List Deltas in Epoch Order ===")
+    sent = []
+    directory = PeerDirectory(SELF, sent.append)
+    directory.handle_register_ack({"type": "REGISTER_ACK", "epoch": 3, "remaining": 0,
+                                   "peer_list": ["127.0.0.1:5001", SELF], "wire_peers": ["127.0.0.1:5001"]})
+    assert directory.peers == {"127.0.0.1:5001"} and directory.epoch == 3, "The ACK page should be the whole list"
+    assert not sent, "A complete first page needs no REQUEST_PEERS"
+    assert directory.handle_delta({"type": "PEER_JOINED", "epoch": 4, "peer": "127.0.0.1:5002", "wire": 0})
+    assert directory.peers == {"127.0.0.1:5001", "127.0.0.1:5002"}, "PEER_JOINED should add the peer"
+    assert directory.wire_peers == {"127.0.0.1:5001"}, "A JSON-only peer should not be a wire peer"
+    assert not directory.handle_delta({"type": "PEER_LEFT", "epoch": 4, "peer": "127.0.0.1:5001"}), \
+        "A delta for an epoch already applied should be ignored"
+    assert directory.handle_delta({"type": "PEER_LEFT", "epoch": 5, "peer": "127.0.0.1:5001"})
+    assert directory.peers == {"127.0.0.1:5002"} and not directory.wire_peers, "PEER_LEFT should remove the peer"
+
+    assert not directory.handle_delta({"type": "PEER_JOINED", "epoch": 7, "peer": "127.0.0.1:5003", "wire": 1})
+    assert sent == [{"type": "REQUEST_PEERS", "after": ""}], "A gap in epochs should fetch a snapshot"
+    directory.handle_page({"type": "PEERS", "epoch": 6, "after": "", "remaining": 0,
+                           "peer_list": ["127.0.0.1:5002", "127.0.0.1:5004"], "wire_peers": []})
+    assert directory.epoch == 7, "Deltas after the snapshot's epoch should be applied on top of it"
+    assert directory.peers == {"127.0.0.1:5002", "127.0.0.1:5003", "127.0.0.1:5004"}, \
+        "The snapshot plus the buffered delta should give the tracker's list"
+
+    sent.clear()
+    directory.check_epoch(7)
+    directory.check_epoch(8)
+    assert not sent, "One POKE ahead of us may just have overtaken the delta"
+    directory.check_epoch(8)
+    assert sent == [{"type": "REQUEST_PEERS", "after": ""}], "Staying behind the POKE epoch should fetch a snapshot"
+
+
+def test_paginated_snapshot():
+    print("=== Test: Paginated Peer List Snapshot ===")
+    tracker = FakeTracker([f"10.0.{i // 250}.{i % 250 + 1}:{5000 + i}" for i in range(500)])
+    requests = []
+    directory = PeerDirectory(SELF, requests.append)
+    first = tracker.pages("")[0]
+    directory.handle_register_ack(dict(first, type="REGISTER_ACK"))
+    assert directory.snapshot is not None, "A partial first page should start a snapshot"
+    assert requests == [{"type": "REQUEST_PEERS", "after": first["peer_list"][-1]}], "The rest should be requested"
+
+    early, late = tracker.keys[0], tracker.keys[-1]
+    deltas = [tracker.leave(early), tracker.leave(late), tracker.join("10.9.9.9:9999")]
+    rounds = 0
+    while directory.snapshot is not None:
+        rounds += 1
+        assert rounds < 100, "The snapshot should finish"
+        request = requests.pop(0)
+        pages = tracker.pages(request["after"])
+        if rounds == 2:
+            for delta in deltas:
+                directory.handle_delta(delta)
+            pages = pages[:3] + pages[4:]  # A lost page
+        for page in pages:
+            assert len(encode(page, None)) <= DATAGRAM_BUDGET, "A JSON page should fit one datagram"
+            directory.handle_page(page)
+        if not requests:
+            directory.poll(time.monotonic() + 1)  # The retry recovers the lost page
+    assert rounds > 3, "The lost page should have been asked for again"
+    assert directory.peers == set(tracker.keys), "Pages plus the deltas sent meanwhile should give the tracker's list"
+    assert directory.epoch == tracker.epoch, "The directory should be current to the tracker's epoch"
+    assert directory.wire_peers == {key for key in tracker.keys if key.endswith("1")}, "Wire peers should follow"
+
+
+def test_tracker_membership(port=49000, others=45):
+    print("=== Test: Tracker Sends Snapshot Pages and Deltas ===")
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracker = TrackerServer("127.0.0.1", port)
+        threading.Thread(target=tracker.listen_for_peers, daemon=True).start()
+        sockets = []
+        for _ in range(others):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.bind(("127.0.0.1", 0))
+            sock.sendto(json.dumps({"type": "REGISTER_PEER"}).encode(), ("127.0.0.1", port))
+            sockets.append(sock)
+        assert wait_for(lambda: len(tracker.peers) == others), "The other peers should register"
+        assert tracker.epoch == others, "Every join should bump the epoch"
+
+        peer = Peer("127.0.0.1", port, "127.0.0.1", port + 1, None)
+        peer.connect()
+        keys = {f"127.0.0.1:{sock.getsockname()[1]}" for sock in sockets}
+        synced = wait_for(lambda: peer.peers == keys)
+        sockets[0].sendto(json.dumps({"type": "LEAVE_PEER"}).encode(), ("127.0.0.1", port))
+        left = wait_for(lambda: peer.peers == keys - {f"127.0.0.1:{sockets[0].getsockname()[1]}"})
+    for sock in sockets:
+        sock.close()
+    assert others > PEER_PAGE_SIZE * 2, "The list should span several pages"
+    assert synced, "A joining peer should fetch the whole list page by page"
+    assert left, "A PEER_LEFT delta should remove the peer"
+    assert peer.directory.epoch == tracker.epoch, "The peer should be current to the tracker's epoch"
+
+
+if __name__ == "__main__":
+    print("===== Running Membership Tests =====")
+    test_directory_deltas()
+    test_paginated_snapshot()
+    test_tracker_membership()
+    print("\nAll tests completed successfully.")
@@ -0,0 +1,376 @@
+import sys
+import os
+import io
+import time
+import json
+import heapq
+import collections
+import random
+import socket
+import threading
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.block import Block
+from blockchain_layer.transaction import Transaction
+from network_layer.wire import encode, decode, pack, WIRE_VERSION, DATAGRAM_BUDGET
+from network_layer.reliable import ChainTransfer
+from network_layer.pacing import PACING_RATE
+from network_layer.gossip import SeenCache, gossip_targets, GOSSIP_FANOUT
+from network_layer.tracker_server import TrackerServer
+from network_layer.heartbeat import HEARTBEAT_INTERVAL
+from network_layer.membership import peer_page, PEER_PAGES_PER_REQUEST
+
+
+def make_block(index=1, votes=1):
+    """Build a block like the ones Peer.mining_worker mines."""
+    block = Block(index, [Transaction(f"voter{index}-{i}", "candidateA") for i in range(votes)],
+                  timestamp="2024-05-01 12:00:00", previous_hash="ab" * 32, nonce=48213)
+    block.hash = block.compute_hash()
+    return block
+
+
+def time_per_call(function, argument, min_seconds=0.2):
+    """Return the average µs per call of function(argument)."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        for _ in range(100):
+            function(argument)
+        calls += 100
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls * 1e6
+
+
+def benchmark_wire_format():
+    """Print bytes per message and encode/decode µs for JSON vs. the binary wire format."""
+    print("=== Benchmark: wire format (JSON vs. binary) ===")
+    print(f"{'message':>24} {'JSON B':>7} {'binary B':>9} {'JSON enc/dec (µs)':>18} {'binary enc/dec (µs)':>20}")
+    peers = [f"10.0.{i // 250}.{i % 250 + 1}:{5000 + i}" for i in range(100)]
+    messages = [
+        ("NEW_BLOCK, 1 vote", {"type": "NEW_BLOCK", "block": make_block().to_dict()}),
+        ("NEW_BLOCK, 50 votes", {"type": "NEW_BLOCK", "block": make_block(votes=50).to_dict()}),
+        ("CHAIN_BLOCK, 1 vote", {"type": "CHAIN_BLOCK", "index": 1234, "start": 1000,
+                                 "block": make_block(1234).to_dict(), "total_blocks": 5000}),
+        ("UPDATE_PEERS, 10 peers", {"type": "UPDATE_PEERS", "peer_list": peers[:10], "wire_peers": peers[:10]}),
+        ("UPDATE_PEERS, 100 peers", {"type": "UPDATE_PEERS", "peer_list": peers, "wire_peers": peers}),
+    ]
+    for name, message in messages:
+        json_data = json.dumps(message).encode()
+        binary_data = encode(message)
+        assert decode(binary_data) == message
+        json_encode = time_per_call(lambda m: json.dumps(m).encode(), message)
+        json_decode = time_per_call(lambda d: json.loads(d.decode()), json_data)
+        binary_encode = time_per_call(encode, message)
+        binary_decode = time_per_call(decode, binary_data)
+        print(f"{name:>24} {len(json_data):>7} {len(binary_data):>9} "
+              f"{json_encode:>8.1f} / {json_decode:>7.1f} {binary_encode:>9.1f} / {binary_decode:>8.1f}")
+
+
+def benchmark_chain_transfer(blocks=10000, budget=DATAGRAM_BUDGET):
+    """
+    Print datagrams, bytes and encode time to send a chain of one-vote blocks as one
+    CHAIN_BLOCK per block vs. packed into CHAIN_BLOCKS datagrams of at most budget bytes.
+    """
+    print(f"=== Benchmark: sending {blocks:,} blocks ({budget}-byte datagram budget) ===")
+    print(f"{'method':>24} {'datagrams':>10} {'KB':>8} {'encode (s)':>11}")
+    block_dicts = [make_block(i).to_dict() for i in range(1, blocks + 1)]
+    payload = {"type": "CHAIN_BLOCKS", "start": 1, "total_blocks": blocks + 1}
+    methods = [
+        ("CHAIN_BLOCK per block", lambda: [json.dumps({"type": "CHAIN_BLOCK", "index": block["index"], "start": 1,
+                                                       "block": block, "total_blocks": blocks + 1}).encode()
+                                           for block in block_dicts]),
+        ("CHAIN_BLOCKS, JSON", lambda: pack(payload, "blocks", block_dicts, budget, None)),
+        ("CHAIN_BLOCKS, binary", lambda: pack(payload, "blocks", block_dicts, budget, WIRE_VERSION)),
+    ]
+    for name, send in methods:
+        start = time.perf_counter()
+        datagrams = send()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>24} {len(datagrams):>10,} {sum(map(len, datagrams)) / 1024:>8,.0f} {elapsed:>11.3f}")
+
+
+class _Endpoint:
+    """One side of a localhost chain transfer: a UDP socket and a thread that feeds its ChainTransfer."""
+
+    def __init__(self, pacing_rate, on_complete=None, block_dicts=()):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.addr = self.sock.getsockname()
+        self.sent = 0
+        self.received = 0
+        self.running = True
+        self.block_dicts = block_dicts  # Served from index 1 in answer to REQUEST_CHAIN
+        self.transfer = ChainTransfer(self.send_message, self.send_datagrams, lambda addr: WIRE_VERSION,
+                                      on_complete, pacing_rate=pacing_rate)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def send_message(self, payload, addr):
+        self.sock.sendto(encode(payload), addr)
+
+    def send_datagrams(self, datagrams, addr):
+        for data in datagrams:
+            self.sent += 1
+            self.sock.sendto(data, addr)
+
+    def run(self):
+        """Handle chain transfer messages like Peer.dispatch and its registered handlers do, on one thread."""
+        while self.running:
+            self.transfer.poll()
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            message = decode(data)
+            if message["type"] == "REQUEST_CHAIN":
+                self.transfer.send(addr, 1, len(self.block_dicts) + 1, self.block_dicts,
+                                   message["window"], message["request"])
+            elif message["type"] == "CHAIN_BLOCKS":
+                self.received += 1
+                self.transfer.handle_blocks(addr, message["transfer"], message["start"], message["total_blocks"],
+                                            [(block["index"], block) for block in message["blocks"]])
+            elif message["type"] == "CHAIN_NACK":
+                self.transfer.handle_nack(message, addr)
+            elif message["type"] == "CHAIN_ACK":
+                self.transfer.handle_ack(message, addr)
+
+    def close(self):
+        self.running = False
+        self.sock.close()
+
+
+def benchmark_paced_transfer(sizes=(10000, 100000), timeout=120):
+    """
+    Print the datagram loss rate and effective throughput of a localhost REQUEST_CHAIN
+    transfer of one-vote blocks, sent unpaced (every datagram at once) vs. paced by the
+    token bucket within the receiver's window. Lost datagrams are recovered by CHAIN_NACK
+    in both cases; the loss rate counts every datagram sent, including retransmissions.
+    """
+    print("=== Benchmark: localhost chain transfer, unpaced vs. paced ===")
+    print(f"{'blocks':>8} {'sending':>8} {'datagrams':>10} {'lost':>7} {'time (s)':>9} {'blocks/s':>9}")
+    for size in sizes:
+        block_dicts = [make_block(i).to_dict() for i in range(1, size + 1)]
+        for name, pacing_rate in (("unpaced", None), ("paced", PACING_RATE)):
+            done = threading.Event()
+            receiver = _Endpoint(pacing_rate, on_complete=lambda addr, start, blocks: done.set())
+            sender = _Endpoint(pacing_rate, block_dicts=block_dicts)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                receiver.transfer.request(sender.addr, [[0, "0" * 64]])
+                finished = done.wait(timeout)
+                elapsed = time.perf_counter() - start
+            sender.close()
+            receiver.close()
+            lost = 1 - receiver.received / sender.sent
+            result = f"{elapsed:>9.2f} {size / elapsed:>9,.0f}" if finished else f"{'> ' + str(timeout):>9} {'-':>9}"
+            print(f"{size:>8,} {name:>8} {sender.sent:>10,} {lost:>7.1%} {result}")
+
+
+def simulate_propagation(size, fanout, announce, sizes, uplink, rng, latency=(0.005, 0.050)):
+    """
+    Simulate one block spreading from peer 0 to size peers the way Peer.broadcast_block,
+    Peer.handle_inv and Peer.handle_new_block send it. Every peer's uplink sends one
+    datagram at a time, at uplink bits per second, and each datagram then spends a
+    random one-way latency in flight. With fanout None the miner sends to every peer;
+    otherwise it gossips. With announce, peers send INV and the block follows GETDATA.
+
+    Args:
+        sizes (dict): Bytes of each message type.
+
+    Returns:
+        tuple: (seconds until each peer that got the block first received it,
+        datagrams sent by type (Counter), bytes sent, bytes sent by the miner)
+    """
+    peers = [str(i) for i in range(size)]
+    seen = [SeenCache() for _ in peers]
+    requested = [False] * size
+    uplink_free = [0.0] * size
+    sent = collections.Counter()
+    sent_bytes = [0] * size
+    received = {}
+    events = [(0.0, "NEW_BLOCK", 0, None)]  # (arrival time, message type, receiver, sender)
+
+    def send(now, message_type, sender, receiver):
+        uplink_free[sender] = max(uplink_free[sender], now) + sizes[message_type] * 8 / uplink
+        sent[message_type] += 1
+        sent_bytes[sender] += sizes[message_type]
+        heapq.heappush(events, (uplink_free[sender] + rng.uniform(*latency), message_type, receiver, sender))
+
+    while events:
+        now, message_type, peer, sender = heapq.heappop(events)
+        if message_type == "INV":
+            if "block" not in seen[peer] and not requested[peer]:
+                requested[peer] = True
+                send(now, "GETDATA", peer, sender)
+            continue
+        if message_type == "GETDATA":
+            send(now, "NEW_BLOCK", peer, sender)
+            continue
+        if not seen[peer].add("block"):
+            continue
+        received[peer] = now
+        if sender is not None and fanout is None:
+            continue  # Flooding: only the miner sends
+        exclude = {peers[peer]} if sender is None else {peers[peer], peers[sender]}
+        for target in gossip_targets(peers, fanout, exclude, rng):
+            send(now, "INV" if announce else "NEW_BLOCK", peer, int(target))
+    return [received[peer] for peer in received if peer != 0], sent, sum(sent_bytes), sent_bytes[0]
+
+
+def benchmark_gossip(sizes=(10, 50, 100, 200, 500), modes=((None, False), (4, False), (GOSSIP_FANOUT, False),
+                                                            (GOSSIP_FANOUT, True)), uplink=1_000_000, runs=20):
+    """
+    Print propagation latency percentiles, coverage and traffic for one 10-vote block
+    reaching N peers: flooded by the miner vs. gossiped with a fanout, pushing NEW_BLOCK
+    or announcing it with INV/GETDATA. Simulated on 1 Mbit/s uplinks with 5-50 ms one-way
+    latency, averaged over runs simulations. "blocks" counts NEW_BLOCK datagrams, each
+    of which its receiver decodes.
+    """
+    block = make_block(votes=10).to_dict()
+    message_sizes = {"NEW_BLOCK": len(encode({"type": "NEW_BLOCK", "block": block})),
+                     "INV": len(encode({"type": "INV", "index": block["index"], "hash": block["hash"]})),
+                     "GETDATA": len(encode({"type": "GETDATA", "index": block["index"], "hash": block["hash"]}))}
+    print(f"=== Benchmark: block propagation, flooding vs. gossip ({message_sizes['NEW_BLOCK']}-byte NEW_BLOCK, "
+          f"{message_sizes['INV']}-byte INV, {uplink / 1e6:g} Mbit/s uplinks) ===")
+    print(f"{'peers':>6} {'sending':>11} {'reached':>8} {'p50 (ms)':>9} {'p90 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'max (ms)':>9} {'datagrams':>10} {'blocks':>7} {'KB':>6} {'miner KB':>9}")
+    for size in sizes:
+        for fanout, announce in modes:
+            rng = random.Random(size)
+            latencies, sent, total_bytes, miner_bytes = [], collections.Counter(), 0, 0
+            for _ in range(runs):
+                arrived, run_sent, run_bytes, run_miner_bytes = simulate_propagation(
+                    size, fanout, announce, message_sizes, uplink, rng)
+                latencies.extend(arrived)
+                sent += run_sent
+                total_bytes += run_bytes
+                miner_bytes += run_miner_bytes
+            latencies.sort()
+            percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+            name = "flood" if fanout is None else f"gossip {fanout}" + (" INV" if announce else "")
+            print(f"{size:>6} {name:>11} {len(latencies) / (runs * (size - 1)):>8.1%} {percentile(0.5):>9.0f} "
+                  f"{percentile(0.9):>9.0f} {percentile(0.99):>9.0f} {latencies[-1] * 1000:>9.0f} "
+                  f"{sum(sent.values()) / runs:>10,.0f} {sent['NEW_BLOCK'] / runs:>7,.0f} "
+                  f"{total_bytes / runs / 1024:>6,.0f} {miner_bytes / runs / 1024:>9,.1f}")
+
+
+class _NullSocket:
+    """Stands in for the tracker's socket: counts datagrams instead of sending them."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def sendto(self, data, addr):
+        self.sent += 1
+
+    def close(self):
+        pass
+
+
+def _heartbeat_tracker(size):
+    """Return a TrackerServer with size registered peers and a socket that only counts, and the peers."""
+    tracker = TrackerServer("127.0.0.1", 0)
+    tracker.sock.close()
+    tracker.sock = _NullSocket()
+    peers = [(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}", 5000) for i in range(size)]
+    for index, peer in enumerate(peers):
+        tracker.peers[peer] = 0
+        if index % 2:
+            tracker.wire_versions[peer] = 1
+        tracker.heartbeats.add(peer)
+    return tracker, peers
+
+
+def _legacy_heartbeat_pass(tracker):
+    """One heartbeat pass as TrackerServer.send_heartbeats made it before the timer wheel."""
+    payload = {"type": "POKE"}
+    with tracker.peers_lock:
+        for peer_addr in tracker.peers.keys():
+            tracker.send_message(payload, peer_addr)
+            print(f"[Tracker] Sent POKE to {peer_addr[0]}:{peer_addr[1]}")
+
+
+def benchmark_tracker_heartbeats(sizes=(1000, 10000), intervals=10, dead_fraction=0.05):
+    """
+    Print the tracker CPU time spent on heartbeats and how accurately silent peers are
+    evicted, for 1k and 10k simulated peers. The heartbeat wheel is driven tick by tick
+    for `intervals` HEARTBEAT_INTERVALs; live peers answer every POKE, and dead_fraction
+    of the peers stop answering after the first two intervals. The peer list broadcast
+    that follows an eviction is not included. For comparison, the CPU time of one pass of
+    the old loop (encode and print per peer, under the registry lock) is shown too.
+    """
+    print("=== Benchmark: tracker heartbeats ===")
+    print(f"{'peers':>7} {'old pass (ms)':>14} {'CPU/interval (ms)':>18} {'longest tick (ms)':>18} "
+          f"{'evicted':>10} {'false':>6} {'detected after (s)':>19}")
+    for size in sizes:
+        tracker, peers = _heartbeat_tracker(size)
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.process_time()
+            _legacy_heartbeat_pass(tracker)
+            legacy = (time.process_time() - start) * 1000
+
+        tracker, peers = _heartbeat_tracker(size)
+        dead = set(random.Random(size).sample(peers, int(size * dead_fraction)))
+        ticks_per_interval = len(tracker.heartbeats.slots)
+        died_at = 2 * HEARTBEAT_INTERVAL
+        evicted_at = {}
+        cpu = 0.0
+        longest = 0.0
+        for tick in range(intervals * ticks_per_interval):
+            now = (tick + 1) * tracker.heartbeats.tick_interval
+            start = time.process_time()
+            timed_out = tracker.heartbeat_tick()
+            to_ack = [peer for peer in tracker.heartbeats.slots[tick % ticks_per_interval]
+                      if now <= died_at or peer not in dead]
+            for peer in to_ack:
+                tracker.heartbeats.ack(peer)  # As listen_for_peers does on POKE-ACK
+            elapsed = time.process_time() - start
+            cpu += elapsed
+            longest = max(longest, elapsed)
+            for peer in timed_out:
+                evicted_at[peer] = now
+        delays = sorted(evicted_at[peer] - died_at for peer in dead if peer in evicted_at)
+        false = sum(1 for peer in evicted_at if peer not in dead)
+        print(f"{size:>7,} {legacy:>14.1f} {cpu / intervals * 1000:>18.2f} {longest * 1000:>18.2f} "
+              f"{len(delays):>4}/{len(dead):<5} {false:>6} "
+              f"{delays[0]:>5.1f} - {delays[len(delays) // 2]:.1f} - {delays[-1]:.1f}")
+
+
+def benchmark_peer_list_updates(sizes=(10, 100, 1000, 10000), max_datagram=65507):
+    """
+    Print the bytes the tracker sends for one peer joining a network of N peers: the full
+    UPDATE_PEERS to every peer, as before, vs. a PEER_JOINED delta to every peer plus the
+    paginated snapshot the new peer fetches. JSON and binary peers are counted separately;
+    "largest" is the biggest datagram, which UDP cannot send above 65,507 bytes.
+    """
+    print("=== Benchmark: peer list update for one join, full UPDATE_PEERS vs. PEER_JOINED deltas ===")
+    print(f"{'peers':>7} {'format':>7} {'UPDATE_PEERS KB':>16} {'largest':>8} {'deltas KB':>10} "
+          f"{'snapshot KB':>12} {'pages':>6} {'requests':>9} {'largest':>8}")
+    for size in sizes:
+        keys = sorted(f"10.{i // 65536}.{i // 256 % 256}.{i % 256}:{5000 + i % 1000}" for i in range(size))
+        for name, version in (("JSON", None), ("binary", WIRE_VERSION)):
+            update = len(encode({"type": "UPDATE_PEERS", "peer_list": keys, "wire_peers": keys}, version))
+            delta = len(encode({"type": "PEER_JOINED", "epoch": size, "peer": keys[-1], "wire": 1}, version))
+            pages, after = [], ""
+            while True:
+                page = peer_page(keys, lambda key: True, after, size)
+                pages.append(encode(page, version))
+                if not page["remaining"]:
+                    break
+                after = page["peer_list"][-1]
+            print(f"{size:>7,} {name:>7} {size * update / 1024:>16,.0f} {update:>8,} {size * delta / 1024:>10,.1f} "
+                  f"{sum(map(len, pages)) / 1024:>12,.1f} {len(pages):>6,} "
+                  f"{-(-len(pages) // PEER_PAGES_PER_REQUEST):>9,} {max(map(len, pages)):>8,}")
+
+
+if __name__ == "__main__":
+    benchmark_wire_format()
+    benchmark_chain_transfer()
+    benchmark_paced_transfer()
+    benchmark_gossip()
+    benchmark_tracker_heartbeats()
+    benchmark_peer_list_updates()
@@ -0,0 +1,48 @@
+import time
+
+PACING_RATE = 4 * 1024 * 1024  # Bytes per second a bulk transfer may send on average
+PACING_BURST = 64 * 1024  # Bytes that may go out back to back after a quiet period
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: tokens (bytes) accrue at `rate` per second up to `burst`,
+    and sending a datagram spends as many tokens as it has bytes.
+
+    Usage:
+        bucket = TokenBucket(PACING_RATE, PACING_BURST)
+        wait = bucket.delay(len(data))
+        if wait == 0:
+            sock.sendto(data, addr)  # delay() has already spent the tokens
+    """
+
+    def __init__(self, rate=PACING_RATE, burst=PACING_BURST):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (float): Most tokens the bucket holds.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def delay(self, amount, now=None):
+        """
+        Spend amount tokens if the bucket holds them.
+
+        Args:
+            amount (int): Tokens needed (an amount above burst only needs a full bucket).
+            now (float): Current time.monotonic(), if the caller has it.
+
+        Returns:
+            float: 0 if the tokens were spent, else the seconds to wait before asking again.
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        needed = min(amount, self.burst)
+        if self.tokens >= needed:
+            self.tokens -= amount
+            return 0.0
+        return (needed - self.tokens) / self.rate
@@ -1,14 +1,31 @@
+import asyncio
 import socket
 import threading
-import json
 import sys
 import time
+from functools import partial
 from blockchain_layer.blockchain import Blockchain
 from blockchain_layer.transaction import Transaction
 from blockchain_layer.blockchain import block_from_dict
+from blockchain_layer.mempool import Mempool
+from network_layer.chain_sync import HeadersFirstSync, HEADERS_PER_MESSAGE, BODY_RANGE_SIZE
+from network_layer.gossip import SeenCache, InventoryRequests, gossip_targets
+from network_layer.membership import PeerDirectory
+from network_layer.event_loop import shared_event_loop, in_loop_thread
+from network_layer.pacing import PACING_RATE
+from network_layer.reliable import ChainTransfer
+from network_layer.validation_pool import ValidationPool, CHAIN_LANE, SERVE_LANE
+from network_layer.wire import encode, decode, peek_type, pack, SUPPORTED_VERSIONS, DATAGRAM_BUDGET
 
 from enum import Enum
 
+MEMPOOL_MAX_SIZE = 10000  # Pending votes accepted before submit_vote starts rejecting
+BLOCK_MAX_TRANSACTIONS = 50  # Votes sealed into one block
+BLOCK_MAX_WAIT = 0.5  # Seconds a vote may wait for its block to fill before it is mined anyway
+RETRY_INTERVAL = 0.5  # Seconds between REGISTER_PEER / REQUEST_BALLOT attempts until the tracker answers
+POLL_INTERVAL = 0.1  # Seconds between chain sync timeout checks
+FORGED_BLOCK_SYNC_INTERVAL = 5.0  # Minimum seconds between chain syncs started by blocks failing their proof
+
 class PeerState(Enum):
     INIT = 1
     REGISTERING = 2
@@ -18,8 +35,24 @@ class PeerState(Enum):
     LEAVING = 6
     CLOSED = 7
 
+
+class PeerProtocol(asyncio.DatagramProtocol):
+    """Receives a peer's datagrams on the shared event loop and hands them to Peer.dispatch."""
+
+    def __init__(self, peer):
+        self.peer = peer
+
+    def datagram_received(self, data, addr):
+        self.peer.dispatch(data, addr)
+
+    def error_received(self, exc):
+        print(f"[Peer] Socket error: {exc}")
+
 class Peer:
-    def __init__(self, tracker_addr, tracker_port, local_addr, local_port, client_instance):
+    def __init__(self, tracker_addr, tracker_port, local_addr, local_port, client_instance,
+                 block_max_transactions=BLOCK_MAX_TRANSACTIONS, block_max_wait=BLOCK_MAX_WAIT, headers_first=True,
+                 data_dir=None, binary_wire=True, datagram_budget=DATAGRAM_BUDGET, pacing_rate=PACING_RATE,
+                 gossip_fanout=None, announce_blocks=True):
         """ 
         Initializes a Peer instance.
 
@@ -29,6 +62,23 @@ class Peer:
             local_addr (str): Local IP address of this peer.
             local_port (int): Local port for this peer to bind.
             client_instance: Reference to the client UI/application layer.
+            block_max_transactions (int): Most votes the miner seals into one block.
+            block_max_wait (float): Seconds a vote waits for its block to fill before it is mined.
+            headers_first (bool): Sync by downloading and checking headers before block bodies
+                (REQUEST_HEADERS, see HeadersFirstSync) instead of streaming whole blocks from
+                each peer (REQUEST_CHAIN, see ChainTransfer). Either way the sync sources are
+                chosen by sync_sources; the packed, paced and windowed transfer applies to
+                REQUEST_CHAIN only.
+            data_dir (str): Directory to keep the chain in across restarts, or None to keep it in memory.
+            binary_wire (bool): Offer the binary wire format (network_layer/wire.py) at registration;
+                if False, or if the tracker does not agree to it, every message is sent as JSON.
+            datagram_budget (int): Largest datagram, in bytes, to pack blocks into during chain transfer.
+            pacing_rate (float): Bytes per second to send chain transfers at, or None to send them unpaced.
+            gossip_fanout (int): Send each new block to this many random peers, each of which relays
+                it to as many more on first sight (e.g. gossip.GOSSIP_FANOUT), or None to send it to
+                every peer.
+            announce_blocks (bool): Announce new blocks with INV and send the block only to peers
+                that ask for it with GETDATA, instead of pushing NEW_BLOCK to every target.
         """
         self.tracker_addr = tracker_addr
         self.tracker_port = tracker_port
@@ -37,97 +87,295 @@ class Peer:
 
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self.sock.bind((self.local_addr, self.local_port))
-        self.sock.settimeout(0.5)
+        self.sock.setblocking(False)
 
         self.peers = set()
         self.client_instance = client_instance
         self.blockchain = []
         self.has_registered = False
         self.voting_options = None
-        self.blockchain_obj = Blockchain(difficulty=2)
+        self.blockchain_obj = Blockchain(difficulty=2, store_path=data_dir)
         self.state = PeerState.INIT
-        self.temp_chain = {}
-        self.temp_total_blocks = None
-
-        self.message_handler_thread = threading.Thread(target=self.message_handler, daemon=True)
-        self.message_handler_thread.start()
 
+        self.mempool = Mempool(max_size=MEMPOOL_MAX_SIZE)  # Votes waiting to be mined
+        self.block_max_transactions = block_max_transactions
+        self.block_max_wait = block_max_wait
+        self.mining_cancel = threading.Event()  # Set when the chain tip changes under the miner
+        self.headers_first = headers_first
+        self.binary_wire = binary_wire
+        self.wire_version = None  # Binary format agreed with the tracker at REGISTER_PEER, None for JSON
+        self.wire_peers = set()  # "ip:port" of peers the tracker says speak that format too
+        # The tracker's peer list, kept current by PEER_JOINED/PEER_LEFT (event loop thread only)
+        self.directory = PeerDirectory(f"{local_addr}:{local_port}",
+                                       lambda payload: self.send_message(payload, (self.tracker_addr, self.tracker_port)))
+        self.datagram_budget = datagram_budget
+        self.chain_sync = HeadersFirstSync(self.blockchain_obj, self.send_message, on_synced=self.chain_synced,
+                                           on_failed=self.chain_sync_failed)
+        self.chain_transfer = ChainTransfer(self.send_message, self.send_datagrams, self.wire_version_for,
+                                            on_complete=partial(self.offload, CHAIN_LANE, self.finish_chain_transfer,
+                                                                required=True),
+                                            on_failed=self.chain_sync_failed,
+                                            budget=datagram_budget, pacing_rate=pacing_rate)
+        self.peer_heights = {}  # "ip:port" -> chain length the peer last advertised
+        self.sync_failed_peers = set()  # "ip:port" of peers whose last chain transfer failed
         self.broadcasting_and_listening_enabled = True
+        self.gossip_fanout = gossip_fanout
+        self.seen_blocks = SeenCache()  # Hashes of blocks already handled, so copies are not re-validated or relayed
+        self.announce_blocks = announce_blocks
+        self.block_requests = InventoryRequests()  # GETDATAs sent for announced blocks (event loop thread only)
+        self.forged_block_synced_at = None  # When a block failing its proof last started a chain sync (chain lane only)
+
+        # Validation and chain writes run on worker threads (see ValidationPool), so the event
+        # loop keeps receiving, and answering heartbeats, while a block or chain is checked
+        self.validation_pool = ValidationPool(name=f"peer-{local_port}")
+        self.handlers = {}  # message type -> (handler(message, addr), validation pool lane or None)
+        self.chain_sync_poll_queued = False
+        self.register_handlers()
+        self.loop = shared_event_loop()
+        self.transport = None
+        asyncio.run_coroutine_threadsafe(self.open_endpoint(), self.loop).result()
+
+        self.mining_thread = threading.Thread(target=self.mining_worker, daemon=True)
+        self.mining_thread.start()
+
+    async def open_endpoint(self):
+        """Attach our socket to the event loop and start the chain sync timer."""
+        self.transport, _ = await self.loop.create_datagram_endpoint(lambda: PeerProtocol(self), sock=self.sock)
+        self.loop.call_later(POLL_INTERVAL, self.poll_chain_sync)
+
+    def register_handler(self, message_type, handler, lane=None):
+        """
+        Registers the handler for one message type.
 
-    def message_handler(self):
+        Args:
+            message_type (str): The "type" of the messages to handle.
+            handler (callable): handler(message, addr).
+            lane (str): Validation pool lane to run the handler on, for handlers that validate
+                blocks, write the chain or read long stretches of it; None to run it on the
+                event loop thread as soon as the message arrives.
         """
-        Listens for incoming UDP messages and handles them according to message type.
-        This method runs in a dedicated thread.
+        self.handlers[message_type] = (handler, lane)
+
+    def register_handlers(self):
         """
-        while True:
-            try:
-                data, addr = self.sock.recvfrom(65535)
-                message = json.loads(data.decode())
-                message_type = message.get("type")
-
-                if message_type == "POKE": # Move POKE condition here to enable continued heartbeat response for fork demonstration
-                    self.heartbeat_response()
-
-                if not self.broadcasting_and_listening_enabled:
-                    continue
-
-                if message_type == "REGISTER_ACK" and self.state == PeerState.REGISTERING:
-                    peer_addresses = message.get("peer_list", [])
-                    self.peers = {p for p in peer_addresses if p != f"{self.local_addr}:{self.local_port}"}
-                    self.has_registered = True
-                    self.state = PeerState.CONNECTED
-                    print(f"[Peer] Registered with tracker.")
-
-                elif message_type == "NEW_BLOCK":
-                    block = message.get("block")
-                    self.handle_new_block(block)
-
-                elif message_type == "REQUEST_CHAIN":
-                    self.send_chain(addr)
-
-                elif message_type == "CHAIN_RESPONSE":
-                    chain = message.get("chain")
-                    self.sync_chain(chain)
-
-                elif message_type == "BALLOT_OPTIONS" and self.state == PeerState.REQUESTING_BALLOT:
-                    self.state = PeerState.CONNECTED_WITH_BALLOT
-                    print(f"[Peer] Received voting options: {message.get('voting_options')}")
-                    self.client_instance.update_ballot(message.get("voting_options",[]))
-
-                elif message_type == "UPDATE_PEERS":
-                    new_peers = message.get("peer_list", [])
-                    self.peers = {p for p in new_peers if p != f"{self.local_addr}:{self.local_port}"}
-                    print(f"[Peer] Updated peer list: {self.peers}")
-
-                elif message_type == "CHAIN_BLOCK":
-                    block_dict = message["block"]
-                    index = message["index"]
-                    total_blocks = message["total_blocks"]
-                    self.temp_chain[index] = block_from_dict(block_dict)
-                    self.temp_total_blocks = total_blocks
-                    print(f"[Peer] Received block {index}/{total_blocks - 1}")
-                    if len(self.temp_chain) == self.temp_total_blocks:
-                        new_chain = [self.temp_chain[i] for i in sorted(self.temp_chain.keys())]
-
-                        if self.blockchain_obj.is_valid_chain(new_chain) and len(new_chain) > len(self.blockchain_obj.chain):
-                            self.blockchain_obj.chain = new_chain
-                            print("[Peer] Chain synced from peer (valid chain accepted).")
-                        else:
-                            print("[Peer] Received chain is invalid or not longer → rejected.")
-
-                        self.temp_chain.clear()
-                        self.temp_total_blocks = None
-            except socket.timeout:
-                if self.state == PeerState.REGISTERING:
-                    payload = {"type": "REGISTER_PEER"}
-                    self.sock.sendto(json.dumps(payload).encode(), (self.tracker_addr, self.tracker_port))
-                    print("[Peer] Sent request to register with tracker...")
-                elif self.state == PeerState.REQUESTING_BALLOT:
-                    payload = {"type": "REQUEST_BALLOT"}
-                    self.sock.sendto(json.dumps(payload).encode(), (self.tracker_addr, self.tracker_port))
-                    print("[Peer] Sent ballot request to tracker...")
-            except Exception as e:
-                print(f"[Peer] Error: {e}")
+        Registers the handler for every message type a peer receives. Liveness and peer
+        list messages, and the per-datagram chain transfer bookkeeping, are handled on the
+        event loop; validation and chain writes go to the chain lane, and answers to sync
+        requests to the serve lane.
+        """
+        self.register_handler("REGISTER_ACK", self.handle_register_ack)
+        self.register_handler("BALLOT_OPTIONS", self.handle_ballot_options)
+        self.register_handler("UPDATE_PEERS", self.handle_update_peers)
+        self.register_handler("PEER_JOINED", self.handle_peer_delta)
+        self.register_handler("PEER_LEFT", self.handle_peer_delta)
+        self.register_handler("PEERS", self.handle_peers)
+        self.register_handler("NEW_BLOCK", lambda message, addr: self.handle_new_block(message.get("block"), addr),
+                              CHAIN_LANE)
+        self.register_handler("REQUEST_CHAIN", lambda message, addr: self.send_chain(
+            addr, message.get("locator", []), message.get("window"), message.get("request")), SERVE_LANE)
+        self.register_handler("INV", self.handle_inv)
+        self.register_handler("GETDATA", self.handle_getdata, SERVE_LANE)
+        self.register_handler("CHAIN_RESPONSE", lambda message, addr: self.sync_chain(message.get("chain")),
+                              CHAIN_LANE)
+        self.register_handler("CHAIN_BLOCK", self.handle_chain_block)
+        self.register_handler("CHAIN_BLOCKS", self.handle_chain_blocks)
+        self.register_handler("CHAIN_NACK", self.chain_transfer.handle_nack)
+        self.register_handler("CHAIN_ACK", self.chain_transfer.handle_ack)
+        self.register_handler("CHAIN_CANCEL", self.chain_transfer.handle_cancel)
+        self.register_handler("REQUEST_HEADERS", lambda message, addr: self.send_headers(
+            addr, message.get("locator", [])), SERVE_LANE)
+        self.register_handler("HEADERS", self.handle_headers, CHAIN_LANE)
+        self.register_handler("REQUEST_BODIES", lambda message, addr: self.send_bodies(
+            addr, message.get("first"), message.get("hashes", [])), SERVE_LANE)
+        self.register_handler("BLOCK_BODY", self.chain_sync.handle_block_body, CHAIN_LANE)
+        self.register_handler("BLOCK_BODIES", self.handle_block_bodies, CHAIN_LANE)
+
+    def dispatch(self, data, addr):
+        """
+        Decodes a received datagram and runs the handler registered for its type.
+        Called on the event loop thread for every datagram. A message bound for a full
+        validation pool lane is dropped, before it is decoded if it is binary.
+
+        Args:
+            data (bytes): The datagram.
+            addr (tuple): Address of the sender.
+        """
+        try:
+            message_type = peek_type(data)
+            lane = self.handlers.get(message_type, (None, None))[1]
+            if lane is not None and self.validation_pool.full(lane):
+                self.validation_pool.dropped[lane] += 1
+                self.drop_message(message_type, lane, addr)
+                return
+
+            message = decode(data)
+            message_type = message.get("type")
+
+            if message_type == "POKE": # Answered first to enable continued heartbeat response for fork demonstration
+                self.heartbeat_response()
+                self.directory.check_epoch(message.get("epoch"))
+
+            if not self.broadcasting_and_listening_enabled:
+                return
+
+            handler, lane = self.handlers.get(message_type, (None, None))
+            if handler is None:
+                return
+            if lane is None:
+                handler(message, addr)
+            elif not self.offload(lane, handler, message, addr):
+                self.drop_message(message_type, lane, addr)
+        except Exception as e:
+            print(f"[Peer] Error: {e}")
+
+    def offload(self, lane, function, *args, required=False):
+        """
+        Runs function(*args) on a validation pool lane.
+
+        Args:
+            lane (str): CHAIN_LANE or SERVE_LANE.
+            function (callable): The task.
+            required (bool): Queue it even if the lane is full.
+
+        Returns:
+            bool: False if the lane was full and the task was dropped.
+        """
+        return self.validation_pool.submit(lane, function, *args, required=required)
+
+    def drop_message(self, message_type, lane, addr):
+        """Reports a message dropped because its validation pool lane was full (every 100th drop after the first)."""
+        if self.validation_pool.dropped[lane] % 100 != 1:
+            return
+        print(f"[Peer] Validation {lane} lane full, dropped {message_type} from {addr[0]}:{addr[1]} "
+              f"({self.validation_pool.dropped[lane]} dropped so far)")
+
+    def poll_chain_sync(self):
+        """
+        Timer: checks chain sync and GETDATA for timed-out requests and stalled transfers
+        every POLL_INTERVAL.
+        """
+        try:
+            self.chain_transfer.poll()
+            self.directory.poll()
+            for block_hash, index, addr in self.block_requests.expired():
+                self.send_message({"type": "GETDATA", "index": index, "hash": block_hash}, addr)
+            if not self.chain_sync_poll_queued:
+                self.chain_sync_poll_queued = self.offload(CHAIN_LANE, self.run_chain_sync_poll)
+        finally:
+            self.loop.call_later(POLL_INTERVAL, self.poll_chain_sync)
+
+    def run_chain_sync_poll(self):
+        """Runs HeadersFirstSync.poll on the chain lane, which owns the headers-first sync state."""
+        self.chain_sync_poll_queued = False
+        self.chain_sync.poll()
+
+    def retry_until(self, state, payload, log_message):
+        """
+        Timer: sends payload to the tracker every RETRY_INTERVAL for as long as we are in state.
+
+        Args:
+            state (PeerState): The state that waits for the tracker's answer.
+            payload (dict): The request to send.
+            log_message (str): Printed after each attempt.
+        """
+        if self.state != state:
+            return
+        self.send_message(payload, (self.tracker_addr, self.tracker_port))
+        print(log_message)
+        self.loop.call_later(RETRY_INTERVAL, self.retry_until, state, payload, log_message)
+
+    def handle_register_ack(self, message, addr):
+        """
+        Completes registration with the wire format agreed with the tracker and the first
+        page of its peer list; the rest of the list is fetched with REQUEST_PEERS. A tracker
+        that sends no epoch sends the whole list instead.
+
+        Args:
+            message (dict): The REGISTER_ACK message.
+            addr (tuple): Address of the tracker.
+        """
+        if self.state != PeerState.REGISTERING:
+            return
+        wire_version = message.get("wire_version")
+        self.wire_version = wire_version if self.binary_wire and wire_version in SUPPORTED_VERSIONS else None
+        if "epoch" in message:
+            self.directory.handle_register_ack(message)
+            self.peers, self.wire_peers = self.directory.peers, self.directory.wire_peers
+        else:
+            peer_addresses = message.get("peer_list", [])
+            self.peers = {p for p in peer_addresses if p != f"{self.local_addr}:{self.local_port}"}
+            self.wire_peers = set(message.get("wire_peers", []))
+        self.has_registered = True
+        self.state = PeerState.CONNECTED
+        print(f"[Peer] Registered with tracker.")
+
+    def handle_ballot_options(self, message, addr):
+        """
+        Passes the voting options from the tracker to the client.
+
+        Args:
+            message (dict): The BALLOT_OPTIONS message.
+            addr (tuple): Address of the tracker.
+        """
+        if self.state != PeerState.REQUESTING_BALLOT:
+            return
+        self.state = PeerState.CONNECTED_WITH_BALLOT
+        print(f"[Peer] Received voting options: {message.get('voting_options')}")
+        self.client_instance.update_ballot(message.get("voting_options",[]))
+
+    def handle_update_peers(self, message, addr):
+        """
+        Replaces our peer list with the tracker's.
+
+        Args:
+            message (dict): The UPDATE_PEERS message.
+            addr (tuple): Address of the tracker.
+        """
+        new_peers = message.get("peer_list", [])
+        self.peers = {p for p in new_peers if p != f"{self.local_addr}:{self.local_port}"}
+        self.wire_peers = set(message.get("wire_peers", []))
+        print(f"[Peer] Updated peer list: {self.peers}")
+
+    def handle_peer_delta(self, message, addr):
+        """
+        Applies a PEER_JOINED or PEER_LEFT from the tracker to our peer list.
+
+        Args:
+            message (dict): The delta, with the tracker's new epoch and the peer's "ip:port".
+            addr (tuple): Address of the tracker.
+        """
+        if addr != (self.tracker_addr, self.tracker_port):
+            return
+        if self.directory.handle_delta(message):
+            self.peers, self.wire_peers = self.directory.peers, self.directory.wire_peers
+            print(f"[Peer] {'Added' if message['type'] == 'PEER_JOINED' else 'Removed'} peer {message['peer']} "
+                  f"(epoch {message['epoch']})")
+
+    def handle_peers(self, message, addr):
+        """
+        Adds a page of the tracker's peer list snapshot, replacing our peer list once
+        the last page is in.
+
+        Args:
+            message (dict): The PEERS message.
+            addr (tuple): Address of the tracker.
+        """
+        if addr != (self.tracker_addr, self.tracker_port):
+            return
+        if self.directory.handle_page(message):
+            self.peers, self.wire_peers = self.directory.peers, self.directory.wire_peers
+            print(f"[Peer] Updated peer list: {len(self.peers)} peer(s) (epoch {self.directory.epoch})")
+
+    def handle_block_bodies(self, message, addr):
+        """
+        Hands each body of a BLOCK_BODIES message to the headers-first sync.
+
+        Args:
+            message (dict): The BLOCK_BODIES message.
+            addr (tuple): Address of the responding peer.
+        """
+        for body in message.get("bodies", []):
+            self.chain_sync.handle_block_body(body, addr)
 
     def request_ballot_options(self):
         """
@@ -135,6 +383,8 @@ class Peer:
         Blocks until ballot options are received.
         """
         self.state = PeerState.REQUESTING_BALLOT
+        self.loop.call_soon_threadsafe(self.retry_until, PeerState.REQUESTING_BALLOT, {"type": "REQUEST_BALLOT"},
+                                       "[Peer] Sent ballot request to tracker...")
         while self.state == PeerState.REQUESTING_BALLOT:
             time.sleep(0.1)
         print("[Peer] Ready for casting ballot")
@@ -142,9 +392,15 @@ class Peer:
     def connect(self):
         """
         Connects the peer to the tracker and requests chain synchronization.
-        Blocks until registration is acknowledged.
+        Blocks until registration is acknowledged. A peer restarted from its data_dir
+        already has its chain and only receives the blocks it is missing.
         """
         self.state = PeerState.REGISTERING
+        payload = {"type": "REGISTER_PEER"}
+        if self.binary_wire:
+            payload["wire_versions"] = list(SUPPORTED_VERSIONS)
+        self.loop.call_soon_threadsafe(self.retry_until, PeerState.REGISTERING, payload,
+                                       "[Peer] Sent request to register with tracker...")
         while self.state == PeerState.REGISTERING:
             time.sleep(0.1)
         self.request_chain()
@@ -152,59 +408,134 @@ class Peer:
 
     def submit_vote(self, vote_transaction):
         """
-        Submits a new vote transaction, mines it into a block, and broadcasts the block.
+        Adds a new vote transaction to the mempool. The background miner seals it into
+        a block (together with other pending votes) and broadcasts the block.
+        Returns immediately.
 
         Args:
             vote_transaction (Transaction): The vote transaction to be mined.
+
+        Returns:
+            bool: True if queued, False if the voter already voted, has a pending vote or the mempool is full.
         """
-        
-        self.blockchain_obj.add_new_transaction(vote_transaction)
-        print("[Peer] Adding transaction to new block and initiating mining...")
-        mined = self.blockchain_obj.mine_block()
-        if mined:
+        if self.blockchain_obj.has_voted(vote_transaction.voter_id):
+            print(f"[Peer] Rejected vote from {vote_transaction.voter_id}: already recorded on the chain.")
+            return False
+        if not self.mempool.add(vote_transaction):
+            print(f"[Peer] Rejected vote from {vote_transaction.voter_id}: already pending or mempool full.")
+            return False
+        print("[Peer] Queued transaction for mining...")
+        return True
+
+    def mining_worker(self):
+        """
+        Mines batches of pending votes. This method runs in a dedicated thread.
+
+        Each block seals up to block_max_transactions votes, or fewer once the oldest
+        pending vote has waited block_max_wait seconds. If the chain tip changes while a
+        block is being mined (mining_cancel is set by handle_new_block or a chain sync),
+        the stale proof-of-work is abandoned and the batch goes back to the mempool to be
+        mined on top of the new tip.
+        """
+        while True:
+            batch = self.mempool.take_batch(self.block_max_transactions, self.block_max_wait)
+            for transaction in batch:
+                self.blockchain_obj.add_new_transaction(transaction)
+            print(f"[Peer] Adding {len(batch)} transaction(s) to new block and initiating mining...")
+
+            self.mining_cancel.clear()
+            if not self.blockchain_obj.mine_block(cancel_event=self.mining_cancel):
+                # mine_block keeps the pending votes if it was cancelled or lost the tip,
+                # and empties them if every vote was dropped as already on the chain
+                interrupted = bool(self.blockchain_obj.unconfirmed_transactions)
+                self.blockchain_obj.unconfirmed_transactions = []
+                # Votes that reached the chain through another peer's block are done
+                recorded = [tx for tx in batch if self.blockchain_obj.has_voted(tx.voter_id)]
+                self.mempool.confirm(recorded)
+                self.mempool.requeue([tx for tx in batch if not self.blockchain_obj.has_voted(tx.voter_id)])
+                if interrupted:
+                    print("[Peer] Chain tip changed while mining, restarting on new tip...")
+                else:
+                    print("[Peer] Every vote in the batch is already on the chain, no block mined.")
+                continue
+
+            self.mempool.confirm(batch)
             print("[Peer] Successfully mined newly added block.")
             block_dict = self.blockchain_obj.get_last_block_dict()
             self.broadcast_block(block_dict)
 
     def leave_network(self):
         """
-        Leaves the network by notifying the tracker.
+        Leaves the network by notifying the tracker, and shuts down the miner's worker processes.
         """
         payload = {"type": "LEAVE_PEER"}
-        self.sock.sendto(json.dumps(payload).encode(), (self.tracker_addr, self.tracker_port))
+        self.blockchain_obj.close_miner_pool()
+        self.blockchain_obj.flush()
+        self.send_message(payload, (self.tracker_addr, self.tracker_port))
         self.state = PeerState.CLOSED
         print("[Peer] Sent LEAVE_PEER to tracker. Closing peer...")
 
-    def broadcast_block(self, block):
+    def broadcast_block(self, block, exclude=()):
         """
-        Broadcasts a newly mined block to all known peers.
+        Broadcasts a newly mined or relayed block to all known peers, or to gossip_fanout
+        random peers in gossip mode. With announce_blocks only an INV is sent; peers
+        that lack the block fetch it with GETDATA.
 
         Args:
             block (dict): The block to broadcast (in dict form).
+            exclude (iterable): "ip:port" of peers known to have the block already.
         """
         if not self.broadcasting_and_listening_enabled:
             print("[Peer] Broadcasting is disabled. Skipping broadcast.")
             return
-        block_message = {"type": "NEW_BLOCK", "block": block}
-        print(f"[Peer] Broadcasting to {self.peers}")
-        for peer in self.peers:
+        self.seen_blocks.add(block.get("hash"))
+        if self.announce_blocks:
+            block_message = {"type": "INV", "index": block.get("index"), "hash": block.get("hash")}
+        else:
+            block_message = {"type": "NEW_BLOCK", "block": block}
+        targets = gossip_targets(self.peers, self.gossip_fanout, exclude)
+        print(f"[Peer] Broadcasting to {targets}")
+        for peer in targets:
             try:
                 ip, port = peer.split(":")
                 port = int(port)
-                self.sock.sendto(json.dumps(block_message).encode(), (ip, port))
+                self.send_datagrams([self.encode_message(block_message, (ip, port))], (ip, port))
                 print(f"[Peer] Broadcasted block to {ip}:{port}")
             except Exception as e:
                 print(f"[Peer] Failed to broadcast to {peer}: {e}")
 
-    def handle_new_block(self, block_dict):
+    def handle_new_block(self, block_dict, addr=None):
         """
         Handles an incoming NEW_BLOCK message by validating and adding the block.
-        If a fork is detected, requests chain sync.
+        If a fork is detected, requests chain sync. Copies of a block already handled are
+        ignored; in gossip mode a newly added block is relayed to gossip_fanout peers.
+        A block whose hash does not match its contents or misses the proof-of-work target
+        is rejected without being recorded as seen, so a forged copy cannot shadow the real
+        block. It requests chain sync at most once every FORGED_BLOCK_SYNC_INTERVAL, so a
+        flood of forged copies cannot start a sync for each one.
 
         Args:
             block_dict (dict): The received block as a dictionary.
+            addr (tuple): Address of the peer that sent it, which advertises a chain up to this block.
         """
+        if block_dict.get("hash") in self.seen_blocks:
+            return
         block_obj = block_from_dict(block_dict)
+        if not self.has_valid_proof(block_obj):
+            now = time.monotonic()
+            if self.forged_block_synced_at is not None and now - self.forged_block_synced_at < FORGED_BLOCK_SYNC_INTERVAL:
+                print(f"[Peer] Block {block_obj.index} does not match its hash or proof-of-work, ignored.")
+                return
+            self.forged_block_synced_at = now
+            print(f"[Peer] Block {block_obj.index} does not match its hash or proof-of-work, requesting chain sync")
+            self.request_chain()
+            return
+        # The hash now identifies this very block, so any later copy is a duplicate
+        if not self.seen_blocks.add(block_obj.hash):
+            return
+        self.loop.call_soon_threadsafe(self.block_requests.received, block_obj.hash)
+        if addr is not None:
+            self.note_peer_height(addr, block_obj.index + 1)
         if block_obj.index < len(self.blockchain_obj.chain):
             local_block = self.blockchain_obj.chain[block_obj.index]
             if local_block.hash != block_obj.hash:
@@ -215,11 +546,68 @@ class Peer:
         proof = block_obj.hash
         added = self.blockchain_obj.add_block(block_obj, proof)
         if added:
+            # Any block we are mining now builds on a stale tip, and its votes are no longer pending
+            self.mining_cancel.set()
+            self.mempool.confirm(block_obj.transactions)
             print("[Peer] Valid block added")
+            if self.gossip_fanout is not None:
+                self.broadcast_block(block_dict, exclude={f"{addr[0]}:{addr[1]}"} if addr else ())
         else:
             print("[Peer] Invalid block, requesting chain sync")
             self.request_chain()
 
+    def has_valid_proof(self, block_obj):
+        """
+        Checks that a received block's hash is the hash of its header and meets the
+        proof-of-work target, before anything is recorded about it.
+
+        Args:
+            block_obj (Block): The received block.
+
+        Returns:
+            bool: True if the hash is genuine.
+        """
+        try:
+            computed_hash = block_obj.compute_hash()
+        except ValueError:
+            return False
+        return computed_hash == block_obj.hash and computed_hash.startswith("0" * self.blockchain_obj.difficulty)
+
+    def handle_inv(self, message, addr):
+        """
+        Handles an INV announcing a block: requests the block with GETDATA unless it is
+        already known or requested from another peer. Called on the event loop thread,
+        so duplicate announcements cost no decoding of block bodies.
+
+        Args:
+            message (dict): The INV message, with the block's index and hash.
+            addr (tuple): Address of the announcing peer.
+        """
+        index, block_hash = message.get("index"), message.get("hash")
+        if not isinstance(index, int) or index < 0 or not isinstance(block_hash, str):
+            return
+        self.note_peer_height(addr, index + 1)
+        chain = self.blockchain_obj.chain
+        if block_hash in self.seen_blocks or (index < len(chain) and chain.hash_at(index) == block_hash):
+            return
+        if self.block_requests.announce(block_hash, index, addr):
+            self.send_message({"type": "GETDATA", "index": index, "hash": block_hash}, addr)
+
+    def handle_getdata(self, message, addr):
+        """
+        Answers a GETDATA with the requested block as a NEW_BLOCK, if it is still at that
+        position in our chain.
+
+        Args:
+            message (dict): The GETDATA message, with the block's index and hash.
+            addr (tuple): Address of the requesting peer.
+        """
+        index, block_hash = message.get("index"), message.get("hash")
+        chain = self.blockchain_obj.chain
+        if not isinstance(index, int) or not 0 <= index < len(chain) or chain.hash_at(index) != block_hash:
+            return
+        self.send_message({"type": "NEW_BLOCK", "block": chain[index].to_dict()}, addr)
+
     def validate_block(self, block):
         """
         Validates a block's linkage to the last known block.
@@ -237,24 +625,296 @@ class Peer:
 
     def request_chain(self):
         """
-        Sends a REQUEST_CHAIN message to all peers to initiate chain synchronization.
+        Sends a sync request to the peers chosen by sync_sources to initiate chain
+        synchronization. The request carries a block locator so that peers only send the
+        blocks after the last one we have in common. In headers-first mode it is a
+        REQUEST_HEADERS, and bodies are fetched afterwards by self.chain_sync on the chain
+        lane; otherwise it is a REQUEST_CHAIN that advertises how many datagrams we accept
+        in flight (see ChainTransfer). The request is built on the chain lane (see
+        send_sync_request), so callers never wait for the blockchain lock.
         """
-        payload = {"type": "REQUEST_CHAIN"}
-        for peer in self.peers:
+        self.offload(CHAIN_LANE, self.send_sync_request, required=True)
+
+    def send_sync_request(self):
+        """Runs on the chain lane: picks the sync sources and sends them request_chain's request."""
+        sources = []
+        for peer in self.sync_sources():
             ip, port = peer.split(":")
-            self.sock.sendto(json.dumps(payload).encode(), (ip, int(port)))
+            sources.append((ip, int(port)))
+        if self.headers_first:
+            self.chain_sync.request(sources)
+            return
+        locator = self.blockchain_obj.get_locator()
+        for addr in sources:
+            self.chain_transfer.request(addr, locator)
 
-    def send_chain(self, addr):
+    def note_peer_height(self, addr, height):
         """
-        Sends the entire blockchain to a requesting peer, block by block.
+        Remembers the longest chain a peer has advertised (in NEW_BLOCK, INV or a chain transfer).
+
+        Args:
+            addr (tuple): (ip, port) of the peer.
+            height (int): Length of the peer's chain.
+        """
+        peer = f"{addr[0]}:{addr[1]}"
+        if isinstance(height, int) and height > self.peer_heights.get(peer, 0):
+            self.peer_heights[peer] = height
+
+    def note_up_to_date(self, addr, height):
+        """
+        Replaces the chain length a peer advertised with the one it gave when it answered
+        a sync request with nothing newer than our chain.
+
+        Args:
+            addr (tuple): (ip, port) of the peer.
+            height (int): Length of the peer's chain.
+        """
+        if isinstance(height, int):
+            self.peer_heights[f"{addr[0]}:{addr[1]}"] = height
+
+    def sync_sources(self):
+        """
+        Picks the peers to sync from: the single peer advertising the longest chain, if
+        it is longer than ours, or else every peer (the best response wins, see
+        ChainTransfer and HeadersFirstSync). Peers whose last sync failed are skipped until
+        every peer has failed.
+
+        Returns:
+            list: "ip:port" of the peers to send REQUEST_CHAIN or REQUEST_HEADERS to.
+        """
+        candidates = self.peers - self.sync_failed_peers
+        if not candidates:
+            self.sync_failed_peers.clear()
+            candidates = self.peers
+        heights = {peer: self.peer_heights[peer] for peer in candidates if peer in self.peer_heights}
+        if heights:
+            best = max(heights, key=heights.get)
+            if heights[best] > len(self.blockchain_obj.chain):
+                return [best]
+        return list(candidates)
+
+    def chain_sync_failed(self, addr):
+        """
+        Called when a peer does not answer REQUEST_CHAIN or REQUEST_HEADERS, its transfer
+        or body download stalls or its chain is invalid: forget the chain it advertised and
+        sync from the peers that have not failed yet instead (see retry_chain_sync). A peer
+        that answers with nothing newer than our chain has not failed.
+
+        Args:
+            addr (tuple): (ip, port) of the peer.
+        """
+        peer = f"{addr[0]}:{addr[1]}"
+        self.peer_heights.pop(peer, None)
+        self.sync_failed_peers.add(peer)
+        self.offload(CHAIN_LANE, self.retry_chain_sync, peer, required=True)
+
+    def retry_chain_sync(self, peer):
+        """
+        Runs on the chain lane after a sync from peer failed: sends a new sync request
+        unless another one is still in progress or every peer has failed.
+
+        Args:
+            peer (str): "ip:port" of the peer whose sync failed.
+        """
+        busy = self.chain_sync.busy() if self.headers_first else self.chain_transfer.busy()
+        if self.peers - self.sync_failed_peers and not busy:
+            print(f"[Peer] Sync from {peer} failed, trying other peers.")
+            self.send_sync_request()
+
+    def chain_synced(self):
+        """Called after a sync spliced a longer chain on: restart mining and give failed peers another chance."""
+        self.mining_cancel.set()
+        self.sync_failed_peers.clear()
+
+    def send_chain(self, addr, locator=(), window=None, request_id=None):
+        """
+        Sends a requesting peer the blocks after the last block it has in common with us,
+        packing as many consecutive blocks into each CHAIN_BLOCKS datagram as fit in
+        datagram_budget bytes. The transfer is numbered so that the requester can ask for
+        lost blocks again, and paced within the requester's window so that it does not
+        overrun the requester's socket buffer (see ChainTransfer). Without a locator the
+        entire chain is sent. If the requester has all our blocks, an empty CHAIN_BLOCKS
+        tells it so, so that it does not take our silence for a failure.
+
+        Args:
+            addr (tuple): Address of the requesting peer.
+            locator (list): [index, hash] pairs from the requester's Blockchain.get_locator().
+            window (int): Datagrams the requester accepts in flight, or None if it did not say.
+            request_id (int): The requester's number for this request, echoed as the transfer number.
+        """
+        start = self.blockchain_obj.find_fork_point(locator)
+        blocks = self.blockchain_obj.chain[start:]
+        total_blocks = start + len(blocks)
+        if not blocks:
+            if isinstance(request_id, int):
+                self.send_message({"type": "CHAIN_BLOCKS", "transfer": request_id, "start": total_blocks,
+                                   "total_blocks": total_blocks, "blocks": []}, addr)
+            print(f"[Peer] {addr[0]}:{addr[1]} already has our chain, nothing to send.")
+            return
+        count = self.chain_transfer.send(addr, start, total_blocks, [self.block_to_dict(block) for block in blocks],
+                                         window, request_id)
+        print(f"[Peer] Sending blocks {start}-{total_blocks - 1} to {addr[0]}:{addr[1]} in {count} datagram(s)")
+
+    def send_headers(self, addr, locator):
+        """
+        Sends the headers of the blocks after the last block the requester has in common
+        with us, HEADERS_PER_MESSAGE per datagram, or an empty HEADERS if it has them all.
+
+        Args:
+            addr (tuple): Address of the requesting peer.
+            locator (list): [index, hash] pairs from the requester's Blockchain.get_locator().
+        """
+        start = self.blockchain_obj.find_fork_point(locator)
+        headers = [block.header_dict() for block in self.blockchain_obj.chain[start:]]
+        if not headers:
+            self.send_message({"type": "HEADERS", "start": start, "total_blocks": start, "offset": 0,
+                               "headers": []}, addr)
+            return
+        total_blocks = start + len(headers)
+        print(f"[Peer] Sending headers {start}-{total_blocks - 1} to {addr[0]}:{addr[1]}")
+        for offset in range(0, len(headers), HEADERS_PER_MESSAGE):
+            payload = {"type": "HEADERS", "start": start, "total_blocks": total_blocks, "offset": offset,
+                       "headers": headers[offset:offset + HEADERS_PER_MESSAGE]}
+            self.send_message(payload, addr)
+
+    def send_bodies(self, addr, first, hashes):
+        """
+        Sends the transactions of the requested blocks, packed into as few BLOCK_BODIES
+        datagrams as datagram_budget allows. Blocks we no longer have at that position
+        (e.g. after a reorg) are skipped.
 
         Args:
             addr (tuple): Address of the requesting peer.
+            first (int): Chain position of the first requested block.
+            hashes (list): Hashes of the requested consecutive blocks.
+        """
+        if not isinstance(first, int) or first < 0:
+            return
+        chain = self.blockchain_obj.chain
+        bodies = []
+        for index, block_hash in enumerate(hashes[:BODY_RANGE_SIZE], first):
+            if index >= len(chain) or chain.hash_at(index) != block_hash:
+                continue
+            bodies.append({"index": index, "hash": block_hash, "transactions": chain[index].transaction_dicts()})
+        self.send_datagrams(pack({"type": "BLOCK_BODIES"}, "bodies", bodies, self.datagram_budget,
+                                 self.wire_version_for(addr)), addr)
+
+    def send_message(self, payload, addr):
         """
-        total_blocks = len(self.blockchain_obj.chain)
-        for i, block in enumerate(self.blockchain_obj.chain):
-            payload = {"type": "CHAIN_BLOCK", "index": i, "block": self.block_to_dict(block), "total_blocks": total_blocks}
-            self.sock.sendto(json.dumps(payload).encode(), addr)
+        Sends a message to a peer or the tracker, in binary if it speaks the agreed format.
+
+        Args:
+            payload (dict): The message.
+            addr (tuple): (ip, port) of the peer.
+        """
+        try:
+            self.send_datagrams([self.encode_message(payload, addr)], addr)
+        except Exception as e:
+            print(f"[Peer] Failed to send {payload.get('type')} to {addr[0]}:{addr[1]}: {e}")
+
+    def send_datagrams(self, datagrams, addr):
+        """
+        Sends already encoded datagrams to a peer through our transport. Safe to call
+        from any thread: off the event loop thread the send is handed to the loop.
+
+        Args:
+            datagrams (list): Encoded messages (bytes), e.g. from wire.pack.
+            addr (tuple): (ip, port) of the peer.
+        """
+        if in_loop_thread(self.loop):
+            self.write_datagrams(datagrams, addr)
+        else:
+            self.loop.call_soon_threadsafe(self.write_datagrams, datagrams, addr)
+
+    def write_datagrams(self, datagrams, addr):
+        """Writes datagrams to the transport (on the event loop thread)."""
+        try:
+            for data in datagrams:
+                self.transport.sendto(data, addr)
+        except Exception as e:
+            print(f"[Peer] Failed to send to {addr[0]}:{addr[1]}: {e}")
+
+    def encode_message(self, payload, addr):
+        """
+        Encodes a message for addr in the format returned by wire_version_for.
+
+        Args:
+            payload (dict): The message.
+            addr (tuple): (ip, port) of the receiver.
+
+        Returns:
+            bytes: The datagram.
+        """
+        return encode(payload, self.wire_version_for(addr))
+
+    def wire_version_for(self, addr):
+        """
+        Returns the binary format agreed with the tracker if addr is the tracker or a peer
+        the tracker listed as speaking it, otherwise None (JSON).
+
+        Args:
+            addr (tuple): (ip, port) of the receiver.
+        """
+        if addr == (self.tracker_addr, self.tracker_port) or f"{addr[0]}:{addr[1]}" in self.wire_peers:
+            return self.wire_version
+        return None
+
+    def handle_chain_block(self, message, addr):
+        """
+        Collects a CHAIN_BLOCK message (one block, as sent by peers that do not batch).
+
+        Args:
+            message (dict): The CHAIN_BLOCK message.
+            addr (tuple): Address of the responding peer.
+        """
+        self.chain_transfer.handle_blocks(addr, None, message.get("start", 0), message.get("total_blocks"),
+                                          [(message.get("index"), message.get("block"))])
+
+    def handle_chain_blocks(self, message, addr):
+        """
+        Unpacks a CHAIN_BLOCKS message (consecutive blocks packed into one datagram).
+
+        Args:
+            message (dict): The CHAIN_BLOCKS message with transfer, start, total_blocks and blocks.
+            addr (tuple): Address of the responding peer.
+        """
+        blocks = message.get("blocks", [])
+        if blocks == []:  # The responder has no block we lack
+            self.note_up_to_date(addr, message.get("total_blocks"))
+            self.chain_transfer.handle_up_to_date(addr, message.get("transfer"))
+            return
+        self.chain_transfer.handle_blocks(addr, message.get("transfer"), message.get("start", 0),
+                                          message.get("total_blocks"),
+                                          [(block.get("index"), block) for block in blocks if isinstance(block, dict)])
+
+    def handle_headers(self, message, addr):
+        """
+        Passes HEADERS to self.chain_sync, first noting the chain length of a responder
+        that has nothing newer than our chain.
+
+        Args:
+            message (dict): The HEADERS message.
+            addr (tuple): Address of the responder.
+        """
+        if message.get("headers") == []:
+            self.note_up_to_date(addr, message.get("total_blocks"))
+        self.chain_sync.handle_headers(message, addr)
+
+    def finish_chain_transfer(self, addr, start, blocks):
+        """
+        Splices a completely received chain suffix onto our chain after the shared blocks.
+
+        Args:
+            addr (tuple): Address of the responding peer.
+            start (int): Index of the first received block.
+            blocks (list): The received Block objects, in order.
+        """
+        if self.blockchain_obj.splice_chain(start, blocks):
+            self.chain_synced()
+            print(f"[Peer] Chain synced from peer (valid suffix from block {start} accepted).")
+        else:
+            print("[Peer] Received chain is invalid or not longer → rejected.")
+            self.chain_sync_failed(addr)
 
     def block_to_dict(self, block):
         """
@@ -266,14 +926,7 @@ class Peer:
         Returns:
             dict: The block as a dictionary.
         """
-        return {
-            'index': block.index,
-            'transactions': [tx.to_dict() for tx in block.transactions],
-            'timestamp': block.timestamp,
-            'previous_hash': block.previous_hash,
-            'nonce': block.nonce,
-            'hash': block.hash
-        }
+        return block.to_dict()
 
     def sync_chain(self, received_chain):
         """
@@ -288,7 +941,8 @@ class Peer:
         if len(new_chain) > len(self.blockchain_obj.chain):
             is_valid = self.blockchain_obj.is_valid_chain(new_chain)
             if is_valid:
-                self.blockchain_obj.chain = new_chain
+                self.blockchain_obj.replace_chain(new_chain)
+                self.mining_cancel.set()
                 print("[Peer] Synced chain from network (accepted longer valid chain).")
             else:
                 print("[Peer] Received invalid chain → ignored.")
@@ -301,7 +955,8 @@ class Peer:
         """
         payload = {"type": "POKE-ACK"}
         try:
-            self.sock.sendto(json.dumps(payload).encode(), (self.tracker_addr, self.tracker_port))
+            self.send_datagrams([self.encode_message(payload, (self.tracker_addr, self.tracker_port))],
+                                (self.tracker_addr, self.tracker_port))
             print(f"[Peer] Sent POKE-ACK to tracker at {self.tracker_addr}:{self.tracker_port}")
         except Exception as e:
             print(f"[Peer] Failed to send POKE-ACK to tracker: {e}")
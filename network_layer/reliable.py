@@ -0,0 +1,499 @@
+import random
+import threading
+import time
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+from blockchain_layer.blockchain import block_from_dict
+from network_layer.pacing import TokenBucket, PACING_RATE, PACING_BURST
+from network_layer.wire import pack, DATAGRAM_BUDGET
+
+NACK_DELAY = 0.3  # Quiet seconds before the receiver asks for the blocks it is missing
+MAX_NACK_RANGES = 32  # Missing index ranges listed in one CHAIN_NACK
+MAX_NACKS = 8  # CHAIN_NACK rounds without progress before a transfer is abandoned
+SESSION_TIMEOUT = 10.0  # Seconds the sender keeps a transfer's blocks for retransmission after last use
+MAX_SEND_SESSIONS = 32  # Transfers kept for retransmission; the least recently used is dropped first
+REQUEST_TIMEOUT = 1.0  # Seconds before an unanswered REQUEST_CHAIN is sent again
+REQUEST_RETRIES = 3  # Times an unanswered REQUEST_CHAIN is sent again
+RECEIVE_WINDOW = 64  # Datagrams a requester lets a responder send beyond the highest block received
+MAX_TRANSFER_BLOCKS = 1_000_000  # Longest chain suffix a requester accepts in one transfer
+
+
+class _OutgoingTransfer:
+    """Blocks sent to one requester, kept so that lost ones can be sent again."""
+
+    def __init__(self, start, total_blocks, block_dicts, datagrams, counts, window, now):
+        self.start = start
+        self.total_blocks = total_blocks
+        self.block_dicts = block_dicts
+        self.datagrams = datagrams
+        self.ends = list(accumulate(counts, initial=start))[1:]  # Index after the last block of each datagram
+        self.cursor = 0  # Next datagram to send
+        self.received = start  # Index after the highest block the requester reported
+        self.window = window  # Datagrams allowed beyond received, or None for no limit
+        self.resend = deque()  # Datagrams to send again, ahead of new ones
+        self.used_at = now
+
+    def sent_end(self):
+        """Return the index after the last block sent so far."""
+        return self.ends[self.cursor - 1] if self.cursor else self.start
+
+    def next_datagram(self):
+        """Return the next datagram the window allows (without taking it), or None."""
+        if self.resend:
+            return self.resend[0]
+        if self.cursor == len(self.datagrams):
+            return None
+        if self.window is not None and self.cursor - bisect_right(self.ends, self.received) >= self.window:
+            return None
+        return self.datagrams[self.cursor]
+
+    def take_datagram(self):
+        if self.resend:
+            self.resend.popleft()
+        else:
+            self.cursor += 1
+
+
+class _IncomingTransfer:
+    """Blocks received from one responder, reassembled by index."""
+
+    def __init__(self, transfer_id, start, total_blocks, now):
+        self.transfer_id = transfer_id  # None for responders that do not number their transfers
+        self.start = start
+        self.total_blocks = total_blocks
+        self.blocks = {}  # index -> Block
+        self.progress_at = now  # When the last new block arrived
+        self.nacked_at = None
+        self.nacks = 0  # CHAIN_NACKs sent since the last new block
+        self.highest = start - 1  # Highest block index received
+        self.unacked = 0  # Datagrams received since the last CHAIN_ACK
+
+    def missing_ranges(self, limit):
+        """
+        Return up to limit [first, last] ranges of block indexes not received yet. Walks
+        the received indexes rather than the whole suffix, so the cost does not depend on
+        the total_blocks the responder advertised.
+        """
+        ranges = []
+        expected = self.start
+        for index in sorted(self.blocks):
+            if index > expected:
+                ranges.append([expected, index - 1])
+                if len(ranges) == limit:
+                    return ranges
+            expected = index + 1
+        if expected < self.total_blocks:
+            ranges.append([expected, self.total_blocks - 1])
+        return ranges
+
+
+class ChainTransfer:
+    """
+    Reliable, paced chain transfer over UDP for REQUEST_CHAIN sync.
+
+    The responder numbers each transfer (`transfer`) and sends the blocks in
+    CHAIN_BLOCKS datagrams; block indexes act as sequence numbers. It keeps the
+    transfer's blocks for SESSION_TIMEOUT seconds after their last use. The requester
+    reassembles blocks by index, and once a transfer has been quiet for NACK_DELAY with
+    gaps left it sends CHAIN_NACK listing the missing index ranges; only those blocks
+    are sent again. A transfer that makes no progress after MAX_NACKS rounds is
+    dropped with its partial blocks, and a REQUEST_CHAIN that gets no answer is
+    repeated up to REQUEST_RETRIES times. A responder that has no block the requester
+    lacks answers with an empty CHAIN_BLOCKS (see handle_up_to_date) instead.
+
+    Each sync session is keyed by responder and request ID: the requester numbers its
+    REQUEST_CHAIN (`request`) and the responder uses that number as the transfer's, so
+    blocks from other responders, older requests or cancelled sessions never mix into a
+    session. When several responders answer, only the one advertising the longest chain
+    (the first to answer, on a tie) is kept; the others get CHAIN_CANCEL and stop sending.
+
+    Sending is flow-controlled so that a long chain does not overrun the requester's
+    socket buffer. The requester advertises a window (in datagrams) in REQUEST_CHAIN
+    and reports the highest block it has received in a CHAIN_ACK every quarter window;
+    the responder keeps at most a window of datagrams beyond that in flight. A sender
+    thread paces all transfers through a token bucket (pacing_rate bytes per second).
+    With pacing_rate=None every datagram is sent at once and windows are ignored.
+
+    Peers sync this way only with headers_first=False; headers-first sync (the default)
+    fetches bodies through HeadersFirstSync instead.
+
+    Usage:
+        transfer = ChainTransfer(peer.send_message, peer.send_datagrams, peer.wire_version_for, on_complete)
+        transfer.request(addr, locator)  # requester
+        transfer.send(addr, start, total_blocks, block_dicts, window, request_id)  # responder
+        # in the message loop:
+        transfer.handle_blocks(addr, transfer_id, start, total_blocks, indexed_blocks)
+        transfer.handle_nack(message, addr)
+        transfer.handle_ack(message, addr)
+        transfer.handle_cancel(message, addr)
+        transfer.handle_up_to_date(addr, transfer_id)  # empty CHAIN_BLOCKS
+        transfer.poll()
+    """
+
+    def __init__(self, send, send_datagrams, wire_version_for, on_complete, on_failed=None, budget=DATAGRAM_BUDGET,
+                 pacing_rate=PACING_RATE, window=RECEIVE_WINDOW):
+        """
+        Args:
+            send (callable): send(payload_dict, addr) delivers one message.
+            send_datagrams (callable): send_datagrams(list_of_bytes, addr) delivers encoded datagrams.
+            wire_version_for (callable): wire_version_for(addr) -> binary format for addr, or None for JSON.
+            on_complete (callable): on_complete(addr, start, blocks) with the responder and the Block
+                objects of a finished transfer.
+            on_failed (callable): on_failed(addr) when a request to addr goes unanswered or its
+                transfer stalls.
+            budget (int): Largest datagram to pack blocks into, in bytes.
+            pacing_rate (float): Bytes per second to send bulk transfers at, or None to send unpaced.
+            window (int): Datagrams we let a responder send beyond the highest block we received.
+        """
+        self.send_message = send
+        self.send_datagrams = send_datagrams
+        self.wire_version_for = wire_version_for
+        self.on_complete = on_complete
+        self.on_failed = on_failed
+        self.budget = budget
+        self.window = window
+        self.lock = threading.Lock()
+        self.outgoing = {}  # (requester addr, transfer id) -> _OutgoingTransfer, in round-robin order
+        self.incoming = {}  # (responder addr, request id) -> _IncomingTransfer
+        self.requests = {}  # responder addr -> [request payload, time sent, retries left], not answered yet
+
+        self.bucket = None
+        if pacing_rate:
+            self.bucket = TokenBucket(pacing_rate, max(PACING_BURST, budget))
+            self.ready = threading.Condition(self.lock)  # Notified when a transfer may have datagrams to send
+            self.sender_thread = threading.Thread(target=self.pace_transfers, daemon=True)
+            self.sender_thread.start()
+
+    # --- Responder side ---
+
+    def send(self, addr, start, total_blocks, block_dicts, window=None, request_id=None):
+        """
+        Start a numbered transfer of block_dicts (the blocks start..total_blocks-1). A
+        repeated request whose transfer is still being paced out is not started again.
+
+        Args:
+            addr (tuple): Address of the requester.
+            start (int): Index of the first block sent.
+            total_blocks (int): Length of our chain.
+            block_dicts (list): The blocks as dicts.
+            window (int): The requester's advertised window in datagrams, or None if it sent none.
+            request_id (int): The requester's number for the request, used as the transfer number;
+                None to pick one.
+
+        Returns:
+            int: Number of datagrams in the transfer.
+        """
+        now = time.monotonic()
+        transfer_id = request_id if isinstance(request_id, int) and request_id >= 0 else random.getrandbits(32)
+        with self.lock:
+            current = self.outgoing.get((addr, transfer_id))
+            if current is not None and current.next_datagram() is not None:
+                return len(current.datagrams)
+        counts = []
+        payload = {"type": "CHAIN_BLOCKS", "transfer": transfer_id, "start": start, "total_blocks": total_blocks}
+        datagrams = pack(payload, "blocks", block_dicts, self.budget, self.wire_version_for(addr), counts)
+        if not (isinstance(window, int) and window > 0):
+            window = None
+        transfer = _OutgoingTransfer(start, total_blocks, block_dicts, datagrams, counts, window, now)
+        with self.lock:
+            self.outgoing[(addr, transfer_id)] = transfer
+            while len(self.outgoing) > MAX_SEND_SESSIONS:
+                oldest = min(self.outgoing, key=lambda key: self.outgoing[key].used_at)
+                del self.outgoing[oldest]
+            if self.bucket is not None:
+                self.ready.notify()
+                return len(datagrams)
+            transfer.cursor = len(datagrams)
+        self.send_datagrams(datagrams, addr)
+        return len(datagrams)
+
+    def handle_nack(self, message, addr):
+        """
+        Send again the blocks a CHAIN_NACK lists as missing (only those sent already;
+        later ones are still to come).
+
+        Args:
+            message (dict): CHAIN_NACK with transfer and ranges ([first, last] index pairs).
+            addr (tuple): Address of the requester.
+        """
+        transfer_id = message.get("transfer")
+        ranges = message.get("ranges", [])
+        with self.lock:
+            transfer = self.outgoing.get((addr, transfer_id))
+            if transfer is None or not isinstance(ranges, list):
+                return
+            transfer.used_at = time.monotonic()
+            sent_end = transfer.sent_end()
+        resend = []
+        for block_range in ranges[:MAX_NACK_RANGES]:
+            if not (isinstance(block_range, list) and len(block_range) == 2
+                    and all(isinstance(i, int) for i in block_range)):
+                continue
+            first = max(block_range[0], transfer.start)
+            last = min(block_range[1], sent_end - 1)
+            resend.extend(transfer.block_dicts[first - transfer.start:last - transfer.start + 1])
+        if not resend:
+            return
+        print(f"[Peer] Resending {len(resend)} block(s) to {addr[0]}:{addr[1]} after CHAIN_NACK")
+        payload = {"type": "CHAIN_BLOCKS", "transfer": transfer_id, "start": transfer.start,
+                   "total_blocks": transfer.total_blocks}
+        datagrams = pack(payload, "blocks", resend, self.budget, self.wire_version_for(addr))
+        if self.bucket is None:
+            self.send_datagrams(datagrams, addr)
+            return
+        with self.lock:
+            transfer.resend.extend(datagrams)
+            self.ready.notify()
+
+    def handle_ack(self, message, addr):
+        """
+        Slide a transfer's window forward on a CHAIN_ACK.
+
+        Args:
+            message (dict): CHAIN_ACK with transfer, received (index after the highest
+                block received) and window (datagrams the requester accepts beyond it).
+            addr (tuple): Address of the requester.
+        """
+        received = message.get("received")
+        window = message.get("window")
+        with self.lock:
+            transfer = self.outgoing.get((addr, message.get("transfer")))
+            if transfer is None or not isinstance(received, int) or not isinstance(window, int):
+                return
+            transfer.used_at = time.monotonic()
+            transfer.received = max(transfer.received, min(received, transfer.total_blocks))
+            transfer.window = max(1, window)
+            if self.bucket is not None:
+                self.ready.notify()
+
+    def handle_cancel(self, message, addr):
+        """
+        Stop a transfer the requester no longer wants.
+
+        Args:
+            message (dict): CHAIN_CANCEL with transfer.
+            addr (tuple): Address of the requester.
+        """
+        with self.lock:
+            transfer = self.outgoing.pop((addr, message.get("transfer")), None)
+        if transfer is not None:
+            print(f"[Peer] {addr[0]}:{addr[1]} cancelled its chain transfer.")
+
+    def pace_transfers(self):
+        """
+        Sender thread: send the datagrams of all outgoing transfers, one at a time in
+        round-robin order, as their windows and the token bucket allow.
+        """
+        while True:
+            with self.lock:
+                for key, transfer in self.outgoing.items():
+                    data = transfer.next_datagram()
+                    if data is not None:
+                        break
+                else:
+                    self.ready.wait()
+                    continue
+                wait = self.bucket.delay(len(data))
+                if wait:
+                    self.ready.wait(wait)
+                    continue
+                transfer.take_datagram()
+                transfer.used_at = time.monotonic()
+                self.outgoing[key] = self.outgoing.pop(key)  # Next turn goes to another transfer
+            self.send_datagrams([data], key[0])
+
+    # --- Requester side ---
+
+    def request(self, addr, locator):
+        """
+        Send a numbered REQUEST_CHAIN to addr, unless a request to it or a transfer from
+        it is already in progress. Unanswered requests are repeated by poll().
+
+        Args:
+            addr (tuple): Address of the responder.
+            locator (list): [index, hash] pairs from Blockchain.get_locator().
+
+        Returns:
+            int: The request ID, or None if nothing was sent.
+        """
+        with self.lock:
+            if addr in self.requests or any(key[0] == addr for key in self.incoming):
+                return None
+            request_id = random.getrandbits(32)
+            payload = {"type": "REQUEST_CHAIN", "request": request_id, "window": self.window, "locator": locator}
+            self.requests[addr] = [payload, time.monotonic(), REQUEST_RETRIES]
+        self.send_message(payload, addr)
+        return request_id
+
+    def busy(self):
+        """Return True while a request or transfer is in progress."""
+        with self.lock:
+            return bool(self.requests or self.incoming)
+
+    def handle_blocks(self, addr, transfer_id, start, total_blocks, indexed_blocks):
+        """
+        Collect chain blocks for one sync session and, once the responder's suffix is
+        complete, pass it to on_complete. Blocks that answer no request of ours are ignored,
+        and so are responses advertising more than MAX_TRANSFER_BLOCKS blocks after start.
+
+        Args:
+            addr (tuple): Address of the responder.
+            transfer_id (int): Our request ID, echoed by the responder, or None if it does not number transfers.
+            start (int): First block of the responder's suffix (the fork point).
+            total_blocks (int): Length of the responder's chain.
+            indexed_blocks (list): (index, block dict) pairs received.
+        """
+        if not isinstance(start, int) or not isinstance(total_blocks, int):
+            return
+        if not 0 <= start < total_blocks <= start + MAX_TRANSFER_BLOCKS:
+            return
+        received = {index: block_dict for index, block_dict in indexed_blocks
+                    if isinstance(index, int) and start <= index < total_blocks}
+        if not received:
+            return
+        now = time.monotonic()
+        key = (addr, transfer_id)
+        ack = None
+        cancels = []
+        with self.lock:
+            transfer = self.incoming.get(key)
+            if transfer is None:
+                request = self.requests.get(addr)
+                if request is None or transfer_id not in (request[0]["request"], None):
+                    return
+                del self.requests[addr]
+                cancels = self._choose_session(key, total_blocks)
+                if key in cancels:
+                    transfer = None
+                else:
+                    transfer = self.incoming[key] = _IncomingTransfer(transfer_id, start, total_blocks, now)
+            elif (transfer.start, transfer.total_blocks) != (start, total_blocks):
+                return
+        for cancel_addr, cancel_id in cancels:
+            if cancel_id is not None:
+                self.send_message({"type": "CHAIN_CANCEL", "transfer": cancel_id}, cancel_addr)
+        if transfer is None:
+            return
+
+        with self.lock:
+            new = [index for index in received if index not in transfer.blocks]
+            for index in new:
+                transfer.blocks[index] = block_from_dict(received[index])
+            if new:
+                transfer.progress_at = now
+                transfer.nacks = 0
+                transfer.highest = max(transfer.highest, max(new))
+            transfer.unacked += 1
+            complete = len(transfer.blocks) == total_blocks - start
+            if complete:
+                self.incoming.pop(key, None)
+            elif transfer_id is not None and transfer.unacked >= max(1, self.window // 4):
+                ack = self.ack_message(transfer)
+        if ack:
+            self.send_message(ack, addr)
+        if new:
+            print(f"[Peer] Received block(s) {min(new)}-{max(new)}/{total_blocks - 1}")
+        if complete:
+            self.on_complete(addr, start, [transfer.blocks[i] for i in range(start, total_blocks)])
+
+    def handle_up_to_date(self, addr, transfer_id):
+        """
+        Take an empty CHAIN_BLOCKS as the answer to our request: the responder has no block
+        we lack. Unlike a request that goes unanswered, this is not a failure.
+
+        Args:
+            addr (tuple): Address of the responder.
+            transfer_id (int): Our request ID, echoed by the responder.
+        """
+        with self.lock:
+            request = self.requests.get(addr)
+            if request is None or request[0]["request"] != transfer_id:
+                return
+            del self.requests[addr]
+        print(f"[Peer] {addr[0]}:{addr[1]} has no blocks we lack.")
+
+    def _choose_session(self, key, total_blocks):
+        """
+        Decide between a new response and the sessions already in progress (call with the
+        lock held): the longest advertised chain wins, the earlier session on a tie, and an
+        older session from the same responder always gives way. Losing sessions are removed.
+
+        Args:
+            key (tuple): (responder addr, request id) of the new response.
+            total_blocks (int): Length of the chain it advertises.
+
+        Returns:
+            list: Keys of the sessions to cancel; includes key if the new response loses.
+        """
+        addr = key[0]
+        for (other, _), transfer in self.incoming.items():
+            if other != addr and transfer.total_blocks >= total_blocks:
+                print(f"[Peer] Already syncing {transfer.total_blocks} block(s) from {other[0]}:{other[1]}, "
+                      f"cancelling the transfer from {addr[0]}:{addr[1]}.")
+                return [key]
+        cancels = list(self.incoming)
+        self.incoming.clear()
+        for other, _ in cancels:
+            if other != addr:
+                print(f"[Peer] {addr[0]}:{addr[1]} has a longer chain, cancelling the transfer from {other[0]}:{other[1]}.")
+        return cancels
+
+    def ack_message(self, transfer):
+        """Return the CHAIN_ACK reporting our progress on an incoming transfer (call with the lock held)."""
+        transfer.unacked = 0
+        return {"type": "CHAIN_ACK", "transfer": transfer.transfer_id, "received": transfer.highest + 1,
+                "window": self.window}
+
+    def poll(self, now=None):
+        """
+        Send CHAIN_NACKs for quiet transfers with gaps, drop transfers that stopped making
+        progress and expired retransmission state, and repeat unanswered requests. Calls
+        on_failed for each responder whose transfer or request was given up. Call regularly
+        from the message loop.
+        """
+        now = time.monotonic() if now is None else now
+        nacks = []
+        requests = []
+        failed = []
+        with self.lock:
+            for key, transfer in list(self.incoming.items()):
+                addr = key[0]
+                if transfer.transfer_id is None:
+                    # Unnumbered transfers cannot be NACKed: wait as long as MAX_NACKS rounds would
+                    if now - transfer.progress_at < NACK_DELAY * MAX_NACKS:
+                        continue
+                elif now - max(transfer.progress_at, transfer.nacked_at or 0) < NACK_DELAY:
+                    continue
+                if transfer.transfer_id is None or transfer.nacks >= MAX_NACKS:
+                    print(f"[Peer] Chain transfer from {addr[0]}:{addr[1]} stalled with "
+                          f"{transfer.total_blocks - transfer.start - len(transfer.blocks)} block(s) missing, dropped.")
+                    del self.incoming[key]
+                    failed.append(addr)
+                    continue
+                transfer.nacks += 1
+                transfer.nacked_at = now
+                nacks.append((addr, {"type": "CHAIN_NACK", "transfer": transfer.transfer_id,
+                                     "ranges": transfer.missing_ranges(MAX_NACK_RANGES)}))
+                nacks.append((addr, self.ack_message(transfer)))  # In case the last CHAIN_ACK was lost
+
+            for key, transfer in list(self.outgoing.items()):
+                if now - transfer.used_at >= SESSION_TIMEOUT:
+                    del self.outgoing[key]
+
+            for addr, request in list(self.requests.items()):
+                payload, sent_at, retries = request
+                if now - sent_at < REQUEST_TIMEOUT:
+                    continue
+                if retries == 0:
+                    del self.requests[addr]  # The peer is gone (one with nothing to send says so)
+                    failed.append(addr)
+                    continue
+                request[1:] = [now, retries - 1]
+                requests.append((addr, payload))
+
+        for addr, payload in nacks + requests:
+            self.send_message(payload, addr)
+        if self.on_failed:
+            for addr in failed:
+                self.on_failed(addr)
@@ -0,0 +1,291 @@
+import sys
+import os
+import io
+import time
+import random
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.block import Block
+from blockchain_layer.transaction import Transaction
+from blockchain_layer.blockchain import Blockchain
+from network_layer.wire import decode, encode, WIRE_VERSION
+from network_layer.reliable import ChainTransfer, NACK_DELAY, MAX_NACKS, SESSION_TIMEOUT, MAX_TRANSFER_BLOCKS
+from network_layer.pacing import TokenBucket
+from network_layer.peer import Peer
+
+SENDER = ("127.0.0.1", 5001)
+RECEIVER = ("127.0.0.1", 5002)
+
+
+def make_chain(length):
+    blocks = []
+    previous_hash = "0"
+    for i in range(length):
+        block = Block(i, [Transaction(f"voter{i}", "candidateA")], timestamp="2024-05-01 12:00:00",
+                      previous_hash=previous_hash)
+        block.hash = previous_hash = block.compute_hash()
+        blocks.append(block.to_dict())
+    return blocks
+
+
+class LossyLink:
+    """Carries datagrams between two ChainTransfers in memory, dropping each with probability loss."""
+
+    def __init__(self, loss, seed):
+        self.rng = random.Random(seed)
+        self.loss = loss
+        self.queue = []  # (destination addr, datagram)
+        self.sent = 0
+        self.dropped = 0
+
+    def sender_for(self, destination):
+        def send_datagrams(datagrams, addr):
+            for data in datagrams:
+                self.sent += 1
+                if self.rng.random() < self.loss:
+                    self.dropped += 1
+                else:
+                    self.queue.append((destination, data))
+        return send_datagrams
+
+
+def run_transfer(blocks, loss, seed, rounds=60):
+    """
+    Send blocks 1.. of blocks from SENDER to RECEIVER over a lossy link.
+
+    Returns:
+        tuple: (blocks received by on_complete or None, receiver, sender, link)
+    """
+    link = LossyLink(loss, seed)
+    completed = []
+    sender = ChainTransfer(lambda payload, addr: link.sender_for(RECEIVER)([encode(payload)], addr),
+                           link.sender_for(RECEIVER), lambda addr: WIRE_VERSION, on_complete=None,
+                           pacing_rate=None)
+    receiver = ChainTransfer(lambda payload, addr: link.sender_for(SENDER)([encode(payload)], addr),
+                             link.sender_for(SENDER), lambda addr: WIRE_VERSION,
+                             on_complete=lambda addr, start, received: completed.append(received), pacing_rate=None)
+    endpoints = {SENDER: sender, RECEIVER: receiver}
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver.request(SENDER, [[0, blocks[0]["hash"]]])
+        clock = time.monotonic()
+        for _ in range(rounds):
+            while link.queue:
+                destination, data = link.queue.pop(0)
+                message = decode(data)
+                source = RECEIVER if destination == SENDER else SENDER
+                if message["type"] == "REQUEST_CHAIN":
+                    endpoints[destination].send(source, 1, len(blocks), blocks[1:], message["window"],
+                                                message["request"])
+                elif message["type"] == "CHAIN_NACK":
+                    endpoints[destination].handle_nack(message, source)
+                elif message["type"] == "CHAIN_ACK":
+                    endpoints[destination].handle_ack(message, source)
+                else:
+                    endpoints[destination].handle_blocks(source, message["transfer"], message["start"],
+                                                         message["total_blocks"],
+                                                         [(b["index"], b) for b in message["blocks"]])
+            if completed or not (receiver.incoming or receiver.requests):
+                break
+            clock += NACK_DELAY
+            receiver.poll(clock)
+    return (completed[0] if completed else None), receiver, sender, link
+
+
+def test_transfer_under_loss():
+    print("=== Test: Chain Transfer with Packet Loss ===")
+    blocks = make_chain(401)
+    for loss in (0.0, 0.05, 0.10):
+        for seed in range(5):
+            received, receiver, sender, link = run_transfer(blocks, loss, seed)
+            assert received is not None, f"Transfer should finish at {loss:.0%} loss (seed {seed})"
+            assert [block.to_dict() for block in received] == blocks[1:], "Blocks should arrive complete and in order"
+            assert not receiver.incoming, "A finished transfer should leave no state behind"
+            if loss:
+                assert link.dropped, "The link should have dropped some datagrams"
+        assert len(sender.outgoing) == 1, "The sender keeps the blocks until the session expires"
+        sender.poll(time.monotonic() + SESSION_TIMEOUT)
+        assert not sender.outgoing, "Expired sessions should be dropped"
+
+
+def test_stalled_transfer():
+    print("=== Test: Stalled Chain Transfer Is Dropped ===")
+    blocks = make_chain(101)
+    link = LossyLink(0.0, 0)
+    failed = []
+    receiver = ChainTransfer(lambda payload, addr: link.sender_for(SENDER)([encode(payload)], addr),
+                             link.sender_for(SENDER), lambda addr: WIRE_VERSION,
+                             on_complete=lambda addr, start, received: None, on_failed=failed.append,
+                             pacing_rate=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        request_id = receiver.request(SENDER, [])
+        receiver.handle_blocks(SENDER, request_id, 1, 101, [(1, blocks[1]), (2, blocks[2])])
+        clock = time.monotonic()
+        for _ in range(MAX_NACKS):
+            clock += NACK_DELAY
+            receiver.poll(clock)
+        assert (SENDER, request_id) in receiver.incoming, "The transfer should be kept while NACK rounds remain"
+        clock += NACK_DELAY
+        receiver.poll(clock)
+    assert not receiver.incoming, f"The transfer should be dropped after {MAX_NACKS} NACK rounds"
+    assert failed == [SENDER], "The responder of a stalled transfer should be reported"
+    nacks = [message for message in (decode(data) for _, data in link.queue) if message["type"] == "CHAIN_NACK"]
+    assert len(nacks) == MAX_NACKS and nacks[0] == {"type": "CHAIN_NACK", "transfer": request_id,
+                                                    "ranges": [[3, 100]]}, "NACKs should list the missing index ranges"
+
+    # Responders that do not number transfers cannot be NACKed, but stalls are still cleaned up
+    with contextlib.redirect_stdout(io.StringIO()):
+        receiver.request(SENDER, [])
+        receiver.handle_blocks(SENDER, None, 1, 101, [(1, blocks[1])])
+        receiver.poll(time.monotonic() + NACK_DELAY * MAX_NACKS)
+    assert not receiver.incoming, "Unnumbered transfers should be dropped once they stall"
+
+
+def test_oversized_transfer():
+    print("=== Test: Oversized Chain Transfer Is Refused ===")
+    blocks = make_chain(3)
+    link = LossyLink(0.0, 0)
+    receiver = ChainTransfer(lambda payload, addr: link.sender_for(SENDER)([encode(payload)], addr),
+                             link.sender_for(SENDER), lambda addr: WIRE_VERSION,
+                             on_complete=lambda addr, start, received: None, pacing_rate=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        request_id = receiver.request(SENDER, [])
+        receiver.handle_blocks(SENDER, request_id, 1, 2**40, [(1, blocks[1])])
+        assert not receiver.incoming, "A transfer advertising an absurd chain length should be refused"
+
+        # The largest accepted transfer still NACKs at once: only received blocks are walked
+        total_blocks = 1 + MAX_TRANSFER_BLOCKS
+        receiver.handle_blocks(SENDER, request_id, 1, total_blocks, [(1, blocks[1]), (2, blocks[2])])
+        started = time.perf_counter()
+        receiver.poll(time.monotonic() + NACK_DELAY)
+        elapsed = time.perf_counter() - started
+    nacks = [message for message in (decode(data) for _, data in link.queue) if message["type"] == "CHAIN_NACK"]
+    assert nacks[-1]["ranges"] == [[3, total_blocks - 1]], "The NACK should list the rest of the suffix"
+    assert elapsed < 0.05, f"Building the NACK took {elapsed * 1000:.1f} ms"
+
+
+def test_sync_sessions():
+    print("=== Test: Sync Sessions per Responder and Request ===")
+    blocks = make_chain(101)
+    others = [("127.0.0.1", 5003), ("127.0.0.1", 5004)]
+    sent = []
+    completed = []
+    receiver = ChainTransfer(lambda payload, addr: sent.append((addr, payload)), None, lambda addr: WIRE_VERSION,
+                             on_complete=lambda addr, start, received: completed.append((addr, len(received))),
+                             pacing_rate=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        ids = {addr: receiver.request(addr, []) for addr in [SENDER] + others}
+        assert receiver.request(SENDER, []) is None, "A responder with a request in progress is not asked again"
+        assert all(payload["request"] == ids[addr] for addr, payload in sent), "Requests should carry their ID"
+
+        receiver.handle_blocks(SENDER, 12345, 1, 101, [(1, blocks[1])])
+        assert not receiver.incoming, "Blocks answering no request of ours should be ignored"
+
+        receiver.handle_blocks(SENDER, ids[SENDER], 1, 51, [(1, blocks[1])])
+        receiver.handle_blocks(others[0], ids[others[0]], 1, 101, [(1, blocks[1])])  # A longer chain
+        receiver.handle_blocks(others[1], ids[others[1]], 1, 101, [(1, blocks[1])])  # Not longer: too late
+        assert list(receiver.incoming) == [(others[0], ids[others[0]])], "Only the longest chain should be synced"
+        cancels = [(addr, payload["transfer"]) for addr, payload in sent if payload["type"] == "CHAIN_CANCEL"]
+        assert cancels == [(SENDER, ids[SENDER]), (others[1], ids[others[1]])], "Losing sessions should be cancelled"
+
+        receiver.handle_blocks(SENDER, ids[SENDER], 1, 51, [(i, blocks[i]) for i in range(2, 51)])
+        assert not completed, "Blocks of a cancelled session should not complete anything"
+        receiver.handle_blocks(others[0], ids[others[0]], 1, 101, [(i, blocks[i]) for i in range(2, 101)])
+        assert completed == [(others[0], 100)], "The chosen session should complete"
+
+    # A responder drops a transfer the requester cancels
+    responder = ChainTransfer(None, lambda datagrams, addr: None, lambda addr: WIRE_VERSION, on_complete=None,
+                              pacing_rate=None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        responder.send(RECEIVER, 1, 101, blocks[1:], None, 99)
+        assert (RECEIVER, 99) in responder.outgoing, "The transfer should use the request ID"
+        responder.handle_cancel({"type": "CHAIN_CANCEL", "transfer": 99}, RECEIVER)
+    assert not responder.outgoing, "A cancelled transfer should be dropped"
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_pacing_and_window():
+    print("=== Test: Paced Sending Within the Receiver Window ===")
+    bucket = TokenBucket(rate=1000, burst=2000)
+    now = bucket.updated_at
+    assert bucket.delay(1500, now) == 0, "A full bucket should allow a burst"
+    assert abs(bucket.delay(1000, now) - 0.5) < 1e-9, "The bucket should say how long to wait for tokens"
+    assert bucket.delay(1000, now + 0.5) == 0, "Tokens should accrue at the rate"
+    assert bucket.delay(5000, now + 10) == 0, "A datagram larger than the burst only needs a full bucket"
+
+    blocks = make_chain(401)
+    sent = []
+    sender = ChainTransfer(None, lambda datagrams, addr: sent.extend(datagrams), lambda addr: WIRE_VERSION,
+                           on_complete=None, pacing_rate=10 * 1024 * 1024)
+    with contextlib.redirect_stdout(io.StringIO()):
+        count = sender.send(RECEIVER, 1, len(blocks), blocks[1:], window=4)
+    assert wait_for(lambda: len(sent) == 4) and not wait_for(lambda: len(sent) > 4, 0.2), \
+        "The sender should stop once a window of datagrams is in flight"
+    ends = [decode(data)["blocks"][-1]["index"] + 1 for data in sent]
+    sender.handle_ack({"type": "CHAIN_ACK", "transfer": decode(sent[0])["transfer"], "received": ends[1],
+                       "window": 4}, RECEIVER)
+    assert wait_for(lambda: len(sent) == 6) and not wait_for(lambda: len(sent) > 6, 0.2), \
+        "A CHAIN_ACK should slide the window forward"
+    sender.handle_ack({"type": "CHAIN_ACK", "transfer": decode(sent[0])["transfer"], "received": len(blocks),
+                       "window": count}, RECEIVER)
+    assert wait_for(lambda: len(sent) == count), "The rest of the transfer should follow"
+    assert [b for data in sent for b in decode(data)["blocks"]] == blocks[1:], "Blocks should go out in order"
+
+
+class LossyTransport:
+    """Wraps a peer's datagram transport and drops outgoing datagrams at random."""
+
+    def __init__(self, transport, loss, seed):
+        self.transport = transport
+        self.loss = loss
+        self.rng = random.Random(seed)
+
+    def sendto(self, data, addr):
+        if self.rng.random() >= self.loss:
+            self.transport.sendto(data, addr)
+
+    def __getattr__(self, name):
+        return getattr(self.transport, name)
+
+
+class DummyClient:
+    def update_ballot(self, ballot):
+        pass
+
+
+def test_peer_sync_under_loss(loss=0.10, base_port=48600):
+    print("=== Test: REQUEST_CHAIN Sync Between Peers with Packet Loss ===")
+    source = Blockchain(difficulty=2)
+    for i in range(150):
+        source.add_new_transaction(Transaction(f"voter{i}", "candidateA"))
+        source.mine_block()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = Peer("127.0.0.1", base_port, "127.0.0.1", base_port + 1, DummyClient(), headers_first=False)
+        client = Peer("127.0.0.1", base_port, "127.0.0.1", base_port + 2, DummyClient(), headers_first=False)
+        server.blockchain_obj.replace_chain(source.chain[:])
+        for index, peer in enumerate((server, client)):
+            peer.transport = LossyTransport(peer.transport, loss, index)
+        client.peers = {f"127.0.0.1:{base_port + 1}"}
+        client.request_chain()
+        deadline = time.time() + 20
+        while len(client.blockchain_obj.chain) < len(source.chain) and time.time() < deadline:
+            time.sleep(0.05)
+    assert len(client.blockchain_obj.chain) == len(source.chain), f"Peer should sync at {loss:.0%} loss"
+    assert client.blockchain_obj.chain.hash_at(-1) == source.chain.hash_at(-1), "Synced chain should match"
+
+
+if __name__ == "__main__":
+    print("===== Running Reliable Transfer Tests =====")
+    test_transfer_under_loss()
+    test_stalled_transfer()
+    test_oversized_transfer()
+    test_sync_sessions()
+    test_pacing_and_window()
+    test_peer_sync_under_loss()
+    print("\nAll tests completed successfully.")
@@ -1,11 +1,14 @@
+import os
 import socket
 import threading
-import json
 import sys
 import time
+from bisect import bisect_left
 
-HEARTBEAT_INTERVAL = 1
-HEARTBEAT_TIMEOUT_COUNT = 3
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from network_layer.wire import encode, decode, SUPPORTED_VERSIONS
+from network_layer.heartbeat import HeartbeatWheel, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT_COUNT, HEARTBEAT_SLOTS
+from network_layer.membership import peer_page, PEER_PAGES_PER_REQUEST
 
 
 class TrackerServer:
@@ -14,7 +17,7 @@ class TrackerServer:
     sends heartbeat messages, and manages ballot distribution.
     """
 
-    def __init__(self, host='0.0.0.0', port=5000, ballot_provider=None):
+    def __init__(self, host='0.0.0.0', port=5000, ballot_provider=None, heartbeat_slots=HEARTBEAT_SLOTS):
         """
         Initialize the tracker server.
 
@@ -22,6 +25,7 @@ class TrackerServer:
             host (str): Host address to bind.
             port (int): UDP port to listen on.
             ballot_provider (function): Function that returns voting options.
+            heartbeat_slots (int): Slots the peers' heartbeats are spread over within HEARTBEAT_INTERVAL.
         """
         self.host = host
         self.port = port
@@ -33,8 +37,13 @@ class TrackerServer:
 
         self.sock_lock = threading.Lock()
         self.peers_lock = threading.Lock()
-        self.peers_heartbeat_tracker_lock = threading.Lock()
-        self.peers_heartbeat_tracker = {}
+        self.heartbeats = HeartbeatWheel(HEARTBEAT_INTERVAL, heartbeat_slots, HEARTBEAT_TIMEOUT_COUNT)
+        self.wire_versions = {}  # {peer_address: binary wire version agreed at REGISTER_PEER}
+        self.epoch = 0  # Membership epoch, bumped on every join and leave (under peers_lock)
+        self.peer_keys = []  # Sorted "ip:port" of the registered peers, the order of snapshot pages
+        # POKE is the same for every peer, so it is encoded once per wire version (and epoch)
+        self.poke_datagrams = {}
+        self.poke_epoch = None
 
     def initialize(self):
         """Start the tracker server threads for listening and heartbeats."""
@@ -52,30 +61,34 @@ class TrackerServer:
         """
         while True:
             try:
-                with self.sock_lock:
-                    data, addr = self.sock.recvfrom(4096)
-                message = json.loads(data.decode())
+                data, addr = self.sock.recvfrom(4096)
+                message = decode(data)
                 message_type = message.get("type")
 
                 if message_type == "REGISTER_PEER":
                     with self.peers_lock:
+                        was_wire_peer = self.is_wire_peer(addr) if addr in self.peers else None
                         self.peers[addr] = threading.get_native_id()
+                        self.negotiate_wire_version(addr, message.get("wire_versions", []))
+                        delta = None
+                        if was_wire_peer != self.is_wire_peer(addr):
+                            delta = self.record_join(addr)
+                    self.heartbeats.add(addr)
                     self.send_register_ack(addr)
                     print(f"[Tracker] Registered peer {addr[0]}:{addr[1]}")
 
-                    self.broadcast_updated_peers_list()
-                    print("[Tracker] Broadcasted updated peers list.")
+                    if delta is not None:
+                        self.broadcast_membership_change(delta, exclude=addr)
 
                 elif message_type == "LEAVE_PEER":
                     with self.peers_lock:
-                        if addr in self.peers:
-                            del self.peers[addr]
-                            current_peers = [
-                                f"{peer[0]}:{peer[1]}" for peer in self.peers.keys()
-                            ]
-                            print(f"[Tracker] Removed {addr}. Peers: {', '.join(current_peers)}")
-                        else:
-                            print(f"[Tracker] Ignored LEAVE_PEER from unknown {addr}")
+                        delta = self.record_leave(addr) if addr in self.peers else None
+                    if delta is not None:
+                        self.heartbeats.remove(addr)
+                        print(f"[Tracker] Removed {addr}. {len(self.peers)} peer(s) left")
+                        self.broadcast_membership_change(delta)
+                    else:
+                        print(f"[Tracker] Ignored LEAVE_PEER from unknown {addr}")
 
                 elif message_type == "REQUEST_BALLOT":
                     if addr not in self.peers:
@@ -85,27 +98,109 @@ class TrackerServer:
                     print(f"[Tracker] Sent ballot options to {addr}")
 
                 elif message_type == "POKE-ACK":
-                    with self.peers_heartbeat_tracker_lock:
-                        if addr in self.peers_heartbeat_tracker:
-                            self.peers_heartbeat_tracker[addr] = 0
-                    print(f"[Tracker] Received POKE-ACK from {addr}")
+                    self.heartbeats.ack(addr)
+
+                elif message_type == "REQUEST_PEERS":
+                    if addr in self.peers:
+                        self.send_peer_pages(addr, message.get("after"))
 
             except socket.timeout:
                 continue
             except Exception as e:
                 print(f"[Tracker] Error: {e}")
 
-    def send_register_ack(self, addr):
+    def negotiate_wire_version(self, addr, offered_versions):
         """
-        Send a REGISTER_ACK message with the peer list to the specified address.
+        Pick the newest binary wire format both the tracker and a registering peer speak.
+        Peers that offer none (or none we know) keep receiving JSON.
 
         Args:
             addr (tuple): (IP, port) of peer.
+            offered_versions (list): Versions listed in the peer's REGISTER_PEER.
+        """
+        common = [v for v in offered_versions if type(v) is int and v in SUPPORTED_VERSIONS] \
+            if isinstance(offered_versions, list) else []
+        if common:
+            self.wire_versions[addr] = max(common)
+        else:
+            self.wire_versions.pop(addr, None)
+
+    def wire_peer_list(self):
+        """Return "ip:port" of the peers that agreed to the tracker's newest wire format."""
+        newest = max(SUPPORTED_VERSIONS)
+        return [f"{ip}:{port}" for (ip, port), version in self.wire_versions.items() if version == newest]
+
+    def is_wire_peer(self, addr):
+        """Return True if the peer agreed to the tracker's newest wire format."""
+        return self.wire_versions.get(addr) == max(SUPPORTED_VERSIONS)
+
+    def record_join(self, addr):
+        """
+        Add a peer (or its new wire format) to the membership and bump the epoch.
+        Called with peers_lock held.
+
+        Returns:
+            dict: The PEER_JOINED delta to broadcast.
+        """
+        key = f"{addr[0]}:{addr[1]}"
+        position = bisect_left(self.peer_keys, key)
+        if position == len(self.peer_keys) or self.peer_keys[position] != key:
+            self.peer_keys.insert(position, key)
+        self.epoch += 1
+        return {"type": "PEER_JOINED", "epoch": self.epoch, "peer": key, "wire": int(self.is_wire_peer(addr))}
+
+    def record_leave(self, addr):
         """
-        peer_list = [f"{ip}:{port}" for (ip, port) in self.peers.keys()]
-        payload = {"type": "REGISTER_ACK", "peer_list": peer_list}
+        Remove a peer from the membership and bump the epoch. Called with peers_lock held.
+
+        Returns:
+            dict: The PEER_LEFT delta to broadcast.
+        """
+        key = f"{addr[0]}:{addr[1]}"
+        del self.peers[addr]
+        self.wire_versions.pop(addr, None)
+        position = bisect_left(self.peer_keys, key)
+        if position < len(self.peer_keys) and self.peer_keys[position] == key:
+            del self.peer_keys[position]
+        self.epoch += 1
+        return {"type": "PEER_LEFT", "epoch": self.epoch, "peer": key}
+
+    def snapshot_page(self, after):
+        """Return the PEERS page of peers that sort after the key after (under peers_lock)."""
+        def is_wire_key(key):
+            host, _, port = key.rpartition(":")
+            return self.is_wire_peer((host, int(port)))
+
+        with self.peers_lock:
+            return peer_page(self.peer_keys, is_wire_key, after, self.epoch)
+
+    def send_message(self, payload, addr):
+        """
+        Send a message to a peer, in the binary format if one was agreed with it, else as JSON.
+
+        Args:
+            payload (dict): The message.
+            addr (tuple): (IP, port) of peer.
+        """
+        data = encode(payload, self.wire_versions.get(addr))
         with self.sock_lock:
-            self.sock.sendto(json.dumps(payload).encode(), addr)
+            self.sock.sendto(data, addr)
+
+    def send_register_ack(self, addr):
+        """
+        Send a REGISTER_ACK message with the first page of the peer list to the specified
+        address, along with the membership epoch and how many peers the other pages hold.
+        It always goes out as JSON and carries the agreed wire_version, if any.
+
+        Args:
+            addr (tuple): (IP, port) of peer.
+        """
+        page = self.snapshot_page("")
+        payload = {"type": "REGISTER_ACK", "peer_list": page["peer_list"], "wire_peers": page["wire_peers"],
+                   "epoch": page["epoch"], "remaining": page["remaining"]}
+        if addr in self.wire_versions:
+            payload["wire_version"] = self.wire_versions[addr]
+        self.send_message(payload, addr)
 
     def send_ballot_options(self, addr):
         """
@@ -116,59 +211,91 @@ class TrackerServer:
         """
         options = self.get_ballot_options() if self.get_ballot_options else []
         payload = {"type": "BALLOT_OPTIONS", "voting_options": options}
-        with self.sock_lock:
-            self.sock.sendto(json.dumps(payload).encode(), addr)
+        self.send_message(payload, addr)
 
-    def broadcast_updated_peers_list(self):
-        """Broadcast the updated peer list to all registered peers."""
-        peer_list = [f"{ip}:{port}" for (ip, port) in self.peers.keys()]
-        payload = {"type": "UPDATE_PEERS", "peer_list": peer_list}
+    def send_peer_pages(self, addr, after):
+        """
+        Answer a REQUEST_PEERS with up to PEER_PAGES_PER_REQUEST consecutive pages of the
+        peer list snapshot, starting after the requested key.
+
+        Args:
+            addr (tuple): (IP, port) of peer.
+            after (str): Key the first page starts after ("" for the start of the list).
+        """
+        if not isinstance(after, str):
+            return
+        for _ in range(PEER_PAGES_PER_REQUEST):
+            page = self.snapshot_page(after)
+            self.send_message(page, addr)
+            if not page["remaining"] or not page["peer_list"]:
+                return
+            after = page["peer_list"][-1]
+
+    def broadcast_membership_change(self, delta, exclude=None):
+        """
+        Send a PEER_JOINED or PEER_LEFT delta to all registered peers, encoded once per wire version.
 
-        for peer_addr in self.peers.keys():
+        Args:
+            delta (dict): The delta.
+            exclude (tuple): (IP, port) of a peer to skip, e.g. the one that just joined.
+        """
+        datagrams = {version: encode(delta, version) for version in (None,) + SUPPORTED_VERSIONS}
+        with self.peers_lock:
+            peer_addrs = [peer_addr for peer_addr in self.peers if peer_addr != exclude]
+        for peer_addr in peer_addrs:
             try:
-                with self.sock_lock:
-                    self.sock.sendto(json.dumps(payload).encode(), peer_addr)
-                print(f"[Tracker] Sent updated peer list to {peer_addr[0]}:{peer_addr[1]}")
+                self.sock.sendto(datagrams[self.wire_versions.get(peer_addr)], peer_addr)
             except Exception as e:
-                print(f"[Tracker] Failed to send peer list to {peer_addr}: {e}")
+                print(f"[Tracker] Failed to send {delta['type']} to {peer_addr}: {e}")
+        print(f"[Tracker] Sent {delta['type']} {delta['peer']} (epoch {delta['epoch']}) to {len(peer_addrs)} peer(s)")
 
     def send_heartbeats(self):
         """
-        Periodically send heartbeat (POKE) messages to peers.
+        Periodically send heartbeat (POKE) messages to peers, one heartbeat slot every
+        HEARTBEAT_INTERVAL / heartbeat_slots seconds, so each peer is poked once per interval.
         Remove peers not responding within HEARTBEAT_TIMEOUT_COUNT intervals.
         """
+        next_tick = time.monotonic()
         while True:
-            time.sleep(HEARTBEAT_INTERVAL)
-            payload = {"type": "POKE"}
-
-            with self.peers_heartbeat_tracker_lock, self.peers_lock:
-                for peer_addr in self.peers.keys():
-                    try:
-                        with self.sock_lock:
-                            self.sock.sendto(json.dumps(payload).encode(), peer_addr)
-                        print(f"[Tracker] Sent POKE to {peer_addr[0]}:{peer_addr[1]}")
-
-                        if peer_addr not in self.peers_heartbeat_tracker:
-                            self.peers_heartbeat_tracker[peer_addr] = 1
-                        else:
-                            self.peers_heartbeat_tracker[peer_addr] += 1
-                    except Exception as e:
-                        print(f"[Tracker] Failed to send POKE to {peer_addr}: {e}")
-
-            timed_out_peers = []
-            with self.peers_heartbeat_tracker_lock:
-                for peer, count in self.peers_heartbeat_tracker.items():
-                    if count >= HEARTBEAT_TIMEOUT_COUNT:
-                        timed_out_peers.append(peer)
-
-            for peer in timed_out_peers:
-                with self.peers_lock:
-                    del self.peers[peer]
-                self.peers_heartbeat_tracker.pop(peer, None)
-                print(f"[Tracker] Removed {peer[0]}:{peer[1]} (heartbeat timeout)")
-
+            next_tick += self.heartbeats.tick_interval
+            time.sleep(max(0.0, next_tick - time.monotonic()))
+            timed_out_peers = self.heartbeat_tick()
             if timed_out_peers:
-                self.broadcast_updated_peers_list()
+                self.remove_timed_out_peers(timed_out_peers)
+
+    def heartbeat_tick(self):
+        """
+        POKE the peers in the next heartbeat slot. Sends go straight to the socket,
+        without holding peers_lock, so registrations and POKE-ACKs are never held up.
+
+        Returns:
+            list: Peers of the slot that timed out.
+        """
+        to_poke, timed_out_peers = self.heartbeats.tick()
+        if self.poke_epoch != self.epoch:
+            # POKE carries the membership epoch, so peers that missed a delta notice it
+            self.poke_epoch = self.epoch
+            self.poke_datagrams = {version: encode({"type": "POKE", "epoch": self.poke_epoch}, version)
+                                   for version in (None,) + SUPPORTED_VERSIONS}
+        for peer_addr in to_poke:
+            try:
+                self.sock.sendto(self.poke_datagrams[self.wire_versions.get(peer_addr)], peer_addr)
+            except Exception as e:
+                print(f"[Tracker] Failed to send POKE to {peer_addr}: {e}")
+        return timed_out_peers
+
+    def remove_timed_out_peers(self, timed_out_peers):
+        """
+        Remove peers whose heartbeats went unanswered and tell the others.
+
+        Args:
+            timed_out_peers (list): (IP, port) of the peers.
+        """
+        with self.peers_lock:
+            deltas = [self.record_leave(peer) for peer in timed_out_peers if peer in self.peers]
+        for delta in deltas:  # Peers that already left were not removed again
+            print(f"[Tracker] Removed {delta['peer']} (heartbeat timeout)")
+            self.broadcast_membership_change(delta)
 
 
 if __name__ == "__main__":
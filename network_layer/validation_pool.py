@@ -0,0 +1,82 @@
+import threading
+from collections import deque
+
+VALIDATION_QUEUE_SIZE = 256  # Tasks a lane holds before new ones are turned away
+CHAIN_LANE = "chain"  # Block and chain validation and chain writes, in arrival order
+SERVE_LANE = "serve"  # Answers to other peers' sync requests, which only read the chain
+
+
+class ValidationPool:
+    """
+    Bounded worker pool for the CPU-heavy side of message handling, kept off the event
+    loop so that heartbeats and peer list updates are always handled promptly.
+
+    Each lane has one worker thread and runs its tasks in order, so tasks that write
+    shared state (the chain, the headers-first sync) share a lane, while read-only work
+    (serving sync requests) runs beside them on another. A lane holds at most
+    max_pending tasks; once it is full, submit() refuses new ones and the caller drops
+    the message, as the kernel would once the socket buffer filled (the sync protocols
+    already recover from lost datagrams). Tasks submitted with required=True are never
+    refused.
+
+    Usage:
+        pool = ValidationPool()
+        if not pool.submit(CHAIN_LANE, handle_new_block, block_dict, addr):
+            print("busy, dropped")
+    """
+
+    def __init__(self, lanes=(CHAIN_LANE, SERVE_LANE), max_pending=VALIDATION_QUEUE_SIZE, name="validate"):
+        """
+        Args:
+            lanes (tuple): Names of the lanes; each gets one worker thread.
+            max_pending (int): Most tasks waiting in one lane.
+            name (str): Prefix for the worker thread names.
+        """
+        self.max_pending = max_pending
+        self.condition = threading.Condition()
+        self.queues = {lane: deque() for lane in lanes}
+        self.dropped = {lane: 0 for lane in lanes}  # Tasks refused because the lane was full
+        for lane in lanes:
+            threading.Thread(target=self.worker, args=(lane,), name=f"{name}-{lane}", daemon=True).start()
+
+    def full(self, lane):
+        """Return True if lane would refuse a task now."""
+        return len(self.queues[lane]) >= self.max_pending
+
+    def submit(self, lane, function, *args, required=False):
+        """
+        Queue function(*args) to run on lane's worker.
+
+        Args:
+            lane (str): The lane to run on.
+            function (callable): The task.
+            required (bool): Queue it even if the lane is full.
+
+        Returns:
+            bool: True if queued, False if the lane was full and the task was dropped.
+        """
+        with self.condition:
+            queue = self.queues[lane]
+            if not required and len(queue) >= self.max_pending:
+                self.dropped[lane] += 1
+                return False
+            queue.append((function, args))
+            self.condition.notify_all()
+            return True
+
+    def pending(self, lane):
+        """Return the number of tasks waiting in lane."""
+        return len(self.queues[lane])
+
+    def worker(self, lane):
+        """Runs lane's tasks one at a time, printing any error a task raises."""
+        queue = self.queues[lane]
+        while True:
+            with self.condition:
+                while not queue:
+                    self.condition.wait()
+                function, args = queue.popleft()
+            try:
+                function(*args)
+            except Exception as e:
+                print(f"[Peer] Error: {e}")
@@ -0,0 +1,86 @@
+import sys
+import os
+import io
+import time
+import socket
+import threading
+import contextlib
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.block import Block
+from blockchain_layer.transaction import Transaction
+from network_layer.wire import decode, encode
+from network_layer.validation_pool import ValidationPool, CHAIN_LANE, SERVE_LANE
+from network_layer.peer import Peer
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_pool_backpressure():
+    print("=== Test: Validation Pool Lanes and Backpressure ===")
+    pool = ValidationPool(max_pending=3, name="test")
+    release = threading.Event()
+    ran = []
+    assert pool.submit(CHAIN_LANE, release.wait), "An idle lane should accept a task"
+    assert wait_for(lambda: pool.pending(CHAIN_LANE) == 0), "The worker should pick the task up"
+    for i in range(3):
+        assert pool.submit(CHAIN_LANE, ran.append, i), "A lane should accept tasks up to max_pending"
+    assert pool.full(CHAIN_LANE), "The lane should report full at max_pending"
+    assert not pool.submit(CHAIN_LANE, ran.append, 3), "A full lane should refuse tasks"
+    assert pool.dropped[CHAIN_LANE] == 1, "Refused tasks should be counted"
+    assert pool.submit(CHAIN_LANE, ran.append, 4, required=True), "A full lane should still take required tasks"
+    assert pool.submit(SERVE_LANE, ran.append, "served"), "A busy lane should not hold up the others"
+    assert wait_for(lambda: ran == ["served"]), "The serve lane should run while the chain lane is busy"
+    release.set()
+    assert wait_for(lambda: ran == ["served", 0, 1, 2, 4]), "A lane should run its tasks in order"
+
+
+class DummyClient:
+    def update_ballot(self, ballot):
+        pass
+
+
+def test_heartbeat_under_flood(base_port=48700, flood=1000):
+    print("=== Test: Heartbeats Answered While Chain Validation Is Backed Up ===")
+    tracker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    tracker.bind(("127.0.0.1", base_port))
+    tracker.settimeout(2.0)
+    flooder = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    with contextlib.redirect_stdout(io.StringIO()):
+        peer = Peer("127.0.0.1", base_port, "127.0.0.1", base_port + 1, DummyClient())
+        release = threading.Event()
+        peer.offload(CHAIN_LANE, release.wait)  # A long chain check holds the chain lane
+        block = Block(1, [Transaction("voter", "candidateA")], timestamp="2024-05-01 12:00:00",
+                      previous_hash="ab" * 32, nonce=1)
+        data = encode({"type": "NEW_BLOCK", "block": block.to_dict()})
+        pool = peer.validation_pool
+        for sent in range(50, flood + 1, 50):  # In bursts the socket buffer can hold
+            for _ in range(50):
+                flooder.sendto(data, ("127.0.0.1", base_port + 1))
+            wait_for(lambda: pool.pending(CHAIN_LANE) + pool.dropped[CHAIN_LANE] >= sent, 0.5)
+        start = time.perf_counter()
+        tracker.sendto(encode({"type": "POKE"}), ("127.0.0.1", base_port + 1))
+        reply, _ = tracker.recvfrom(65535)
+        elapsed = time.perf_counter() - start
+        dropped = pool.dropped[CHAIN_LANE]
+        pending = pool.pending(CHAIN_LANE)
+        release.set()
+        wait_for(lambda: pool.pending(CHAIN_LANE) == 0, 10.0)
+    tracker.close()
+    flooder.close()
+    assert decode(reply)["type"] == "POKE-ACK", "The peer should answer the tracker's heartbeat"
+    assert elapsed < 1.0, f"The heartbeat should not wait behind chain validation ({elapsed:.2f} s)"
+    assert dropped > 0, "Blocks beyond the chain lane's bound should be dropped"
+    assert pending <= pool.max_pending, "The chain lane should stay bounded"
+
+
+if __name__ == "__main__":
+    print("===== Running Validation Pool Tests =====")
+    test_pool_backpressure()
+    test_heartbeat_under_flood()
+    print("\nAll tests completed successfully.")
@@ -0,0 +1,463 @@
+import json
+import socket
+import struct
+
+WIRE_VERSION = 1  # Newest binary format this node speaks
+SUPPORTED_VERSIONS = (1,)  # Binary formats this node can decode
+
+# A binary message starts with MAGIC; a JSON message starts with '{', so the two never collide
+MAGIC = 0xB7
+_HASH_RAW = 0  # 32 raw bytes follow (the value was a 64-char lowercase hex string)
+_HASH_STR = 1  # A length-prefixed string follows
+_ADDR_IPV4 = 0  # 4-byte IPv4 address and 2-byte port follow
+_ADDR_STR = 1  # A length-prefixed "host:port" string follows
+_PORT = struct.Struct('>H')
+_MAX_VARINT_BYTES = 10  # Up to 2**64 - 1
+
+# Default payload budget for batched messages (see pack): fits the 1280-byte minimum IPv6 MTU
+# after IP and UDP headers, so batches are not fragmented on any path
+DATAGRAM_BUDGET = 1200
+
+
+class WireError(ValueError):
+    """Raised when a received datagram is not a well-formed message."""
+
+
+class _Unencodable(Exception):
+    """The payload does not fit the binary schema of its type; it is sent as JSON instead."""
+
+
+# Field kinds. Every message type below is a fixed sequence of (key, kind) pairs, and a
+# payload is only sent in binary when its keys and value types match the schema exactly,
+# so decoding always gives back the dict that was encoded.
+_TRANSACTION = (('voter_id', 'str'), ('candidate_id', 'str'), ('timestamp', 'str'))
+_BLOCK = (('index', 'uint'), ('transactions', ('list', _TRANSACTION)), ('timestamp', 'str'),
+          ('previous_hash', 'hash'), ('nonce', 'uint'), ('merkle_root', 'hash'), ('hash', 'hash'))
+_HEADER = (('index', 'uint'), ('timestamp', 'str'), ('previous_hash', 'hash'), ('nonce', 'uint'),
+           ('merkle_root', 'hash'), ('hash', 'hash'))
+_LOCATOR = ('list', ('pair', 'uint', 'hash'))
+_BODY = (('index', 'uint'), ('hash', 'hash'), ('transactions', ('list', _TRANSACTION)))
+
+# Message type code -> (type name, fields). Codes are part of the wire format: never reuse one.
+# A type may have several layouts (e.g. with and without a field added later); the encoder
+# uses the first one the payload fits.
+_MESSAGES = {
+    1: ("NEW_BLOCK", (('block', _BLOCK),)),
+    2: ("CHAIN_BLOCK", (('index', 'uint'), ('start', 'uint'), ('block', _BLOCK), ('total_blocks', 'uint'))),
+    3: ("UPDATE_PEERS", (('peer_list', ('list', 'addr')), ('wire_peers', ('list', 'addr')))),
+    4: ("REQUEST_CHAIN", (('locator', _LOCATOR),)),
+    5: ("REQUEST_HEADERS", (('locator', _LOCATOR),)),
+    6: ("HEADERS", (('start', 'uint'), ('total_blocks', 'uint'), ('offset', 'uint'),
+                    ('headers', ('list', _HEADER)))),
+    7: ("REQUEST_BODIES", (('first', 'uint'), ('hashes', ('list', 'hash')))),
+    8: ("BLOCK_BODY", _BODY),
+    9: ("POKE", ()),
+    10: ("POKE-ACK", ()),
+    11: ("CHAIN_BLOCKS", (('start', 'uint'), ('total_blocks', 'uint'), ('blocks', ('list', _BLOCK)))),
+    12: ("BLOCK_BODIES", (('bodies', ('list', _BODY)),)),
+    13: ("CHAIN_BLOCKS", (('transfer', 'uint'), ('start', 'uint'), ('total_blocks', 'uint'),
+                          ('blocks', ('list', _BLOCK)))),
+    14: ("CHAIN_NACK", (('transfer', 'uint'), ('ranges', ('list', ('pair', 'uint', 'uint'))))),
+    15: ("CHAIN_ACK", (('transfer', 'uint'), ('received', 'uint'), ('window', 'uint'))),
+    16: ("REQUEST_CHAIN", (('window', 'uint'), ('locator', _LOCATOR))),
+    17: ("REQUEST_CHAIN", (('request', 'uint'), ('window', 'uint'), ('locator', _LOCATOR))),
+    18: ("CHAIN_CANCEL", (('transfer', 'uint'),)),
+    19: ("INV", (('index', 'uint'), ('hash', 'hash'))),
+    20: ("GETDATA", (('index', 'uint'), ('hash', 'hash'))),
+    21: ("POKE", (('epoch', 'uint'),)),
+    22: ("PEER_JOINED", (('epoch', 'uint'), ('peer', 'addr'), ('wire', 'uint'))),
+    23: ("PEER_LEFT", (('epoch', 'uint'), ('peer', 'addr'))),
+    24: ("REQUEST_PEERS", (('after', 'addr'),)),
+    25: ("PEERS", (('epoch', 'uint'), ('after', 'addr'), ('remaining', 'uint'), ('wire_peers', ('list', 'addr')),
+                   ('peer_list', ('list', 'addr')))),
+}
+
+
+def encode(payload, version=WIRE_VERSION):
+    """
+    Encode a message for the wire.
+
+    Args:
+        payload (dict): The message, with a "type" key.
+        version (int): Binary format agreed with the receiver, or None to send JSON.
+
+    Returns:
+        bytes: The binary encoding if the message type has a schema and the payload fits
+        it, else the JSON encoding.
+    """
+    message_type = payload.get("type")
+    if version in SUPPORTED_VERSIONS and type(message_type) is str:
+        for code, fields in _CODES.get(message_type, ()):
+            if len(payload) != len(fields) + 1:
+                continue
+            out = bytearray((MAGIC, version, code))
+            try:
+                _encode_fields(out, payload, fields)
+                return bytes(out)
+            except (_Unencodable, UnicodeEncodeError):
+                pass
+    return json.dumps(payload).encode()
+
+
+def decode(data):
+    """
+    Decode a datagram in either the binary or the JSON format.
+
+    Args:
+        data (bytes): The received datagram.
+
+    Returns:
+        dict: The message.
+
+    Raises:
+        WireError: If the datagram is malformed or uses an unknown version or message type.
+    """
+    if data[:1] != bytes((MAGIC,)):
+        try:
+            message = json.loads(data.decode())
+        except (UnicodeDecodeError, ValueError, RecursionError) as e:
+            raise WireError(f"invalid JSON message: {e}")
+        if not isinstance(message, dict):
+            raise WireError("JSON message is not an object")
+        return message
+
+    if len(data) < 3:
+        raise WireError("truncated header")
+    if data[1] not in SUPPORTED_VERSIONS:
+        raise WireError(f"unsupported wire version {data[1]}")
+    entry = _COMPILED.get(data[2])
+    if entry is None:
+        raise WireError(f"unknown message type {data[2]}")
+    name, fields = entry
+    message = {"type": name}
+    pos = 3
+    try:
+        for key, _, decode_field in fields:
+            message[key], pos = decode_field(data, pos)
+    except IndexError:
+        raise WireError("truncated message")
+    except UnicodeDecodeError:
+        raise WireError("invalid UTF-8 string")
+    if pos != len(data):
+        raise WireError("trailing bytes after message")
+    return message
+
+
+def peek_type(data):
+    """
+    Return the type of a binary message from its header, without decoding the rest.
+
+    Args:
+        data (bytes): The received datagram.
+
+    Returns:
+        str: The message type, or None for JSON messages and unknown versions or types.
+    """
+    if len(data) >= 3 and data[0] == MAGIC and data[1] in SUPPORTED_VERSIONS:
+        entry = _COMPILED.get(data[2])
+        if entry is not None:
+            return entry[0]
+    return None
+
+
+def pack(payload, key, items, budget=DATAGRAM_BUDGET, version=WIRE_VERSION, counts=None):
+    """
+    Encode a batched message as few datagrams as possible: each datagram carries the
+    fields of payload plus as many consecutive items as fit within budget bytes under
+    payload[key] (an item too large on its own is sent alone). Each item is encoded once.
+
+    Args:
+        payload (dict): The message without its item list; key must be the last field of
+            its binary schema.
+        key (str): Name of the list field to fill with items.
+        items (list): The items to send, in order.
+        budget (int): Largest datagram to build, in bytes.
+        version (int): Binary format agreed with the receiver, or None to send JSON.
+        counts (list): If given, the number of items in each datagram is appended to it.
+
+    Returns:
+        list: The datagrams (bytes), each decoding to payload with a slice of items under key.
+    """
+    if counts is None:
+        counts = []
+    if not items:
+        return []
+    batches = _pack_binary(payload, key, items, budget, version, counts) if version in SUPPORTED_VERSIONS else None
+    if batches is not None:
+        return batches
+
+    # JSON: the encoded payload with an empty list, opened up to receive the encoded items
+    prefix = json.dumps(dict(payload, **{key: []})).encode()
+    if not prefix.endswith(b"[]}"):
+        counts.extend([1] * len(items))
+        return [json.dumps(dict(payload, **{key: items[i:i + 1]})).encode() for i in range(len(items))]
+    return _fill(prefix[:-2], [json.dumps(item).encode() for item in items], b", ", b"]}", budget, counts)
+
+
+def _pack_binary(payload, key, items, budget, version, counts):
+    # The payload must hold every field of the layout but the item list, which comes last
+    layouts = [(code, fields) for code, fields in _CODES.get(payload.get("type"), ())
+               if len(payload) == len(fields) and fields[-1][0] == key
+               and all(field[0] in payload for field in fields[:-1])]
+    if not layouts:
+        return None
+    code, fields = layouts[0]
+    encode_list = fields[-1][1]
+    head = bytearray((MAGIC, version, code))
+    encoded = []
+    try:
+        _encode_fields(head, payload, fields[:-1])
+        for item in items:
+            out = bytearray()
+            encode_list(out, [item])
+            encoded.append(bytes(out[1:]))  # Drop the count of 1
+    except (_Unencodable, UnicodeEncodeError):
+        return None
+
+    batches = []
+    start = 0
+    while start < len(encoded):
+        size = len(head) + len(encoded[start])  # Without the item count
+        end = start + 1
+        while end < len(encoded) and size + len(encoded[end]) + _varint_size(end + 1 - start) <= budget:
+            size += len(encoded[end])
+            end += 1
+        count = bytearray()
+        _put_varint(count, end - start)
+        batches.append(bytes(head) + bytes(count) + b"".join(encoded[start:end]))
+        counts.append(end - start)
+        start = end
+    return batches
+
+
+def _fill(prefix, encoded, separator, suffix, budget, counts):
+    """Join encoded items into prefix + items + suffix datagrams of at most budget bytes."""
+    batches = []
+    start = 0
+    while start < len(encoded):
+        size = len(prefix) + len(encoded[start]) + len(suffix)
+        end = start + 1
+        while end < len(encoded) and size + len(separator) + len(encoded[end]) <= budget:
+            size += len(separator) + len(encoded[end])
+            end += 1
+        batches.append(prefix + separator.join(encoded[start:end]) + suffix)
+        counts.append(end - start)
+        start = end
+    return batches
+
+
+def _varint_size(value):
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+# --- Field codecs ---
+# Each field kind is compiled once into an encoder, encode(out, value), which appends to a
+# bytearray or raises _Unencodable, and a decoder, decode(data, pos) -> (value, new_pos).
+# Decoders may raise IndexError or UnicodeDecodeError on bad input; decode() turns every
+# such error into a WireError.
+
+def _put_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    value = b & 0x7F
+    for shift in range(7, 7 * _MAX_VARINT_BYTES, 7):
+        pos += 1
+        b = data[pos]
+        value |= (b & 0x7F) << shift
+        if b < 0x80:
+            if value >= 1 << 64:
+                raise WireError("varint out of range")
+            return value, pos + 1
+    raise WireError("varint too long")
+
+
+def _encode_uint(out, value):
+    if type(value) is not int or not 0 <= value < 1 << 64:
+        raise _Unencodable
+    _put_varint(out, value)
+
+
+def _encode_str(out, value):
+    if type(value) is not str:
+        raise _Unencodable
+    raw = value.encode('utf-8', 'surrogatepass')
+    _put_varint(out, len(raw))
+    out += raw
+
+
+def _decode_str(data, pos):
+    size, pos = _read_varint(data, pos)
+    end = pos + size
+    if end > len(data):
+        raise WireError("truncated string")
+    return data[pos:end].decode('utf-8', 'surrogatepass'), end
+
+
+def _encode_hash(out, value):
+    if type(value) is str and len(value) == 64:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and raw.hex() == value:
+            out.append(_HASH_RAW)
+            out += raw
+            return
+    out.append(_HASH_STR)
+    _encode_str(out, value)
+
+
+def _decode_hash(data, pos):
+    tag = data[pos]
+    if tag == _HASH_RAW:
+        end = pos + 33
+        if end > len(data):
+            raise WireError("truncated hash")
+        return data[pos + 1:end].hex(), end
+    if tag == _HASH_STR:
+        return _decode_str(data, pos + 1)
+    raise WireError(f"bad hash tag {tag}")
+
+
+def _pack_addr(value):
+    """Return the 6-byte form of "a.b.c.d:port", or None if it would not come back unchanged."""
+    host, _, port = value.rpartition(':')
+    try:
+        raw = socket.inet_aton(host)
+    except (OSError, ValueError):
+        return None
+    if (socket.inet_ntoa(raw) == host and port.isascii() and port.isdigit()
+            and str(int(port)) == port and int(port) <= 0xFFFF):
+        return raw + _PORT.pack(int(port))
+    return None
+
+
+# Peer lists repeat the same few addresses in every UPDATE_PEERS, so packing is memoized
+_packed_addrs = {}  # "ip:port" -> 6 bytes or None
+_unpacked_addrs = {}  # 6 bytes -> "ip:port"
+_ADDR_CACHE_SIZE = 4096
+
+
+def _encode_addr(out, value):
+    if type(value) is not str:
+        raise _Unencodable
+    packed = _packed_addrs.get(value, False)
+    if packed is False:
+        if len(_packed_addrs) >= _ADDR_CACHE_SIZE:
+            _packed_addrs.clear()
+        packed = _packed_addrs[value] = _pack_addr(value)
+    if packed is None:
+        out.append(_ADDR_STR)
+        _encode_str(out, value)
+    else:
+        out.append(_ADDR_IPV4)
+        out += packed
+
+
+def _decode_addr(data, pos):
+    tag = data[pos]
+    if tag == _ADDR_IPV4:
+        end = pos + 7
+        if end > len(data):
+            raise WireError("truncated address")
+        raw = data[pos + 1:end]
+        addr = _unpacked_addrs.get(raw)
+        if addr is None:
+            if len(_unpacked_addrs) >= _ADDR_CACHE_SIZE:
+                _unpacked_addrs.clear()
+            addr = _unpacked_addrs[raw] = f"{socket.inet_ntoa(raw[:4])}:{_PORT.unpack(raw[4:])[0]}"
+        return addr, end
+    if tag == _ADDR_STR:
+        return _decode_str(data, pos + 1)
+    raise WireError(f"bad address tag {tag}")
+
+
+_SCALARS = {
+    'uint': (_encode_uint, _read_varint),
+    'str': (_encode_str, _decode_str),
+    'hash': (_encode_hash, _decode_hash),
+    'addr': (_encode_addr, _decode_addr),
+}
+
+
+def _compile(kind):
+    """Return (encoder, decoder) for a field kind."""
+    if isinstance(kind, str):
+        return _SCALARS[kind]
+    if kind[0] == 'list':
+        encode_item, decode_item = _compile(kind[1])
+
+        def encode_list(out, value):
+            if type(value) is not list:
+                raise _Unencodable
+            _put_varint(out, len(value))
+            for item in value:
+                encode_item(out, item)
+
+        def decode_list(data, pos):
+            count, pos = _read_varint(data, pos)
+            if count > len(data) - pos:
+                raise WireError("list longer than the message")  # Every item takes at least one byte
+            items = []
+            for _ in range(count):
+                item, pos = decode_item(data, pos)
+                items.append(item)
+            return items, pos
+
+        return encode_list, decode_list
+    if kind[0] == 'pair':
+        (encode_first, decode_first), (encode_second, decode_second) = _compile(kind[1]), _compile(kind[2])
+
+        def encode_pair(out, value):
+            if type(value) is not list or len(value) != 2:
+                raise _Unencodable
+            encode_first(out, value[0])
+            encode_second(out, value[1])
+
+        def decode_pair(data, pos):
+            first, pos = decode_first(data, pos)
+            second, pos = decode_second(data, pos)
+            return [first, second], pos
+
+        return encode_pair, decode_pair
+
+    # A record: a dict with exactly these keys (extra keys would be lost, so they make it unencodable)
+    fields = [(key,) + _compile(field_kind) for key, field_kind in kind]
+
+    def encode_record(out, value):
+        if type(value) is not dict or len(value) != len(fields):
+            raise _Unencodable
+        _encode_fields(out, value, fields)
+
+    def decode_record(data, pos):
+        record = {}
+        for key, _, decode_field in fields:
+            record[key], pos = decode_field(data, pos)
+        return record, pos
+
+    return encode_record, decode_record
+
+
+def _encode_fields(out, values, fields):
+    for key, encode_field, _ in fields:
+        try:
+            value = values[key]
+        except KeyError:
+            raise _Unencodable
+        encode_field(out, value)
+
+
+# Message type code -> (type name, compiled fields)
+_COMPILED = {code: (name, [(key,) + _compile(kind) for key, kind in fields])
+             for code, (name, fields) in _MESSAGES.items()}
+_CODES = {}  # Type name -> [(code, compiled fields)] for each layout
+for _code, (_name, _fields) in _COMPILED.items():
+    _CODES.setdefault(_name, []).append((_code, _fields))
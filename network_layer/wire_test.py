@@ -0,0 +1,182 @@
+import sys
+import os
+import json
+import random
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blockchain_layer.block import Block
+from blockchain_layer.transaction import Transaction
+from network_layer.wire import encode, decode, pack, WireError, MAGIC, WIRE_VERSION, DATAGRAM_BUDGET
+from network_layer.tracker_server import TrackerServer
+
+
+def make_block(index=1, votes=3):
+    block = Block(index, [Transaction(f"voter{index}-{i}", "candidateA") for i in range(votes)],
+                  timestamp="2024-05-01 12:00:00", previous_hash="ab" * 32, nonce=12345)
+    block.hash = block.compute_hash()
+    return block
+
+
+def sample_messages():
+    """One message of every type with a binary schema, shaped as the peer and tracker send them."""
+    block = make_block()
+    return [
+        {"type": "NEW_BLOCK", "block": block.to_dict()},
+        {"type": "CHAIN_BLOCK", "index": 7, "start": 3, "block": block.to_dict(), "total_blocks": 300},
+        {"type": "UPDATE_PEERS", "peer_list": ["127.0.0.1:5001", "10.0.0.2:65535", "peer-host:6000"],
+         "wire_peers": ["127.0.0.1:5001"]},
+        {"type": "REQUEST_CHAIN", "locator": [[9, block.hash], [0, "0" * 64]]},
+        {"type": "REQUEST_HEADERS", "locator": [[9, block.hash]]},
+        {"type": "HEADERS", "start": 1, "total_blocks": 3, "offset": 0,
+         "headers": [make_block(1).header_dict(), make_block(2).header_dict()]},
+        {"type": "REQUEST_BODIES", "first": 16, "hashes": [block.hash] * 4},
+        {"type": "BLOCK_BODY", "index": 1, "hash": block.hash, "transactions": block.transaction_dicts()},
+        {"type": "POKE"},
+        {"type": "POKE-ACK"},
+        {"type": "CHAIN_BLOCKS", "start": 1, "total_blocks": 3, "blocks": [make_block(1).to_dict(), make_block(2).to_dict()]},
+        {"type": "BLOCK_BODIES", "bodies": [{"index": 1, "hash": block.hash, "transactions": block.transaction_dicts()}]},
+        {"type": "CHAIN_BLOCKS", "transfer": 2**32 - 1, "start": 1, "total_blocks": 3, "blocks": [make_block(1).to_dict()]},
+        {"type": "CHAIN_NACK", "transfer": 17, "ranges": [[2, 2], [5, 140]]},
+        {"type": "CHAIN_ACK", "transfer": 17, "received": 120, "window": 64},
+        {"type": "REQUEST_CHAIN", "window": 64, "locator": [[9, block.hash]]},
+        {"type": "REQUEST_CHAIN", "request": 2**32 - 1, "window": 64, "locator": [[9, block.hash]]},
+        {"type": "CHAIN_CANCEL", "transfer": 17},
+        {"type": "INV", "index": 12, "hash": block.hash},
+        {"type": "GETDATA", "index": 12, "hash": block.hash},
+        {"type": "POKE", "epoch": 42},
+        {"type": "PEER_JOINED", "epoch": 43, "peer": "127.0.0.1:5001", "wire": 1},
+        {"type": "PEER_LEFT", "epoch": 44, "peer": "peer-host:6000"},
+        {"type": "REQUEST_PEERS", "after": ""},
+        {"type": "REQUEST_PEERS", "after": "127.0.0.1:5001"},
+        {"type": "PEERS", "epoch": 44, "after": "", "remaining": 0, "wire_peers": ["127.0.0.1:5001"],
+         "peer_list": ["127.0.0.1:5001", "10.0.0.2:65535"]},
+    ]
+
+
+def test_round_trip():
+    print("=== Test: Binary Wire Format Round Trip ===")
+    for message in sample_messages():
+        data = encode(message)
+        assert data[0] == MAGIC, f"{message['type']} should be sent in binary"
+        assert decode(data) == message, f"{message['type']} should decode to the message that was encoded"
+        assert len(data) < len(json.dumps(message).encode()), f"{message['type']} should be smaller than JSON"
+
+    # The genesis block's previous_hash "0" and odd strings survive as strings
+    genesis = Block(0, [], timestamp="2000-01-01 00:00:00", previous_hash="0")
+    genesis.hash = genesis.compute_hash()
+    message = {"type": "NEW_BLOCK", "block": genesis.to_dict()}
+    assert decode(encode(message)) == message, "Non-hex hashes should round-trip as strings"
+    message = {"type": "REQUEST_BODIES", "first": 2**64 - 1, "hashes": ["AB" * 32, "é\ud800"]}
+    assert decode(encode(message)) == message, "Upper-case hex and unicode should round-trip unchanged"
+
+
+def test_json_fallback():
+    print("=== Test: JSON Fallback ===")
+    block = make_block().to_dict()
+    fallbacks = [
+        {"type": "REGISTER_PEER", "wire_versions": [1]},  # No binary schema
+        {"type": "NEW_BLOCK", "block": block, "extra": True},  # Extra key
+        {"type": "NEW_BLOCK", "block": dict(block, index=-1)},  # Does not fit a varint
+        {"type": "NEW_BLOCK", "block": dict(block, transactions=[{"voter_id": 5, "candidate_id": "A",
+                                                                  "timestamp": "t"}])},  # Non-string ID
+        {"type": "UPDATE_PEERS", "peer_list": ["127.0.0.1:5001"]},  # Missing field
+        {"type": "CHAIN_BLOCK", "index": True, "start": 0, "block": block, "total_blocks": 1},  # bool is not uint
+        {"type": ["NEW_BLOCK"]},
+    ]
+    for message in fallbacks:
+        data = encode(message)
+        assert data[:1] == b"{", f"{message['type']} should fall back to JSON"
+        assert decode(data) == message, "JSON fallback should decode unchanged"
+    for message in sample_messages():
+        assert encode(message, version=None) == json.dumps(message).encode(), "No agreed version means JSON"
+
+
+def test_wire_negotiation():
+    print("=== Test: Wire Version Negotiation ===")
+    tracker = TrackerServer(host="127.0.0.1", port=0)
+    try:
+        tracker.negotiate_wire_version(("127.0.0.1", 5001), [WIRE_VERSION])
+        tracker.negotiate_wire_version(("127.0.0.1", 5002), [])  # A JSON-only peer
+        tracker.negotiate_wire_version(("127.0.0.1", 5003), [WIRE_VERSION + 1])  # Only a newer, unknown format
+        tracker.negotiate_wire_version(("127.0.0.1", 5004), "garbage")
+        assert tracker.wire_versions == {("127.0.0.1", 5001): WIRE_VERSION}, "Only peer 5001 shares a version"
+        assert tracker.wire_peer_list() == ["127.0.0.1:5001"], "UPDATE_PEERS should list binary peers only"
+        tracker.negotiate_wire_version(("127.0.0.1", 5001), [])
+        assert not tracker.wire_versions, "Re-registering without versions should fall back to JSON"
+    finally:
+        tracker.sock.close()
+
+
+def test_pack_blocks():
+    print("=== Test: Packing Consecutive Blocks into Datagrams ===")
+    blocks = [make_block(i, votes=1 if i % 4 else 5).to_dict() for i in range(1, 201)]
+    payload = {"type": "CHAIN_BLOCKS", "start": 1, "total_blocks": 201}
+    for version in (WIRE_VERSION, None):
+        datagrams = pack(payload, "blocks", blocks, version=version)
+        assert all(len(data) <= DATAGRAM_BUDGET for data in datagrams), "Datagrams should fit the budget"
+        assert len(datagrams) < len(blocks), "Several blocks should share a datagram"
+        received = []
+        for data in datagrams:
+            message = decode(data)
+            assert (data[0] == MAGIC) == (version is not None), "Format should follow the agreed version"
+            assert {k: v for k, v in message.items() if k != "blocks"} == payload, "Each datagram carries the payload"
+            received.extend(message["blocks"])
+        assert received == blocks, "Unpacked blocks should be the packed ones, in order"
+
+        # Tight budgets still make progress: a block larger than the budget goes alone
+        datagrams = pack(payload, "blocks", blocks[:5], budget=10, version=version)
+        assert [decode(data)["blocks"] for data in datagrams] == [[block] for block in blocks[:5]], \
+            "Oversized blocks should be sent one per datagram"
+
+    # Items that do not fit the binary schema fall back to JSON packing
+    odd = [dict(blocks[0], extra=1), blocks[1]]
+    datagrams = pack(payload, "blocks", odd)
+    assert all(data[:1] == b"{" for data in datagrams), "Unencodable items should be packed as JSON"
+    assert [b for data in datagrams for b in decode(data)["blocks"]] == odd, "JSON packing should round-trip"
+    assert pack(payload, "blocks", []) == [], "Nothing to send means no datagrams"
+
+
+def test_decoder_fuzz(iterations=20000):
+    print("=== Test: Decoder Fuzzing ===")
+    rng = random.Random(4119)
+    valid = [encode(message) for message in sample_messages()]
+    for i in range(iterations):
+        data = bytearray(rng.choice(valid))
+        mutation = i % 5
+        if mutation == 0:  # Flip random bits
+            for _ in range(rng.randint(1, 4)):
+                data[rng.randrange(len(data))] ^= 1 << rng.randrange(8)
+        elif mutation == 1:  # Truncate
+            del data[rng.randrange(len(data)):]
+        elif mutation == 2:  # Insert random bytes
+            position = rng.randrange(len(data) + 1)
+            data[position:position] = rng.randbytes(rng.randint(1, 8))
+        elif mutation == 3:  # Huge varints and lengths
+            position = rng.randint(3, len(data))
+            data[position:position + 1] = b"\xff" * rng.randint(1, 12) + b"\x7f"
+        else:  # Pure noise behind a valid header
+            data = bytearray((MAGIC, WIRE_VERSION, rng.randint(0, 25))) + rng.randbytes(rng.randint(0, 64))
+        try:
+            message = decode(bytes(data))
+        except WireError:
+            continue
+        assert isinstance(message, dict) and isinstance(message.get("type"), str), "Decoded message should be a dict"
+        # Anything that decodes must survive another encode/decode round trip
+        assert decode(encode(message)) == message, "Decoded message should round-trip"
+
+    for data in (b"", b"\xb7", b"\xb7\x09", b"\xb7\x63\x01", b"\xff\xfe", b"[1, 2]", b"[" * 100000, b"\x00"):
+        try:
+            decode(data)
+        except WireError:
+            continue
+        raise AssertionError(f"{data[:10]!r} should be rejected")
+
+
+if __name__ == "__main__":
+    print("===== Running Wire Format Tests =====")
+    test_round_trip()
+    test_json_fallback()
+    test_wire_negotiation()
+    test_pack_blocks()
+    test_decoder_fuzz()
+    print("\nAll tests completed successfully.")